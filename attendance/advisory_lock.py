@@ -0,0 +1,35 @@
+"""
+Postgres advisory lock
+
+같은 작업(수집 등)이 여러 프로세스, 여러 서버에서 동시에 실행되지 않도록 이름 별로 session lock 을 잡습니다.
+lock 은 연결(session) 에 걸리므로 작업이 끝날 때 까지 같은 연결을 들고 있어야 하고,
+프로세스가 죽어서 연결이 끊기면 Postgres 가 알아서 풀어줍니다.
+"""
+import hashlib
+from contextlib import contextmanager
+
+
+def get_lock_key(name):
+    """lock 이름 -> pg_advisory_lock 의 bigint key. 다른 앱과 겹치지 않도록 garden6: 을 붙임"""
+    digest = hashlib.sha1(("garden6:%s" % name).encode()).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+@contextmanager
+def try_advisory_lock(conn, name):
+    """
+    conn 으로 lock 을 시도. 기다리지 않고 잡았는지(True/False) 를 줌
+    with try_advisory_lock(conn, "collect") as acquired:
+    """
+    key = get_lock_key(name)
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (key,))
+        acquired = cursor.fetchone()[0]
+    conn.commit()
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (key,))
+            conn.commit()
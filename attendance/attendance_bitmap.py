@@ -0,0 +1,97 @@
+"""
+출석 bitmap
+
+유저마다 GARDENING_DAYS 비트짜리 정수(i 번째 비트 = 시작일로 부터 i 일째 출석)를 두고,
+날짜마다 유저 비트맵(유저 slot 번째 비트 = 출석)도 같이 둬서
+"지난주 매일 출석한 사람", "어제 오늘 둘 다 빠진 사람", "날짜별 출석 인원" 같은 질의를 AND/OR/popcount 로 처리합니다.
+"""
+
+ALL = "all"
+ANY = "any"
+NONE = "none"
+
+
+def popcount(bits):
+    return bits.bit_count()
+
+
+def to_offsets(bits):
+    """비트가 켜진 위치들"""
+    offsets = []
+    while bits:
+        low = bits & -bits
+        offsets.append(low.bit_length() - 1)
+        bits ^= low
+    return offsets
+
+
+class AttendanceBitmaps:
+    def __init__(self, days):
+        self.days = days
+        self.slots = {}
+        self.user_bits = {}
+        self.day_bits = [0] * days
+
+    def get_slot(self, user):
+        if user not in self.slots:
+            self.slots[user] = len(self.slots)
+            self.user_bits[user] = 0
+        return self.slots[user]
+
+    def set(self, user, day_offset):
+        if not 0 <= day_offset < self.days:
+            return
+        slot = self.get_slot(user)
+        self.user_bits[user] |= 1 << day_offset
+        self.day_bits[day_offset] |= 1 << slot
+
+    def window_mask(self, start, end):
+        """start ~ end(포함) 일째 비트"""
+        start = max(0, start)
+        end = min(self.days - 1, end)
+        if end < start:
+            return 0
+        return ((1 << (end - start + 1)) - 1) << start
+
+    def users_mask(self, users):
+        mask = 0
+        for user in users:
+            if user in self.slots:
+                mask |= 1 << self.slots[user]
+        return mask
+
+    def find_users(self, users, start, end, mode):
+        """
+        기간 동안 mode 조건을 만족하는 유저들
+        all: 매일 출석, any: 하루라도 출석, none: 하루도 출석 안함
+        기간이 시즌 밖이거나 start > end 면 출석한 날이 없으므로 all 은 아무도 없음
+        """
+        window = self.window_mask(start, end)
+        if mode == ALL and window == 0:
+            return []
+        result = []
+        for user in users:
+            attended = self.user_bits.get(user, 0) & window
+            if mode == ALL and attended == window \
+                    or mode == ANY and attended \
+                    or mode == NONE and not attended:
+                result.append(user)
+        return result
+
+    def combine(self, users, op, start, end):
+        """유저들의 출석일 AND(모두 출석한 날) / OR(한명이라도 출석한 날)"""
+        window = self.window_mask(start, end)
+        if op == "and":
+            bits = window
+            for user in users:
+                bits &= self.user_bits.get(user, 0)
+            return bits
+        bits = 0
+        for user in users:
+            bits |= self.user_bits.get(user, 0)
+        return bits & window
+
+    def daily_counts(self, users, start, end):
+        """날짜별 출석 인원. start ~ end(포함)"""
+        mask = self.users_mask(users)
+        return [popcount(self.day_bits[day] & mask) for day in range(max(0, start), min(self.days - 1, end) + 1)]
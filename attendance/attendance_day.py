@@ -0,0 +1,73 @@
+"""
+출석일 계산
+
+커밋 시각은 config.ini 의 TIME_ZONE 기준으로 날짜를 정합니다.
+새벽 2시 전 커밋은 전날 출석이 아직 없으면 전날 출석으로 인정합니다.
+"""
+from datetime import datetime, timedelta
+
+DAY_CUTOFF_HOUR = 2
+
+
+def to_local_datetime(ts, time_zone):
+    """slack ts -> TIME_ZONE 기준 naive datetime. ts_for_db 로 저장"""
+    return datetime.fromtimestamp(float(ts), time_zone).replace(tzinfo=None)
+
+
+def to_ts_for_db_range(from_day, to_day):
+    """
+    attendance_day 가 from_day ~ to_day 인 메시지들의 ts_for_db 범위 [start, end)
+    새벽 2시 규칙 때문에 to_day 다음날 2시 까지. 파티션 pruning 용 조건으로 씀
+    """
+    start = datetime(from_day.year, from_day.month, from_day.day)
+    end = datetime(to_day.year, to_day.month, to_day.day) + timedelta(days=1, hours=DAY_CUTOFF_HOUR)
+    return start, end
+
+
+def get_author_name(message):
+    attachments = message.get("attachments") or []
+    if not attachments:
+        return None
+    return attachments[0].get("author_name")
+
+
+def get_commits(message):
+    """커밋 메시지들. pull request 등 text 가 없는 attachment 는 제외"""
+    attachments = message.get("attachments") or []
+    return [attachment["text"] for attachment in attachments if "text" in attachment]
+
+
+def get_grace_day(ts, time_zone, start_date):
+    """새벽 2시 전 커밋이면 인정 받을 수 있는 전날. 아니면 None"""
+    local_datetime = to_local_datetime(ts, time_zone)
+    date_before_day1 = local_datetime.date() - timedelta(days=1)
+    if local_datetime.hour < DAY_CUTOFF_HOUR and date_before_day1 >= start_date:
+        return date_before_day1
+    return None
+
+
+def assign_attendance_days(messages, time_zone, start_date, attended=None):
+    """
+    메시지들의 attendance_day 를 계산해서 넣어줌
+    @param messages ts 순서로 처리함
+    @param attended 이미 출석한 (author_name, date) set. 계산하면서 추가됨
+    커밋이 없는 메시지는 attendance_day 가 None
+    """
+    if attended is None:
+        attended = set()
+
+    for message in sorted(messages, key=lambda m: float(m["ts"])):
+        author_name = get_author_name(message)
+        if author_name is None or not get_commits(message):
+            message["attendance_day"] = None
+            continue
+
+        attendance_day = to_local_datetime(message["ts"], time_zone).date()
+        grace_day = get_grace_day(message["ts"], time_zone, start_date)
+        if grace_day is not None and (author_name, grace_day) not in attended:
+            attendance_day = grace_day
+
+        message["attendance_day"] = attendance_day
+        attended.add((author_name, attendance_day))
+
+    return messages
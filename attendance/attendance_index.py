@@ -0,0 +1,186 @@
+"""
+프로세스 메모리에 들고 있는 출석 인덱스
+
+유저마다 출석일(START_DATE 로 부터 며칠째인지)과 그날 첫 커밋 시각(START_DATE 0시 로부터 몇초인지)을
+정렬된 array 두개로 들고 있습니다. 한번 DB 에서 읽어 오고 이후에는 NOTIFY 로 받은 변경분만 반영합니다.
+기간/여러 유저에 걸친 질의를 위해 같은 내용을 AttendanceBitmaps 로도 들고 있습니다.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+from attendance.attendance_bitmap import AttendanceBitmaps, to_offsets
+from attendance.attendance_day import to_ts_for_db_range
+
+
+class UserAttendance:
+    __slots__ = ("days", "first_seconds")
+
+    def __init__(self):
+        self.days = array("H")
+        self.first_seconds = array("l")
+
+    def add(self, day_offset, seconds):
+        """출석 추가. 이미 있는 날이면 더 이른 시각만 반영. 새 출석이면 True"""
+        i = bisect_left(self.days, day_offset)
+        if i < len(self.days) and self.days[i] == day_offset:
+            if seconds < self.first_seconds[i]:
+                self.first_seconds[i] = seconds
+            return False
+
+        self.days.insert(i, day_offset)
+        self.first_seconds.insert(i, seconds)
+        return True
+
+    def get(self, day_offset):
+        i = bisect_left(self.days, day_offset)
+        if i < len(self.days) and self.days[i] == day_offset:
+            return self.first_seconds[i]
+        return None
+
+
+class AttendanceIndex:
+    def __init__(self, start_date, days, ttl=600):
+        self.start_date = start_date
+        self.days = days
+        self.start_datetime = datetime(start_date.year, start_date.month, start_date.day)
+        # NOTIFY 를 놓쳤을 때를 대비해서 ttl 초 마다 DB 에서 다시 읽음
+        self.ttl = ttl
+
+        self.users = {}
+        self.bitmaps = AttendanceBitmaps(days)
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def to_day_offset(self, attendance_day):
+        return (attendance_day - self.start_date).days
+
+    def to_seconds(self, ts_for_db):
+        return int((ts_for_db - self.start_datetime).total_seconds())
+
+    def to_date(self, day_offset):
+        return self.start_date + timedelta(days=day_offset)
+
+    def to_datetime(self, seconds):
+        return self.start_datetime + timedelta(seconds=seconds)
+
+    def is_expired(self):
+        return self.loaded_at is None or time.time() - self.loaded_at >= self.ttl
+
+    def load(self, db_tools):
+        """DB 에서 유저별 날짜별 첫 커밋 시각을 읽어서 인덱스를 새로 만듦"""
+        rows = db_tools.execute_query(
+            """
+            SELECT author_name, attendance_day, MIN(ts_for_db) AS first_ts
+            FROM slack_messages
+            WHERE attendance_day >= %s AND ts_for_db >= %s AND ts_for_db < %s
+            GROUP BY author_name, attendance_day
+            ORDER BY author_name, attendance_day
+            """,
+            (self.start_date,) + to_ts_for_db_range(self.start_date, self.to_date(self.days - 1))
+        )
+
+        users = {}
+        bitmaps = AttendanceBitmaps(self.days)
+        for row in rows:
+            if row["author_name"] not in users:
+                users[row["author_name"]] = UserAttendance()
+            # 정렬된 순서로 오므로 뒤에 붙이기만 하면 됨
+            user_attendance = users[row["author_name"]]
+            user_attendance.days.append(self.to_day_offset(row["attendance_day"]))
+            user_attendance.first_seconds.append(self.to_seconds(row["first_ts"]))
+            bitmaps.set(row["author_name"], self.to_day_offset(row["attendance_day"]))
+
+        with self.lock:
+            self.users = users
+            self.bitmaps = bitmaps
+            self.loaded_at = time.time()
+
+    def add(self, user, attendance_day, ts_for_db):
+        """출석 하나 반영. 새 출석이면 True. load 와 같이 시즌 밖의 날은 무시"""
+        day_offset = self.to_day_offset(attendance_day)
+        if day_offset < 0 or day_offset >= self.days:
+            return False
+
+        with self.lock:
+            if user not in self.users:
+                self.users[user] = UserAttendance()
+            self.bitmaps.set(user, day_offset)
+            return self.users[user].add(day_offset, self.to_seconds(ts_for_db))
+
+    def apply_deltas(self, deltas):
+        """live_updates 의 [{user, date, ts}] 변경분 반영"""
+        for delta in deltas:
+            self.add(delta["user"],
+                     datetime.strptime(delta["date"], "%Y-%m-%d").date(),
+                     datetime.fromisoformat(delta["ts"]))
+
+    def get_first_commits(self, user):
+        """{date: 첫 커밋 시각}"""
+        with self.lock:
+            user_attendance = self.users.get(user)
+            if user_attendance is None:
+                return {}
+            pairs = list(zip(user_attendance.days, user_attendance.first_seconds))
+        return {self.to_date(day_offset): self.to_datetime(seconds) for (day_offset, seconds) in pairs}
+
+    def get_first_commit(self, user, attendance_day):
+        with self.lock:
+            user_attendance = self.users.get(user)
+            seconds = user_attendance.get(self.to_day_offset(attendance_day)) if user_attendance else None
+        return self.to_datetime(seconds) if seconds is not None else None
+
+    def count(self, user, until_day=None):
+        """출석 일수. until_day 가 있으면 그날 까지"""
+        with self.lock:
+            user_attendance = self.users.get(user)
+            if user_attendance is None:
+                return 0
+            if until_day is None:
+                return len(user_attendance.days)
+            return bisect_left(user_attendance.days, self.to_day_offset(until_day) + 1)
+
+    def daily_counts(self, users, days):
+        """날짜별 출석 인원. [day0 인원, day1 인원, ...]"""
+        with self.lock:
+            return self.bitmaps.daily_counts(users, 0, days - 1)
+
+    def find_users(self, users, from_day, to_day, mode):
+        """from_day ~ to_day(포함) 동안 mode(all/any/none) 조건을 만족하는 유저들"""
+        with self.lock:
+            return self.bitmaps.find_users(users, self.to_day_offset(from_day), self.to_day_offset(to_day), mode)
+
+    def combine_days(self, users, op, from_day, to_day):
+        """유저들이 모두(and)/한명이라도(or) 출석한 날짜들"""
+        with self.lock:
+            bits = self.bitmaps.combine(users, op, self.to_day_offset(from_day), self.to_day_offset(to_day))
+        return [self.to_date(day_offset) for day_offset in to_offsets(bits)]
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_attendance_index():
+    """
+    프로세스 단위로 공유하는 AttendanceIndex
+    처음 호출할 때(또는 ttl 이 지나면) DB 에서 읽고, 이후 변경분은 NOTIFY 로 받아서 반영
+    """
+    global _index
+    if _index is None or _index.is_expired():
+        with _index_lock:
+            if _index is None:
+                from attendance.config_tools import ConfigTools
+                from attendance.live_updates import broadcaster
+
+                config_tools = ConfigTools()
+                ttl = int(config_tools.get_config()['DEFAULT'].get('ATTENDANCE_INDEX_TTL', 600))
+                index = AttendanceIndex(config_tools.get_start_date(), int(config_tools.get_gardening_days()), ttl)
+                broadcaster.add_callback(index.apply_deltas)
+                _index = index
+
+            if _index.is_expired():
+                from attendance.db_tools import DBTools
+                _index.load(DBTools())
+    return _index
@@ -0,0 +1,97 @@
+"""
+mongodump BSON 파일 읽기
+
+pymongo 없이 표준 라이브러리만으로 mongodump 결과(.bson)를 읽습니다. (benchmarks/replay_ingest.py)
+slack 메시지에 쓰이는 타입(문자열, 숫자, 문서, 배열, ObjectId, bool, 날짜, null)만 지원합니다.
+"""
+import struct
+from datetime import datetime, timezone
+
+INT32 = struct.Struct("<i")
+INT64 = struct.Struct("<q")
+UINT64 = struct.Struct("<Q")
+DOUBLE = struct.Struct("<d")
+
+
+class BSONError(ValueError):
+    pass
+
+
+def read_cstring(data, offset):
+    end = data.index(b"\x00", offset)
+    return data[offset:end].decode("utf-8"), end + 1
+
+
+def read_string(data, offset):
+    (length,) = INT32.unpack_from(data, offset)
+    start = offset + 4
+    return data[start:start + length - 1].decode("utf-8"), start + length
+
+
+def read_element(data, offset, element_type):
+    """(값, 다음 offset)"""
+    if element_type == 0x01:  # double
+        return DOUBLE.unpack_from(data, offset)[0], offset + 8
+    if element_type in (0x02, 0x0D, 0x0E):  # string, javascript, symbol
+        return read_string(data, offset)
+    if element_type == 0x03:  # document
+        return read_document(data, offset)
+    if element_type == 0x04:  # array
+        (document, end) = read_document(data, offset)
+        return list(document.values()), end
+    if element_type == 0x05:  # binary
+        (length,) = INT32.unpack_from(data, offset)
+        start = offset + 5
+        return bytes(data[start:start + length]), start + length
+    if element_type == 0x07:  # ObjectId
+        return data[offset:offset + 12].hex(), offset + 12
+    if element_type == 0x08:  # bool
+        return data[offset] == 1, offset + 1
+    if element_type == 0x09:  # UTC datetime (ms)
+        millis = INT64.unpack_from(data, offset)[0]
+        return datetime.fromtimestamp(millis / 1000, timezone.utc), offset + 8
+    if element_type in (0x0A, 0x06, 0xFF, 0x7F):  # null, undefined, min/max key
+        return None, offset
+    if element_type == 0x0B:  # regex
+        (pattern, offset) = read_cstring(data, offset)
+        (_, offset) = read_cstring(data, offset)
+        return pattern, offset
+    if element_type == 0x10:  # int32
+        return INT32.unpack_from(data, offset)[0], offset + 4
+    if element_type == 0x11:  # timestamp
+        return UINT64.unpack_from(data, offset)[0], offset + 8
+    if element_type == 0x12:  # int64
+        return INT64.unpack_from(data, offset)[0], offset + 8
+    raise BSONError("unsupported BSON type 0x%02x at %d" % (element_type, offset))
+
+
+def read_document(data, offset=0):
+    """(dict, 다음 offset)"""
+    (length,) = INT32.unpack_from(data, offset)
+    end = offset + length
+    if data[end - 1] != 0:
+        raise BSONError("document at %d is not terminated" % offset)
+
+    document = {}
+    position = offset + 4
+    while position < end - 1:
+        element_type = data[position]
+        (name, position) = read_cstring(data, position + 1)
+        (document[name], position) = read_element(data, position, element_type)
+    return document, end
+
+
+def decode(data):
+    """bytes 하나 -> dict"""
+    return read_document(bytes(data))[0]
+
+
+def iter_bson_file(path):
+    """mongodump .bson 파일의 문서들. 문서가 이어 붙어 있는 형식"""
+    with open(path, "rb") as file:
+        data = file.read()
+
+    offset = 0
+    while offset < len(data):
+        (document, offset) = read_document(data, offset)
+        yield document
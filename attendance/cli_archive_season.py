@@ -0,0 +1,64 @@
+"""
+끝난 시즌을 보관 파일로 옮기고 Postgres 에서 지움
+
+e.g.)
+python attendance/cli_archive_season.py --start 2021-01-18 --days 100
+python attendance/cli_archive_season.py --start 2021-01-18 --days 100 --keep-in-db  # 파일만 만듦
+python attendance/cli_archive_season.py --start 2021-01-18 --days 100 --rewrite  # 압축하지 않고 만든 보관 파일을 zstd 압축해서 다시 씀
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from attendance.attendance_day import to_ts_for_db_range
+from attendance.config_tools import ConfigTools
+from attendance.db_tools import DBTools
+from attendance.partition_tools import PartitionTools, get_partition_name
+from attendance.season_archive import SeasonArchive
+
+
+def main():
+    parser = argparse.ArgumentParser(description="끝난 시즌 보관")
+    parser.add_argument("--start", required=True, help="시즌 시작일(YYYY-MM-DD)")
+    parser.add_argument("--days", type=int, required=True, help="시즌 일수")
+    parser.add_argument("--keep-in-db", action="store_true", help="보관 파일만 만들고 DB 에서 지우지 않음")
+    parser.add_argument("--rewrite", action="store_true", help="이미 보관한 파일을 zstd 압축해서 다시 씀. DB 는 보지 않음")
+    args = parser.parse_args()
+
+    start_date = datetime.strptime(args.start, "%Y-%m-%d").date()
+    if args.rewrite:
+        SeasonArchive().rewrite_season(start_date)
+        print("rewrote %s" % start_date)
+        return
+    if start_date == ConfigTools().get_start_date():
+        parser.error("현재 시즌은 보관할 수 없습니다")
+
+    db_tools = DBTools()
+    season_archive = SeasonArchive()
+
+    info = season_archive.export_season(db_tools, start_date, args.days)
+    print("archived %(messages)d messages, %(attendances)d attendances" % info)
+
+    # 파일에 쓴 메시지 수가 DB 와 같을 때만 지움
+    (start, end) = to_ts_for_db_range(start_date, start_date + timedelta(days=args.days - 1))
+    count = db_tools.execute_query("SELECT COUNT(*) AS count FROM slack_messages WHERE ts_for_db >= %s AND ts_for_db < %s",
+                                   (start, end), fetch_one=True)["count"]
+    if count != info["messages"]:
+        print(f"message count mismatch (db {count}, archive {info['messages']}). not removed from db")
+        return
+
+    if args.keep_in_db:
+        return
+
+    partition_tools = PartitionTools(db_tools)
+    if partition_tools.exists(get_partition_name(start_date)):
+        # 저장소별 집계는 작아서 DB 에 남김
+        partition_tools.drop_season_partition(start_date, args.days, drop_rollups=False)
+    else:
+        # 시즌 파티션을 만들기 전 데이터는 DEFAULT 파티션에 있어서 row 단위로 지움
+        db_tools.execute_query("DELETE FROM slack_messages WHERE ts_for_db >= %s AND ts_for_db < %s",
+                               (start, end), fetch_all=False)
+    print(f"removed {count} messages from db")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""
+기존 slack_messages 의 ts_for_db, attendance_day 를 config.ini TIME_ZONE 기준으로 다시 계산
+attendance/sql/002_attendance_day.sql 적용 후 한번 실행합니다. 여러번 실행해도 결과는 같습니다.
+"""
+from attendance.garden import Garden
+from attendance.attendance_day import assign_attendance_days, to_local_datetime
+
+garden = Garden()
+db_tools = garden.db_tools
+
+messages = db_tools.execute_query("SELECT ts, attachments FROM slack_messages ORDER BY ts")
+messages = [dict(message) for message in messages]
+
+# 전체 메시지를 ts 순서로 처음부터 계산해야 새벽 2시 규칙이 find_attendance_by_user 와 같아짐
+assign_attendance_days(messages, garden.time_zone, garden.start_date)
+
+rows = [
+    (message["ts"], to_local_datetime(message["ts"], garden.time_zone), message["attendance_day"])
+    for message in messages
+]
+
+db_tools.execute_values(
+    """
+    UPDATE slack_messages AS m
+    SET ts_for_db = v.ts_for_db, attendance_day = v.attendance_day
+    FROM (VALUES %s) AS v (ts, ts_for_db, attendance_day)
+    WHERE m.ts = v.ts
+    """,
+    rows,
+    template="(%s, %s::timestamp, %s::date)",
+    page_size=1000
+)
+
+print("updated %d messages (%d with attendance_day)"
+      % (len(rows), sum(1 for message in messages if message["attendance_day"] is not None)))
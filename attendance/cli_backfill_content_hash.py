@@ -0,0 +1,42 @@
+"""
+기존 slack_messages 의 content_hash 채우기
+attendance/sql/008_content_hash.sql 적용 후 한번 실행합니다. 여러번 실행해도 결과는 같습니다.
+"""
+from attendance.db_tools import DBTools, message_content_hash
+
+BATCH_SIZE = 1000
+
+db_tools = DBTools()
+
+
+def update(rows):
+    db_tools.execute_values(
+        """
+        UPDATE slack_messages AS m
+        SET content_hash = v.content_hash
+        FROM (VALUES %s) AS v (ts, ts_for_db, content_hash)
+        WHERE m.ts = v.ts AND m.ts_for_db = v.ts_for_db
+        """,
+        rows,
+        template="(%s, %s::timestamp, %s)",
+        page_size=BATCH_SIZE
+    )
+
+
+# server-side cursor 로 조금씩 읽고 BATCH_SIZE 씩 고침
+messages = db_tools.iter_query(
+    'SELECT ts, ts_for_db, type, bot_id, "user", team, text, attachments FROM slack_messages WHERE content_hash IS NULL'
+)
+rows = []
+updated = 0
+for message in messages:
+    rows.append((message["ts"], message["ts_for_db"], message_content_hash(message)))
+    if len(rows) >= BATCH_SIZE:
+        update(rows)
+        updated += len(rows)
+        rows = []
+if rows:
+    update(rows)
+    updated += len(rows)
+
+print("updated %d messages" % updated)
@@ -0,0 +1,33 @@
+"""
+repo_daily_commits 를 slack_messages 로 다시 계산. 기본은 config.ini 의 현재 시즌
+attendance/sql/004_repo_rollups.sql 적용 후 한번 실행합니다. 집계가 어긋났을 때 다시 실행해도 됩니다.
+예약 작업(rollup, docs/06.cron.md) 과 같은 lock 을 써서 동시에 실행되지 않습니다.
+보관한 시즌(cli_archive_season.py)은 메시지가 DB 에 없어서 집계가 지워지므로 그 기간은 넘기지 않습니다.
+
+e.g.)
+python attendance/cli_backfill_repo_rollups.py
+python attendance/cli_backfill_repo_rollups.py --start 2021-01-18 --days 100
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from attendance.config_tools import ConfigTools
+from attendance.db_tools import DBTools
+from attendance.repo_rollup import rebuild_repo_rollups
+
+config_tools = ConfigTools()
+parser = argparse.ArgumentParser(description="저장소별 커밋 집계 다시 계산")
+parser.add_argument("--start", default=config_tools.get_start_date_str(), help="시즌 시작일(YYYY-MM-DD)")
+parser.add_argument("--days", type=int, default=int(config_tools.get_gardening_days()), help="시즌 일수")
+args = parser.parse_args()
+
+start_date = datetime.strptime(args.start, "%Y-%m-%d").date()
+end_date = start_date + timedelta(days=args.days - 1)
+db_tools = DBTools()
+
+with db_tools.advisory_lock("rollup") as acquired:
+    if acquired:
+        (rows, commits) = rebuild_repo_rollups(db_tools, start_date, end_date)
+        print("rebuilt %d rollup rows (%d commits) for %s ~ %s" % (rows, commits, start_date, end_date))
+    else:
+        print("rollup is already running")
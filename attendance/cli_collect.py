@@ -1,13 +1,25 @@
-from attendance.garden import Garden
-from datetime import date, datetime, timedelta
+"""
+어제부터 오늘까지 slack 메시지 수집 (docs/06.cron.md)
 
-garden = Garden()
+--no-drain: 큐에 넣기만 하고 저장은 웹 프로세스나 cli_ingest_writer.py 의 writer 에 맡김.
+            attendance.garden 을 import 하지 않아서 빨리 끝남
+다른 곳(cron, /attendance/collect/, 예약 작업)에서 수집 중이면 아무것도 하지 않고 끝남
+"""
+import sys
 
-today = datetime.today()
-yesterday = today - timedelta(days=1)
-tomorrow = today + timedelta(days=1)
+from attendance import collector
 
-oldest = yesterday.timestamp()
-latest = tomorrow.timestamp()
+snapshot = collector.get_snapshot()
 
-garden.collect_slack_messages(oldest, latest)
\ No newline at end of file
+with collector.collect_lock(snapshot) as acquired:
+    if not acquired:
+        print("collect is already running")
+    else:
+        collector.collect_recent(snapshot=snapshot)
+
+        if "--no-drain" not in sys.argv[1:]:
+            # 큐에 넣은 메시지 저장. 실패해도 큐에 남아서 다음 실행이나 웹 프로세스의 writer 가 저장함
+            try:
+                collector.drain()
+            except Exception as err:
+                print(err)
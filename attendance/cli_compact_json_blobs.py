@@ -0,0 +1,91 @@
+"""
+기존 slack_messages 의 bot_profile 을 json_blobs 로 옮기고 bot_profile 컬럼을 비움
+attendance/sql/005_json_blobs.sql 적용 후 한번 실행합니다. 여러번 실행해도 됩니다.
+
+e.g.)
+python attendance/cli_compact_json_blobs.py
+python attendance/cli_compact_json_blobs.py --vacuum-full  # 테이블을 다시 써서 디스크 공간을 바로 돌려받음 (실행 중 테이블 잠금)
+"""
+import argparse
+import json
+
+from attendance.db_tools import DBTools
+
+
+def get_sizes(db_tools):
+    return db_tools.execute_query(
+        """
+        SELECT pg_total_relation_size('slack_messages') AS table_bytes,
+               COALESCE(SUM(pg_column_size(bot_profile)), 0) AS bot_profile_bytes
+        FROM slack_messages
+        """,
+        fetch_one=True
+    )
+
+
+def compact(db_tools, batch_size):
+    """bot_profile 값 종류별로 batch_size 개씩 hash 로 바꿈. 바꾼 row 수 반환"""
+    profiles = db_tools.execute_query(
+        "SELECT DISTINCT bot_profile FROM slack_messages WHERE bot_profile IS NOT NULL"
+    )
+
+    updated = 0
+    for row in profiles:
+        bot_profile = row["bot_profile"]
+        (blob_hash,) = db_tools.intern_json_blobs([bot_profile])
+        # 한번에 바꾸면 긴 트랜잭션 동안 수집이 막히므로 나눠서
+        while True:
+            count = db_tools.execute_query(
+                """
+                UPDATE slack_messages SET bot_profile_hash = %s, bot_profile = NULL
+                WHERE ts IN (
+                    SELECT ts FROM slack_messages WHERE bot_profile = %s::jsonb LIMIT %s
+                )
+                """,
+                (blob_hash, json.dumps(bot_profile), batch_size),
+                fetch_all=False
+            )
+            updated += count
+            if count < batch_size:
+                break
+    return updated, len(profiles)
+
+
+def vacuum(db_tools, full):
+    conn = db_tools.connect_db()
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f"SET search_path TO {db_tools.pg_schema}")
+            cursor.execute("VACUUM (FULL, ANALYZE) slack_messages" if full else "VACUUM ANALYZE slack_messages")
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bot_profile 을 json_blobs 로 옮김")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--vacuum-full", action="store_true", help="VACUUM FULL 로 디스크 공간을 바로 돌려받음")
+    args = parser.parse_args()
+
+    db_tools = DBTools()
+
+    before = get_sizes(db_tools)
+    (updated, distinct) = compact(db_tools, args.batch_size)
+    vacuum(db_tools, args.vacuum_full)
+    after = get_sizes(db_tools)
+
+    blob_bytes = db_tools.execute_query("SELECT COALESCE(SUM(pg_column_size(body)), 0) AS bytes FROM json_blobs",
+                                        fetch_one=True)["bytes"]
+
+    print(f"compacted {updated} rows ({distinct} distinct bot_profile)")
+    print(f"bot_profile column: {before['bot_profile_bytes']} -> {after['bot_profile_bytes']} bytes"
+          f" (json_blobs {blob_bytes} bytes)")
+    print(f"slack_messages total: {before['table_bytes']} -> {after['table_bytes']} bytes"
+          f" (reclaimed {before['table_bytes'] - after['table_bytes']} bytes)")
+    if not args.vacuum_full:
+        print("VACUUM 으로 비운 공간은 이후 저장에 재사용됩니다. 디스크를 바로 돌려받으려면 --vacuum-full")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""
+출석부 내보내기
+
+e.g.)
+python attendance/cli_export.py attendance --output attendance.csv
+python attendance/cli_export.py commits --format parquet --output commits.parquet --from 2021-01-18 --to 2021-04-27
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from attendance.garden import Garden
+from attendance.export_tools import ExportTools, EXPORTS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="출석부 CSV/Parquet 내보내기")
+    parser.add_argument("name", choices=sorted(EXPORTS), help="attendance: 유저별 날짜별 출석, commits: 커밋 메시지 원본")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--output", required=True, help="저장할 파일")
+    parser.add_argument("--from", dest="from_day", help="시작일(YYYY-MM-DD). 기본값 START_DATE")
+    parser.add_argument("--to", dest="to_day", help="종료일(YYYY-MM-DD). 기본값 마지막 날")
+    args = parser.parse_args()
+
+    garden = Garden()
+
+    from_day = datetime.strptime(args.from_day, "%Y-%m-%d").date() if args.from_day else garden.get_start_date()
+    to_day = datetime.strptime(args.to_day, "%Y-%m-%d").date() if args.to_day \
+        else garden.get_start_date() + timedelta(days=int(garden.get_gardening_days()) - 1)
+
+    export_tools = ExportTools(garden.db_tools)
+    if args.format == "parquet":
+        count = export_tools.write_parquet(args.name, from_day, to_day, args.output)
+    else:
+        count = export_tools.write_csv(args.name, from_day, to_day, args.output)
+    print(f"Exported {count} rows to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
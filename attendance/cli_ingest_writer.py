@@ -0,0 +1,7 @@
+"""
+IngestQueue -> slack_messages 저장 프로세스
+웹 프로세스와 따로 writer 를 돌리고 싶을 때 실행합니다. (웹 프로세스도 자체 writer 스레드가 있음)
+"""
+from attendance.ingest_writer import IngestWriter
+
+IngestWriter().run()
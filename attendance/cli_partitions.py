@@ -0,0 +1,48 @@
+"""
+slack_messages 시즌 파티션 관리
+
+e.g.)
+python attendance/cli_partitions.py list
+python attendance/cli_partitions.py create                      # config.ini 의 현재 시즌
+python attendance/cli_partitions.py create --start 2021-01-18 --days 100
+python attendance/cli_partitions.py detach --start 2021-01-18   # 조회 대상에서 빼고 테이블은 남김
+python attendance/cli_partitions.py drop --start 2021-01-18 --days 100
+"""
+import argparse
+from datetime import datetime
+
+from attendance.config_tools import ConfigTools
+from attendance.db_tools import DBTools
+from attendance.partition_tools import PartitionTools
+
+
+def main():
+    parser = argparse.ArgumentParser(description="slack_messages 시즌 파티션 관리")
+    parser.add_argument("command", choices=["list", "create", "detach", "drop"])
+    parser.add_argument("--start", help="시즌 시작일(YYYY-MM-DD). 기본값 START_DATE")
+    parser.add_argument("--days", type=int, help="시즌 일수. 기본값 GARDENING_DAYS")
+    args = parser.parse_args()
+
+    config_tools = ConfigTools()
+    start_date = datetime.strptime(args.start, "%Y-%m-%d").date() if args.start else config_tools.get_start_date()
+    days = args.days or int(config_tools.get_gardening_days())
+
+    partition_tools = PartitionTools(DBTools())
+
+    if args.command == "list":
+        for partition in partition_tools.list_partitions():
+            print("%(name)s\t%(bound)s\t~%(approx_rows)s rows\t%(bytes)s bytes" % partition)
+    elif args.command == "create":
+        moved = partition_tools.create_season_partition(start_date, days)
+        if moved is None:
+            print("already exists")
+        else:
+            print(f"created (moved {moved} messages from default partition)")
+    elif args.command == "detach":
+        print("detached %s" % partition_tools.detach_season_partition(start_date))
+    elif args.command == "drop":
+        print("dropped %s" % partition_tools.drop_season_partition(start_date, days))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+예약 작업 실행 (docs/06.cron.md)
+
+e.g.)
+python attendance/cli_scheduler.py              # 웹 프로세스와 따로 scheduler 만 실행
+python attendance/cli_scheduler.py run collect  # 작업 하나를 지금 실행 (lock, job_runs 기록 포함)
+python attendance/cli_scheduler.py runs         # 최근 실행 기록
+"""
+import argparse
+
+from attendance.scheduler import create_scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="예약 작업 실행")
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="작업 하나를 지금 실행")
+    run_parser.add_argument("job", choices=["collect", "notify", "rollup"])
+
+    runs_parser = subparsers.add_parser("runs", help="최근 실행 기록")
+    runs_parser.add_argument("--limit", type=int, default=20)
+
+    args = parser.parse_args()
+    scheduler = create_scheduler()
+
+    if args.command == "run":
+        job = next(job for job in scheduler.jobs if job.name == args.job)
+        status = scheduler.run_job(job, scheduler.now())
+        print("%s: %s" % (job.name, status or "already running"))
+    elif args.command == "runs":
+        for run in scheduler.find_job_runs(args.limit):
+            print("%s %-8s %-9s %6s ms rows=%s missed=%s %s" % (
+                run["scheduled_at"], run["job"], run["status"], run["duration_ms"], run["rows"],
+                run["missed_runs"], run["error"] or ""))
+    else:
+        scheduler.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+cron 수집기
+
+slack conversations.history 로 메시지를 가져와서 저장 대기 큐(IngestQueue)에 넣기만 합니다.
+출석 계산, Postgres 저장은 IngestWriter 가 하므로 여기서는 attendance.garden, slack SDK, django 를 import 하지 않습니다.
+설정은 config_snapshot 으로 읽습니다.
+
+여러 cron 실행, /attendance/collect/, 예약 작업(scheduler) 이 같은 기간을 동시에 수집하지 않도록
+Postgres advisory lock("collect") 을 잡고 실행합니다.
+"""
+import json
+import time
+from contextlib import contextmanager
+
+from attendance.advisory_lock import try_advisory_lock
+
+LOCK_NAME = "collect"
+# lock 용 연결의 connect_timeout 기본값. 초
+# Postgres 장애 중에도 큐에는 넣어야 하므로 오래 기다리지 않고 lock 없이 수집 (docs/06.cron.md)
+LOCK_CONNECT_TIMEOUT = 2
+
+SLACK_API_URL = "https://slack.com/api/"
+
+
+def call_slack_api(token, method, params, timeout=30):
+    """slack Web API GET 호출. ok 가 아니면 RuntimeError"""
+    # urllib 는 ssl, http.client 를 끌고 오므로 실제로 호출할 때 import
+    import urllib.parse
+    import urllib.request
+
+    request = urllib.request.Request(
+        SLACK_API_URL + method + "?" + urllib.parse.urlencode(params),
+        headers={"Authorization": "Bearer %s" % token}
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        body = json.load(response)
+    if not body.get("ok"):
+        raise RuntimeError("slack %s failed: %s" % (method, body.get("error")))
+    return body
+
+
+def fetch_messages(token, channel_id, oldest, latest):
+    # Garden.collect_slack_messages 와 같은 요청
+    body = call_slack_api(token, "conversations.history", {
+        "channel": channel_id,
+        "latest": str(latest),
+        "oldest": str(oldest),
+        "count": 1000,
+    })
+    return body["messages"]
+
+
+def get_snapshot(snapshot=None):
+    if snapshot is None:
+        from attendance.config_snapshot import load_snapshot
+        snapshot = load_snapshot()
+    return snapshot
+
+
+def connect_db(snapshot, connect_timeout=10):
+    # DBTools.connect_db 와 같은 설정. 연결 풀, Garden 없이 lock 용 연결만 만듦
+    import psycopg2
+    return psycopg2.connect(
+        host=snapshot.get("POSTGRES", "HOST"),
+        port=snapshot.get("POSTGRES", "PORT"),
+        database=snapshot.get("POSTGRES", "DATABASE"),
+        user=snapshot.get("POSTGRES", "USER"),
+        password=snapshot.get("POSTGRES", "PASSWORD"),
+        sslmode=snapshot.get("POSTGRES", "SSLMODE", "require"),
+        gssencmode='disable',
+        connect_timeout=connect_timeout
+    )
+
+
+@contextmanager
+def collect_lock(snapshot=None):
+    """
+    수집 lock. 다른 곳에서 수집 중이면 False
+    Postgres 에 연결할 수 없으면 lock 없이 수집함 (큐에 넣는 것은 Postgres 없이 되고, 저장할 때 ts 로 중복이 걸러짐)
+    연결은 [POSTGRES] LOCK_CONNECT_TIMEOUT 초(기본 2) 만 기다림
+    """
+    snapshot = get_snapshot(snapshot)
+    conn = None
+    try:
+        timeout = int(snapshot.get("POSTGRES", "LOCK_CONNECT_TIMEOUT", LOCK_CONNECT_TIMEOUT))
+        conn = connect_db(snapshot, connect_timeout=timeout)
+    except Exception as err:
+        print(err)
+
+    if conn is None:
+        yield True
+        return
+    try:
+        with try_advisory_lock(conn, LOCK_NAME) as acquired:
+            yield acquired
+    finally:
+        conn.close()
+
+
+def get_ingest_queue(snapshot):
+    from attendance.ingest_queue import IngestQueue
+    return IngestQueue(snapshot.get("DEFAULT", "INGEST_QUEUE_PATH"))
+
+
+def collect(oldest, latest, snapshot=None):
+    """oldest ~ latest 메시지를 큐에 넣음. 큐에 넣은 메시지 수 반환"""
+    snapshot = get_snapshot(snapshot)
+    messages = fetch_messages(snapshot.get("DEFAULT", "SLACK_API_TOKEN"), snapshot.get("DEFAULT", "CHANNEL_ID"),
+                              oldest, latest)
+    if messages:
+        get_ingest_queue(snapshot).put(messages)
+    return len(messages)
+
+
+def drain():
+    """큐에 쌓인 메시지 저장. 무거운 import 는 여기서만 함"""
+    from attendance.ingest_writer import IngestWriter
+    return IngestWriter().drain()
+
+
+def collect_recent(days=1, now=None, snapshot=None):
+    """어제(days 일 전) 부터 내일 까지. cli_collect.py 의 기본 범위"""
+    now = time.time() if now is None else now
+    return collect(now - days * 86400, now + 86400, snapshot)
+
+
+def run_collect():
+    """예약 작업 collect. lock 은 scheduler 가 잡음"""
+    fetched = collect_recent()
+    saved = drain()
+    return {"rows": fetched, "saved": saved}
@@ -0,0 +1,93 @@
+"""
+설정 snapshot
+
+config.ini, users.yaml 을 JSON 파일 하나로 미리 변환해 둡니다.
+cron 으로 자주 실행하는 스크립트(cli_collect.py)가 configparser, yaml 없이 json 만으로 설정을 읽도록 하기 위함입니다.
+원본 파일의 수정 시각이 바뀌면 다음 실행 때 다시 만듭니다.
+slack token, DB 비밀번호가 들어 있어서 파일은 소유자만 읽을 수 있게(0600) 만듭니다.
+"""
+import json
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCES = ["config.ini", "users.yaml"]
+SNAPSHOT_PATH = os.path.join(BASE_DIR, ".config_snapshot.json")
+
+
+def get_source_mtimes(base_dir=BASE_DIR):
+    """{파일 이름: 수정 시각}. 없는 파일은 None"""
+    mtimes = {}
+    for name in SOURCES:
+        try:
+            mtimes[name] = os.stat(os.path.join(base_dir, name)).st_mtime_ns
+        except FileNotFoundError:
+            mtimes[name] = None
+    return mtimes
+
+
+def build_snapshot(base_dir=BASE_DIR):
+    """config.ini, users.yaml 을 읽어서 snapshot dict 생성"""
+    import configparser
+
+    config = configparser.ConfigParser()
+    config.read(os.path.join(base_dir, "config.ini"))
+    # configparser 와 같이 option 이름은 소문자. DEFAULT 값은 다른 section 에도 들어감
+    sections = {"DEFAULT": dict(config.defaults())}
+    for section in config.sections():
+        sections[section] = dict(config[section])
+
+    users = None
+    users_path = os.path.join(base_dir, "users.yaml")
+    if os.path.exists(users_path):
+        import yaml
+        with open(users_path) as file:
+            users = yaml.full_load(file)
+
+    return {"sources": get_source_mtimes(base_dir), "config": sections, "users": users}
+
+
+def write_snapshot(snapshot, path=SNAPSHOT_PATH):
+    # 다른 프로세스가 반쯤 쓴 파일을 읽지 않도록 임시 파일에 쓰고 이름을 바꿈
+    # 비밀 값이 있으므로 umask 와 상관없이 처음부터 0600 으로 만듦
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        os.fchmod(fd, 0o600)  # 이전 실행이 남긴 임시 파일이면 권한이 다를 수 있음
+        with os.fdopen(fd, "w") as file:
+            json.dump(snapshot, file, ensure_ascii=False, default=str)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+class ConfigSnapshot:
+    def __init__(self, data):
+        self.data = data
+
+    def get(self, section, option, fallback=None):
+        return self.data["config"].get(section, {}).get(option.lower(), fallback)
+
+    def get_users(self):
+        return self.data["users"]
+
+
+def load_snapshot(base_dir=BASE_DIR, path=SNAPSHOT_PATH):
+    """snapshot 읽기. 없거나 원본이 바뀌었으면 다시 만듦"""
+    mtimes = get_source_mtimes(base_dir)
+    try:
+        with open(path) as file:
+            data = json.load(file)
+            # 권한 없이 만들어진 예전 snapshot 은 다시 씀
+            private = os.fstat(file.fileno()).st_mode & 0o077 == 0
+        if data.get("sources") == mtimes and private:
+            return ConfigSnapshot(data)
+    except (FileNotFoundError, ValueError):
+        pass
+
+    data = build_snapshot(base_dir)
+    try:
+        write_snapshot(data, path)
+    except OSError as err:
+        print(err)
+    return ConfigSnapshot(data)
@@ -2,12 +2,20 @@ import configparser
 import os
 from datetime import date, timedelta, datetime
 import yaml
+from zoneinfo import ZoneInfo
 
 
 class ConfigTools:
+    # config.ini, users.yaml 은 프로세스 안에서 한번만 읽음. 바꾸면 재시작
+    # gunicorn 은 master 에서 읽어 두고 worker 들이 fork 하면서 물려받음
+    cache = {}
+
     def __init__(self):
-        self.config = self.load_config()
-        self.users = self.load_users()
+        if not ConfigTools.cache:
+            ConfigTools.cache["config"] = self.load_config()
+            ConfigTools.cache["users"] = self.load_users()
+        self.config = ConfigTools.cache["config"]
+        self.users = ConfigTools.cache["users"]
 
     def load_config(self):
         config = configparser.ConfigParser()
@@ -29,6 +37,10 @@ class ConfigTools:
         return datetime.strptime(self.get_start_date_str(),
                           "%Y-%m-%d").date()  # start_date e.g.) 2021-01-18
 
+    # 출석일 계산 기준 timezone. 서버 timezone 과 상관없이 같은 결과가 나오도록 함
+    def get_time_zone(self):
+        return ZoneInfo(self.config['DEFAULT'].get('TIME_ZONE', 'Asia/Seoul'))
+
     '''
     load users.yaml
     '''
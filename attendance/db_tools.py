@@ -1,11 +1,75 @@
 import configparser
+import hashlib
+import json
 import os
+import threading
+from contextlib import contextmanager
+
 import psycopg2
+import psycopg2.extensions
 from psycopg2 import sql
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+from attendance.advisory_lock import get_lock_key, try_advisory_lock
+from attendance.attendance_day import to_ts_for_db_range
+from attendance.profiling import ProfilingCursor, get_current, profiled
+from attendance.statements import get_statement
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """
+    풀에서 꺼내 쓰는 연결. search_path 는 연결마다 한번만 설정
+    prepared 는 이 연결에서 PREPARE 한 statement 이름들 (attendance/statements.py)
+    """
+    search_path_set = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+class ConnectionPool:
+    """
+    ThreadedConnectionPool 은 연결이 모자라면 바로 에러를 내므로 semaphore 로 빈 연결이 생길 때 까지 기다림
+    """
+
+    def __init__(self, minconn, maxconn, **kwargs):
+        self.pool = ThreadedConnectionPool(minconn, maxconn, connection_factory=PooledConnection, **kwargs)
+        self.semaphore = threading.BoundedSemaphore(maxconn)
+        self.maxconn = maxconn
+
+    def getconn(self):
+        self.semaphore.acquire()
+        try:
+            return self.pool.getconn()
+        except Exception:
+            self.semaphore.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        try:
+            self.pool.putconn(conn, close=close)
+        finally:
+            self.semaphore.release()
+
+
+# find_slack_messages 에서 쓸 수 있는 컬럼. SQL 에 그대로 들어가므로 여기 있는 것만
+FILTER_COLUMNS = ("ts", "bot_id", "type", "user", "team", "attendance_day")
+SORT_COLUMNS = ("ts_for_db", "ts", "attendance_day", "created_at")
+MAX_LIMIT = 10000
+# 메시지 저장(과 저장소별 집계)을 한번에 하나씩 하는 transaction advisory lock. ingest_seq 순서 (sql/009_ingest_seq.sql)
+INGEST_LOCK = "ingest_seq"
+
+# 프로세스마다 하나. fork 된 worker 가 부모 프로세스의 연결을 같이 쓰지 않도록 pid 별로 만듦
+_pools = {}
+_pools_lock = threading.Lock()
 
 
 class DBTools:
+    # json_blobs 는 내용이 바뀌지 않으므로 한번 읽은 것은 프로세스 안에서 계속 들고 있음
+    json_blobs = {}
+
     def __init__(self):
         config = configparser.ConfigParser()
         BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -19,6 +83,13 @@ class DBTools:
         self.pg_user = config['POSTGRES']['USER']
         self.pg_password = config['POSTGRES']['PASSWORD']
         self.pg_schema = config['POSTGRES']['SCHEMA']
+        # 연결 풀 크기. worker 하나가 동시에 쓰는 연결 수 (05.serving 참고)
+        self.pool_min = int(config['POSTGRES'].get('POOL_MIN', 1))
+        self.pool_max = int(config['POSTGRES'].get('POOL_MAX', 4))
+        # 로컬 Postgres(benchmarks/load_test.py) 는 disable. 기본 require
+        self.pg_sslmode = config['POSTGRES'].get('SSLMODE', 'require')
+        # transaction 단위 connection pooler 를 거치면 false (attendance/statements.py)
+        self.use_prepared = config['POSTGRES'].getboolean('PREPARED_STATEMENTS', True)
 
     def connect_db(self):
         """PostgreSQL 연결 생성"""
@@ -28,10 +99,99 @@ class DBTools:
             database=self.pg_database,
             user=self.pg_user,
             password=self.pg_password,
-            sslmode='require',
+            sslmode=self.pg_sslmode,
             gssencmode='disable'
         )
 
+    def get_pool(self):
+        key = (os.getpid(), self.pg_host, self.pg_port, self.pg_database, self.pg_user)
+        pool = _pools.get(key)
+        if pool is None:
+            with _pools_lock:
+                pool = _pools.get(key)
+                if pool is None:
+                    pool = ConnectionPool(
+                        self.pool_min, self.pool_max,
+                        host=self.pg_host,
+                        port=self.pg_port,
+                        database=self.pg_database,
+                        user=self.pg_user,
+                        password=self.pg_password,
+                        sslmode=self.pg_sslmode,
+                        gssencmode='disable'
+                    )
+                    _pools[key] = pool
+        return pool
+
+    def warm_pool(self, connections=None):
+        """풀에 연결을 미리 만들어 둠. 기본은 POOL_MIN 개"""
+        pool = self.get_pool()
+        conns = []
+        try:
+            for _ in range(connections or self.pool_min):
+                conn = pool.getconn()
+                conns.append(conn)
+                self.prepare_connection(conn)
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                conn.commit()
+        finally:
+            for conn in conns:
+                pool.putconn(conn)
+
+    def prepare_connection(self, conn):
+        """풀 연결을 처음 쓸 때 한번 실행"""
+        if not conn.search_path_set:
+            with conn.cursor() as cursor:
+                cursor.execute(f"SET search_path TO {self.pg_schema}")
+            conn.commit()
+            conn.search_path_set = True
+
+    @contextmanager
+    def pooled_cursor(self):
+        """
+        풀에서 연결을 빌려서 (conn, cursor) 를 줌. 끝나면 commit, 에러가 나면 rollback 하고 돌려놓음
+        SELECT 도 commit 하므로 pg_notify 같은 부수 효과가 있는 SELECT 도 반영됨
+        """
+        pool = self.get_pool()
+        conn = pool.getconn()
+        broken = False
+        try:
+            self.prepare_connection(conn)
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                # 프로파일 중인 요청(tools/profiler.py)이면 SQL 별 시간 기록
+                profile = get_current()
+                yield conn, (cursor if profile is None else ProfilingCursor(cursor, profile))
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # 끊긴 연결은 풀에 돌려놓지 않고 닫음
+            broken = True
+            raise
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn, close=broken or bool(conn.closed))
+
+    @contextmanager
+    def advisory_lock(self, name):
+        """
+        이름 별 advisory lock. 다른 프로세스가 잡고 있으면 기다리지 않고 False
+        잡고 있는 동안 풀 연결 하나를 들고 있으므로 안에서 쿼리를 하려면 POOL_MAX 가 2 이상이어야 함
+        """
+        pool = self.get_pool()
+        conn = pool.getconn()
+        broken = False
+        try:
+            with try_advisory_lock(conn, name) as acquired:
+                yield acquired
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # 끊긴 연결의 lock 은 Postgres 가 풀어줌
+            broken = True
+            raise
+        finally:
+            pool.putconn(conn, close=broken or bool(conn.closed))
+
     def get_cursor(self, dict_cursor=True):
         """커서 획득 (딕셔너리 형태로 반환 옵션)"""
         conn = self.connect_db()
@@ -44,10 +204,10 @@ class DBTools:
         cursor.execute(f"SET search_path TO {self.pg_schema}")
         return conn, cursor
 
+    @profiled("DBTools.execute_query")
     def execute_query(self, query, params=None, fetch_one=False, fetch_all=True):
         """쿼리 실행 및 결과 반환"""
-        conn, cursor = self.get_cursor()
-        try:
+        with self.pooled_cursor() as (conn, cursor):
             cursor.execute(query, params)
             
             if query.strip().upper().startswith('SELECT'):
@@ -58,16 +218,224 @@ class DBTools:
                 else:
                     result = None
             else:
-                conn.commit()
                 result = cursor.rowcount
             
             return result
-        finally:
+
+    def prepare_statement(self, conn, cursor, name):
+        """이 연결에서 처음이면 PREPARE 하고 commit"""
+        if self.use_prepared and name not in conn.prepared:
+            cursor.execute(get_statement(name).prepare_sql)
+            conn.commit()
+            conn.prepared.add(name)
+
+    def execute_statement(self, conn, cursor, name, params):
+        """등록된 쿼리(statements.py) 실행. 이 연결에서 처음이면 PREPARE 하고 commit 부터"""
+        statement = get_statement(name)
+        if not self.use_prepared:
+            cursor.execute(statement.plain_sql, params)
+            return
+        self.prepare_statement(conn, cursor, name)
+        cursor.execute(statement.execute_sql, params)
+
+    @profiled("DBTools.execute_prepared")
+    def execute_prepared(self, name, params, fetch_one=False, fetch_all=True):
+        """등록된 쿼리 실행. 결과가 있는 쿼리면 rows, 없으면 rowcount"""
+        with self.pooled_cursor() as (conn, cursor):
+            self.execute_statement(conn, cursor, name, params)
+            if cursor.description is None:
+                return cursor.rowcount
+            if fetch_one:
+                return cursor.fetchone()
+            return cursor.fetchall() if fetch_all else None
+
+    @profiled("DBTools.execute_prepared_many")
+    def execute_prepared_many(self, name, params_list, lock=None, after=None):
+        """
+        같은 쿼리를 params 마다 한 transaction 에서 실행. RETURNING rows 를 합쳐서 반환
+        lock 이름이 있으면 transaction advisory lock 을 잡고 실행 (commit 할 때 풀림)
+        after(cursor, rows) 가 있으면 commit 하기 전에 같은 transaction 에서 실행. 에러가 나면 모두 rollback
+        """
+        rows = []
+        with self.pooled_cursor() as (conn, cursor):
+            # PREPARE 는 commit 하므로 lock 보다 먼저
+            self.prepare_statement(conn, cursor, name)
+            if lock is not None:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", (get_lock_key(lock),))
+            for params in params_list:
+                self.execute_statement(conn, cursor, name, params)
+                if cursor.description is not None:
+                    rows.extend(cursor.fetchall())
+            if after is not None:
+                after(cursor, rows)
+        return rows
+
+    def iter_query(self, query, params=None, itersize=2000):
+        """
+        server-side(named) cursor 로 조회해서 한 row 씩 반환
+        결과가 아무리 커도 itersize 만큼만 메모리에 올라옴
+        """
+        conn = self.connect_db()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"SET search_path TO {self.pg_schema}")
+
+            cursor = conn.cursor(name="iter_query", cursor_factory=RealDictCursor)
+            cursor.itersize = itersize
+            cursor.execute(query, params)
+            for row in cursor:
+                yield row
             cursor.close()
+        finally:
             conn.close()
 
+    @profiled("DBTools.execute_values")
+    def execute_values(self, query, rows, template=None, page_size=100, fetch=False):
+        """여러 row 를 VALUES %s 로 묶어서 실행. fetch=True 면 RETURNING 결과를 반환"""
+        with self.pooled_cursor() as (conn, cursor):
+            return execute_values(cursor, query, rows, template=template, page_size=page_size, fetch=fetch)
+
+    @profiled("DBTools.intern_json_blobs")
+    def intern_json_blobs(self, values):
+        """JSON 값들을 json_blobs 에 저장하고 hash 리스트를 반환. 이미 있는 값은 저장하지 않음"""
+        hashes = [json_blob_hash(value) for value in values]
+        new_blobs = {}
+        for (blob_hash, value) in zip(hashes, values):
+            if blob_hash not in self.json_blobs:
+                new_blobs[blob_hash] = value
+        if new_blobs:
+            self.execute_values(
+                "INSERT INTO json_blobs (hash, body) VALUES %s ON CONFLICT (hash) DO NOTHING",
+                [(blob_hash, json.dumps(value)) for (blob_hash, value) in new_blobs.items()]
+            )
+            self.json_blobs.update(new_blobs)
+        return hashes
+
+    @profiled("DBTools.get_json_blobs")
+    def get_json_blobs(self, hashes):
+        """{hash: JSON 값}"""
+        missing = list({blob_hash for blob_hash in hashes if blob_hash not in self.json_blobs})
+        if missing:
+            rows = self.execute_query("SELECT hash, body FROM json_blobs WHERE hash = ANY(%s)", (missing,))
+            for row in rows:
+                self.json_blobs[row["hash"]] = row["body"]
+        return {blob_hash: self.json_blobs.get(blob_hash) for blob_hash in hashes}
+
+    @profiled("DBTools.find_content_hashes")
+    def find_content_hashes(self, messages):
+        """
+        이미 저장된 메시지들의 {ts: {content_hash, attachments, attendance_day}}
+        messages 의 ts_for_db 범위로 조건을 넣어서 해당 파티션만 읽음
+        """
+        if not messages:
+            return {}
+        ts_for_dbs = [message['ts_for_db'] for message in messages]
+        rows = self.execute_prepared(
+            "content_hashes",
+            ([message['ts'] for message in messages], min(ts_for_dbs), max(ts_for_dbs))
+        )
+        return {row['ts']: row for row in rows}
+
+    @profiled("DBTools.upsert_slack_messages")
+    def upsert_slack_messages(self, messages, page_size=500, after=None):
+        """
+        slack 메시지들을 batch 로 저장. 이미 있는 메시지는 내용(content_hash)이 바뀐 경우만 고침
+        내용이 같은 메시지는 쓰지 않음. attendance_day 는 처음 저장할 때 값을 유지
+        bot_profile 은 메시지마다 같은 값이라 json_blobs 에 한번만 저장하고 bot_profile_hash 로 참조
+        after(cursor, result) 가 있으면 저장한 transaction 에서 commit 전에 실행 (저장소별 집계)
+        @return {"inserted": [새로 저장된 ts], "updated": {고친 ts: 고치기 전 row (find_content_hashes)}}
+        """
+        result = {"inserted": [], "updated": {}}
+        if not messages:
+            return result
+
+        existing = self.find_content_hashes(messages)
+        content_hashes = {message['ts']: message_content_hash(message) for message in messages}
+        messages = [message for message in messages
+                    if message['ts'] not in existing or existing[message['ts']]['content_hash'] != content_hashes[message['ts']]]
+        if not messages:
+            return result
+
+        with_bot_profile = [message for message in messages if message.get('bot_profile')]
+        bot_profile_hashes = dict(zip(
+            [message['ts'] for message in with_bot_profile],
+            self.intern_json_blobs([message['bot_profile'] for message in with_bot_profile])
+        ))
+
+        rows = [
+            (
+                message.get('ts'),
+                message.get('ts_for_db'),
+                message.get('attendance_day'),
+                message.get('bot_id'),
+                message.get('type'),
+                message.get('text'),
+                message.get('user'),
+                message.get('team'),
+                bot_profile_hashes.get(message.get('ts')),
+                json.dumps(message.get('attachments')) if message.get('attachments') else None,
+                message.get('commit_text'),
+                content_hashes[message['ts']]
+            )
+            for message in messages
+        ]
+
+        # page_size 개씩 컬럼별 배열로 묶어서 저장 (statements.py upsert_slack_messages)
+        # ingest_seq 번호 순서와 commit 순서가 같도록 writer 들이 한번에 하나씩 저장 (sql/009_ingest_seq.sql)
+        pages = [[list(column) for column in zip(*rows[i:i + page_size])] for i in range(0, len(rows), page_size)]
+
+        def finish(cursor, saved_rows):
+            for row in saved_rows:
+                if row["inserted"]:
+                    result["inserted"].append(row["ts"])
+                elif row["ts"] in existing:
+                    # 조회한 다음 다른 writer 가 먼저 INSERT 한 경우는 고치기 전 row 를 모르므로 빠짐
+                    result["updated"][row["ts"]] = existing[row["ts"]]
+            if after is not None:
+                after(cursor, result)
+
+        self.execute_prepared_many("upsert_slack_messages", pages, lock=INGEST_LOCK, after=finish)
+        return result
+
+    @profiled("DBTools.search_commits")
+    def search_commits(self, keyword, author_name=None, from_day=None, to_day=None, limit=20, offset=0):
+        """
+        커밋 메시지 검색. 단어가 일치하는 메시지가 먼저(ts_rank), 같으면 최신순
+        단어 검색(search_vector)과 부분 문자열 검색(pg_trgm) 결과를 합침
+        """
+        where_conditions = ["(search_vector @@ query OR commit_text ILIKE %s)"]
+        params = [keyword, "%" + escape_like(keyword) + "%"]
+        if author_name:
+            where_conditions.append("author_name = %s")
+            params.append(author_name)
+        if from_day:
+            where_conditions.append("attendance_day >= %s")
+            params.append(from_day)
+        if to_day:
+            where_conditions.append("attendance_day <= %s")
+            params.append(to_day)
+        if from_day and to_day:
+            # 해당 기간 파티션만 읽도록
+            where_conditions.append("ts_for_db >= %s AND ts_for_db < %s")
+            params.extend(to_ts_for_db_range(from_day, to_day))
+
+        query = f"""
+            SELECT ts, ts_for_db, attendance_day, author_name, commit_text,
+                   ts_rank(search_vector, query) AS rank
+            FROM slack_messages, websearch_to_tsquery('simple', %s) AS query
+            WHERE {" AND ".join(where_conditions)}
+            ORDER BY rank DESC, ts_for_db DESC
+            LIMIT %s OFFSET %s
+        """
+        return self.execute_query(query, params + [limit, offset])
+
+    @profiled("DBTools.find_slack_messages")
     def find_slack_messages(self, filters=None, sort_by="ts_for_db", limit=None):
-        """Slack 메시지 조회"""
+        """
+        Slack 메시지 조회
+        sort_by 는 SORT_COLUMNS 중 하나. 앞에 - 를 붙이면 내림차순 e.g.) "-ts"
+        limit 은 1 ~ MAX_LIMIT. 없으면(None, 0) 전부, 그 밖의 값이면 ValueError
+        """
         query = "SELECT * FROM slack_messages"
         params = []
         
@@ -75,26 +443,66 @@ class DBTools:
             where_conditions = []
             for key, value in filters.items():
                 if key == 'author_name':
-                    # JSONB에서 author_name 검색
-                    where_conditions.append("attachments->0->>'author_name' = %s")
+                    # attachments->0->>'author_name' generated column
+                    where_conditions.append("author_name = %s")
                     params.append(value)
+                elif key == 'has_attendance_day':
+                    where_conditions.append("attendance_day IS NOT NULL" if value else "attendance_day IS NULL")
                 elif key == 'ts_for_db_gte':
                     where_conditions.append("ts_for_db >= %s")
                     params.append(value)
                 elif key == 'ts_for_db_lt':
                     where_conditions.append("ts_for_db < %s")
                     params.append(value)
-                else:
-                    where_conditions.append(f"{key} = %s")
+                elif key in FILTER_COLUMNS:
+                    where_conditions.append(f'"{key}" = %s')
                     params.append(value)
+                else:
+                    raise ValueError("unknown filter: %s" % key)
             
             if where_conditions:
                 query += " WHERE " + " AND ".join(where_conditions)
         
         if sort_by:
-            query += f" ORDER BY {sort_by}"
+            column = sort_by.lstrip("-")
+            if column not in SORT_COLUMNS:
+                raise ValueError("unknown sort_by: %s" % sort_by)
+            query += f" ORDER BY {column}" + (" DESC" if sort_by.startswith("-") else "")
         
         if limit:
-            query += f" LIMIT {limit}"
+            if not isinstance(limit, int) or isinstance(limit, bool) or not 1 <= limit <= MAX_LIMIT:
+                raise ValueError("limit must be 1 ~ %d: %r" % (MAX_LIMIT, limit))
+            query += " LIMIT %s"
+            params.append(limit)
         
-        return self.execute_query(query, params)
\ No newline at end of file
+        messages = self.execute_query(query, params)
+        self.fill_bot_profiles(messages)
+        return messages
+
+    @profiled("DBTools.fill_bot_profiles")
+    def fill_bot_profiles(self, messages):
+        """bot_profile_hash 로 저장된 메시지들의 bot_profile 을 채움"""
+        blobs = self.get_json_blobs([message["bot_profile_hash"] for message in messages
+                                     if message.get("bot_profile") is None and message.get("bot_profile_hash")])
+        for message in messages:
+            if message.get("bot_profile") is None and message.get("bot_profile_hash"):
+                message["bot_profile"] = blobs[message["bot_profile_hash"]]
+
+
+def json_blob_hash(value):
+    """키 순서, 공백과 상관없이 같은 JSON 이면 같은 hash"""
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def message_content_hash(message):
+    """slack 메시지 내용 hash. 수정된 메시지를 찾는데 씀. ts_for_db, attendance_day 처럼 계산한 값은 제외"""
+    content = {key: message.get(key) for key in ("type", "bot_id", "user", "team", "text")}
+    # 빈 attachments 는 NULL 로 저장되므로 같게 봄
+    content["attachments"] = message.get("attachments") or None
+    return json_blob_hash(content)
+
+
+def escape_like(value):
+    """LIKE 패턴 문자 이스케이프"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
@@ -0,0 +1,119 @@
+"""
+출석부 내보내기
+
+유저별 날짜별 출석, 커밋 메시지 원본을 CSV 나 Parquet 로 내보냅니다.
+DB 에서 server-side cursor 로 조금씩 읽어서 바로 쓰기 때문에 시즌이 길어지거나 인원이 많아도 메모리 사용량은 같습니다.
+Parquet 는 pyarrow 가 설치되어 있어야 합니다.
+"""
+import csv
+
+from attendance.attendance_day import to_ts_for_db_range
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# 유저별 날짜별 출석. 출석한 날만 한 row
+ATTENDANCE_QUERY = """
+    SELECT author_name AS "user", attendance_day, MIN(ts_for_db) AS first_ts, COUNT(*) AS commit_messages
+    FROM slack_messages
+    WHERE attendance_day BETWEEN %s AND %s AND ts_for_db >= %s AND ts_for_db < %s
+    GROUP BY author_name, attendance_day
+    ORDER BY author_name, attendance_day
+"""
+
+# 커밋 메시지 원본. commits 는 attachment 들의 커밋 메시지를 줄바꿈으로 합친 것
+COMMITS_QUERY = """
+    SELECT ts, ts_for_db, attendance_day, author_name AS "user",
+           (SELECT string_agg(attachment->>'text', E'\\n')
+            FROM jsonb_array_elements(attachments) AS attachment
+            WHERE attachment ? 'text') AS commits
+    FROM slack_messages
+    WHERE attendance_day BETWEEN %s AND %s AND ts_for_db >= %s AND ts_for_db < %s
+    ORDER BY ts_for_db
+"""
+
+EXPORTS = {
+    "attendance": (ATTENDANCE_QUERY, ["user", "attendance_day", "first_ts", "commit_messages"]),
+    "commits": (COMMITS_QUERY, ["ts", "ts_for_db", "attendance_day", "user", "commits"]),
+}
+
+
+class Echo:
+    """csv.writer 가 쓴 한 줄을 그대로 돌려줌. StreamingHttpResponse 용"""
+
+    def write(self, value):
+        return value
+
+
+class ExportTools:
+    def __init__(self, db_tools, itersize=2000):
+        self.db_tools = db_tools
+        self.itersize = itersize
+
+    def iter_rows(self, name, from_day, to_day):
+        (query, columns) = EXPORTS[name]
+        params = (from_day, to_day) + to_ts_for_db_range(from_day, to_day)
+        for row in self.db_tools.iter_query(query, params, itersize=self.itersize):
+            yield [row[column] for column in columns]
+
+    def iter_csv(self, name, from_day, to_day):
+        """CSV 를 한 줄씩 반환. 첫 줄은 헤더"""
+        writer = csv.writer(Echo())
+        yield writer.writerow(EXPORTS[name][1])
+        for row in self.iter_rows(name, from_day, to_day):
+            yield writer.writerow(row)
+
+    def write_csv(self, name, from_day, to_day, path):
+        count = 0
+        with open(path, "w", newline="") as file:
+            for line in self.iter_csv(name, from_day, to_day):
+                file.write(line)
+                count += 1
+        return count - 1
+
+    def write_parquet(self, name, from_day, to_day, path, batch_size=10000):
+        """batch_size row 씩 row group 으로 씀. 쓴 row 수 반환"""
+        if pyarrow is None:
+            raise RuntimeError("parquet export requires pyarrow (pip install pyarrow)")
+
+        schema = get_parquet_schema(name)
+        count = 0
+        batch = []
+        with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+            for row in self.iter_rows(name, from_day, to_day):
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    writer.write_table(to_table(schema, batch))
+                    count += len(batch)
+                    batch = []
+            if batch:
+                writer.write_table(to_table(schema, batch))
+                count += len(batch)
+        return count
+
+
+def get_parquet_schema(name):
+    if name == "attendance":
+        return pyarrow.schema([
+            ("user", pyarrow.string()),
+            ("attendance_day", pyarrow.date32()),
+            ("first_ts", pyarrow.timestamp("us")),
+            ("commit_messages", pyarrow.int64()),
+        ])
+    return pyarrow.schema([
+        ("ts", pyarrow.string()),
+        ("ts_for_db", pyarrow.timestamp("us")),
+        ("attendance_day", pyarrow.date32()),
+        ("user", pyarrow.string()),
+        ("commits", pyarrow.string()),
+    ])
+
+
+def to_table(schema, batch):
+    return pyarrow.Table.from_arrays(
+        [pyarrow.array([row[i] for row in batch], type=field.type) for (i, field) in enumerate(schema)],
+        schema=schema
+    )
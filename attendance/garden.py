@@ -1,26 +1,50 @@
 from datetime import date, timedelta, datetime
 import pprint
-from attendance.slack_tools import SlackTools
 from attendance.db_tools import DBTools
 from attendance.config_tools import ConfigTools
+from attendance.attendance_day import assign_attendance_days, get_commits, get_grace_day, to_local_datetime, \
+    to_ts_for_db_range
+from attendance.live_updates import make_deltas, notify_attendance
+from attendance.ingest_queue import IngestQueue
+from attendance.repo_rollup import add_repo_rollups
+
+
+def get_saved_messages(messages, saved):
+    """upsert_slack_messages 결과 -> (새로 저장된 메시지들, 수정된 메시지들)"""
+    inserted_ts = set(saved["inserted"])
+    updated = saved["updated"]
+    inserted_messages = [m for m in messages if m["ts"] in inserted_ts]
+    updated_messages = [m for m in messages if m["ts"] in updated]
+    for message in updated_messages:
+        # 수정된 메시지의 출석일은 처음 저장할 때 값 그대로. 고쳐서 커밋이 없어졌으면 None (statements.py upsert_slack_messages)
+        # 집계는 고치기 전 출석일로 뺀 다음 새 출석일로 더하므로 None 이면 빠지기만 함
+        if message["attendance_day"] is not None and updated[message["ts"]]["attendance_day"] is not None:
+            message["attendance_day"] = updated[message["ts"]]["attendance_day"]
+    return inserted_messages, updated_messages
 
 
 class Garden:
     def __init__(self):
         self.config_tools = ConfigTools()
-        self.slack_tools = SlackTools()
         self.db_tools = DBTools()
 
-        self.slack_client = self.slack_tools.get_slack_client()
-        self.channel_id = self.slack_tools.get_channel_id()
+        # slack SDK 는 import 가 무거워서 slack API 를 쓸 때 만듦 (get_slack_tools)
+        self.slack_tools = None
 
         self.gardening_days = self.config_tools.get_gardening_days()
         self.start_date = self.config_tools.get_start_date()
         self.start_date_str = self.config_tools.get_start_date_str()
+        self.time_zone = self.config_tools.get_time_zone()
+        # 현재 시즌 ts_for_db 범위. 조회할 때 현재 시즌 파티션만 읽도록 조건에 넣음
+        self.season_range = to_ts_for_db_range(
+            self.start_date, self.start_date + timedelta(days=int(self.gardening_days) - 1))
 
         self.users_with_slackname = self.config_tools.get_users()
         self.users = list(self.users_with_slackname.keys())
 
+        self.ingest_queue = None
+        self.season_archive = None
+
     def get_gardening_days(self):
         return self.gardening_days
 
@@ -39,6 +63,25 @@ class Garden:
     def get_users(self):
         return self.users
 
+    def get_slack_tools(self):
+        if self.slack_tools is None:
+            from attendance.slack_tools import SlackTools
+            self.slack_tools = SlackTools()
+        return self.slack_tools
+
+    # 저장 대기 큐. Postgres 가 느리거나 안될 때도 수집은 바로 끝나도록 함
+    def get_ingest_queue(self):
+        if self.ingest_queue is None:
+            self.ingest_queue = IngestQueue()
+        return self.ingest_queue
+
+    # 끝난 시즌 보관 파일. 이전 시즌 조회는 DB 대신 여기서 읽음. 프로세스 안에서 공유
+    def get_season_archive(self):
+        if self.season_archive is None:
+            from attendance.season_archive import get_season_archive
+            self.season_archive = get_season_archive()
+        return self.season_archive
+
     def find_attend(self, oldest, latest):
         print("find_attend")
         print(oldest)
@@ -58,146 +101,200 @@ class Garden:
             print(dict(message))
 
     # 특정 유저의 전체 출석부를 생성함
-    # TODO 출석부를 DB에 넣고 마지막 생성된 출석부 이후의 데이터로 추가 출석부 만들도록 하자
-    def find_attendance_by_user(self, user):
+    # 출석일은 수집할 때 계산해 둔 attendance_day 를 사용
+    # start_date 가 이전 시즌이면 보관 파일에서 읽음
+    def find_attendance_by_user(self, user, start_date=None):
+        if start_date is not None and start_date != self.start_date:
+            archived_season = self.get_season_archive().open_season(start_date)
+            return archived_season.find_attendance_by_user(user) if archived_season else {}
+
+        (result, _) = self.find_attendance_updates(user)
+        return result
+
+    """
+    특정 유저의 출석부 중 since_day 이후, 저장 순번(ingest_seq)이 after_seq 보다 나중인 커밋들만 조회
+    ingest_seq 는 저장하거나 고칠 때마다 새로 받으므로 늦게 저장된 예전 메시지, 고친 메시지도 나옴 (sql/009_ingest_seq.sql)
+    @return (result, last_seq) last_seq 는 조회한 커밋 중 가장 큰 ingest_seq. 다음 조회의 after_seq
+            커밋이 없으면 after_seq, since_day 로 조회했으면 조회 전 이 유저의 가장 큰 ingest_seq, 둘 다 없으면 None
+    """
+    def find_attendance_updates(self, user, since_day=None, after_seq=None):
+        # 조건이 없으면 범위 끝 값을 넘겨서 항상 같은 prepared statement 를 씀 (statements.py author_history)
+        params = (user, *self.season_range,
+                  date.min if since_day is None else since_day,
+                  0 if after_seq is None else after_seq)
+
+        last_seq = after_seq
+        if after_seq is None and since_day is not None:
+            # 조회 결과가 없어도 다음 조회부터는 날짜 대신 순번으로 이어가도록
+            # 조회 전에 읽어서 그 사이에 저장된 커밋은 다음 조회에 나옴 (저장은 ingest_seq 순서대로 commit 됨)
+            last_seq = self.find_last_ingest_seq(user)
+
         result = {}
+        for message in self.db_tools.execute_prepared("author_history", params):
+            attend = {"ts": message["ts_for_db"], "message": get_commits(message)}
 
-        start_date = self.start_date
-        
-        filters = {'author_name': user}
-        messages = self.db_tools.find_slack_messages(filters=filters, sort_by="ts")
-        
-        for message in messages:
-            # make attend
-            commits = []
-            # PostgreSQL JSONB에서 attachments 가져오기
-            attachments = message["attachments"] if message["attachments"] else []
-            for attachment in attachments:
-                try:
-                    # commit has text field
-                    # there is no text field in pull request, etc...
-                    commits.append(attachment["text"])
-                except Exception as err:
-                    print(message["attachments"])
-                    print(err)
-                    continue
-
-            # skip - if there is no commits
-            if len(commits) == 0:
-                continue
-
-            # ts_datetime = datetime.fromtimestamp(float(message["ts"]))
-            ts_datetime = message["ts_for_db"]
-            attend = {"ts": ts_datetime, "message": commits}
-
-            # current date and date before day1
-            date = ts_datetime.date()
-            date_before_day1 = date - timedelta(days=1)
-            hour = ts_datetime.hour
-
-            if date_before_day1 >= start_date and hour < 2 and date_before_day1 not in result:
-                # check before day1. if exists, before day1 is already done.
-                result[date_before_day1] = []
-                result[date_before_day1].append(attend)
-            else:
-                # create date commits array
-                if date not in result:
-                    result[date] = []
-
-                result[date].append(attend)
+            if message["attendance_day"] not in result:
+                result[message["attendance_day"]] = []
+
+            result[message["attendance_day"]].append(attend)
+
+            last_seq = max(last_seq or 0, message["ingest_seq"])
+
+        return result, last_seq
+
+    # 유저의 저장된 메시지 중 가장 큰 ingest_seq. 없으면 0
+    def find_last_ingest_seq(self, user):
+        row = self.db_tools.execute_query(
+            "SELECT COALESCE(MAX(ingest_seq), 0) AS last_seq FROM slack_messages WHERE author_name = %s",
+            (user,), fetch_one=True
+        )
+        return row["last_seq"]
+
+    # 유저별 날짜별 첫 커밋 시각. {user: {date: first_ts}}
+    def find_first_commits(self, attendance_day=None):
+        # 날짜가 없으면 전체 범위 (statements.py first_commits)
+        (from_day, to_day) = (date.min, date.max) if attendance_day is None else (attendance_day, attendance_day)
+        params = (list(self.users), *self.season_range, from_day, to_day)
 
+        result = {user: {} for user in self.users}
+        for row in self.db_tools.execute_prepared("first_commits", params):
+            result[row["author_name"]][row["attendance_day"]] = row["first_ts"]
         return result
 
-    # github 봇으로 모은 slack message 들을 slack_messages collection 에 저장
+    # 이미 출석 처리된 (author_name, date). 새벽 2시 규칙 계산용
+    def find_attended(self, author_names, dates):
+        if not author_names or not dates:
+            return set()
+
+        rows = self.db_tools.execute_prepared(
+            "attended",
+            (list(author_names), list(dates)) + to_ts_for_db_range(min(dates), max(dates))
+        )
+        return {(row["author_name"], row["attendance_day"]) for row in rows}
+
+    # 커밋이 많은 저장소들. [{repository, commits, authors}]
+    def find_top_repositories(self, from_day, to_day, limit=20):
+        return self.db_tools.execute_query(
+            """
+            SELECT repository, SUM(commits) AS commits, COUNT(DISTINCT author_name) AS authors
+            FROM repo_daily_commits
+            WHERE attendance_day BETWEEN %s AND %s
+            GROUP BY repository
+            ORDER BY commits DESC, repository
+            LIMIT %s
+            """,
+            (from_day, to_day, limit)
+        )
+
+    # 특정 유저의 저장소별 커밋 수, 커밋한 날 수. [{repository, commits, days}]
+    def find_repositories_by_user(self, user, from_day, to_day):
+        return self.db_tools.execute_query(
+            """
+            SELECT repository, SUM(commits) AS commits, COUNT(*) AS days
+            FROM repo_daily_commits
+            WHERE author_name = %s AND attendance_day BETWEEN %s AND %s
+            GROUP BY repository
+            ORDER BY commits DESC, repository
+            """,
+            (user, from_day, to_day)
+        )
+
+    # slack 메시지들에 ts_for_db, attendance_day 를 계산해 넣고 저장. 새로 저장된 ts 리스트 반환
+    # 이미 있는 메시지는 내용이 바뀐(수정된) 경우만 고치고, 집계/알림도 바뀐 메시지만 반영
+    def save_slack_messages(self, messages):
+        author_names = set()
+        grace_days = set()
+        for message in messages:
+            message["ts_for_db"] = to_local_datetime(message["ts"], self.time_zone)
+            message["commit_text"] = "\n".join(get_commits(message)) or None
+
+            grace_day = get_grace_day(message["ts"], self.time_zone, self.start_date)
+            if grace_day is not None and message.get("attachments"):
+                author_names.add(message["attachments"][0].get("author_name"))
+                grace_days.add(grace_day)
+
+        attended = self.find_attended(author_names, grace_days)
+        assign_attendance_days(messages, self.time_zone, self.start_date, attended)
+
+        def add_rollups(cursor, saved):
+            # 새로 저장된 메시지는 저장소별 집계에 더하고, 수정된 메시지는 바뀐 만큼만 고침
+            # 저장과 같은 transaction 이라 실패하면 저장도 rollback 되고 writer 가 batch 를 다시 시도함
+            (inserted_messages, updated_messages) = get_saved_messages(messages, saved)
+            add_repo_rollups(cursor, inserted_messages + updated_messages,
+                             [saved["updated"][m["ts"]] for m in updated_messages])
+
+        saved = self.db_tools.upsert_slack_messages(messages, after=add_rollups)
+        (inserted_messages, updated_messages) = get_saved_messages(messages, saved)
+
+        # 대시보드들에 알림
+        try:
+            notify_attendance(self.db_tools,
+                              make_deltas(inserted_messages) + make_deltas(updated_messages, updated=True))
+        except Exception as err:
+            print(err)
+
+        return saved["inserted"]
+
+    # github 봇으로 모은 slack message 들을 저장 대기 큐에 넣음. 큐에 넣은 메시지 수 반환
+    # slack_messages 저장은 IngestWriter 가 batch 로 함
     def collect_slack_messages(self, oldest, latest):
 
-        response = self.slack_client.conversations_history(
-            channel=self.channel_id,
+        slack_tools = self.get_slack_tools()
+        response = slack_tools.get_slack_client().conversations_history(
+            channel=slack_tools.get_channel_id(),
             latest=str(latest),
             oldest=str(oldest),
             count=1000
         )
 
-        import json
-        
-        for message in response["messages"]:
-            message["ts_for_db"] = datetime.fromtimestamp(float(message["ts"]))
-            # pprint.pprint(message)
-
-            try:
-                # PostgreSQL에 메시지 삽입
-                insert_query = """
-                    INSERT INTO slack_messages (ts, ts_for_db, bot_id, type, text, "user", team, bot_profile, attachments)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (ts) DO NOTHING
-                """
-                
-                params = (
-                    message.get('ts'),
-                    message.get('ts_for_db'),
-                    message.get('bot_id'),
-                    message.get('type'),
-                    message.get('text'),
-                    message.get('user'),
-                    message.get('team'),
-                    json.dumps(message.get('bot_profile')) if message.get('bot_profile') else None,
-                    json.dumps(message.get('attachments')) if message.get('attachments') else None
-                )
-                
-                self.db_tools.execute_query(insert_query, params, fetch_all=False)
-            except Exception as err:
-                print(err)
-                continue
+        messages = response["messages"]
+        self.get_ingest_queue().put(messages)
+        return len(messages)
 
     """
     db 에 수집한 slack 메시지 삭제
+    row 단위 DELETE 대신 TRUNCATE. 시즌 하나만 지울 때는 cli_partitions.py drop
+    수정된 메시지는 다시 수집하면 반영되므로 그 때문에 지울 필요는 없음
     """
     def remove_all_slack_messages(self):
-        delete_query = "DELETE FROM slack_messages"
-        self.db_tools.execute_query(delete_query, fetch_all=False)
+        self.db_tools.execute_query("TRUNCATE slack_messages", fetch_all=False)
 
     """
     특정일의 출석 데이터 불러오기
     @param selected_date
     """
     def get_attendance(self, selected_date):
-        attend_dict = {}
+        # 이전 시즌 날짜면 보관 파일에서 읽음
+        if selected_date < self.start_date:
+            archived_season = self.get_season_archive().find_season(selected_date)
+            if archived_season is not None:
+                return archived_season.get_attendance(selected_date)
 
-        # get all users attendance info
-        for user in self.users:
-            attends = self.find_attendance_by_user(user)
-            attend_dict[user] = attends
+        first_commits = self.find_first_commits(selected_date)
 
-        result = {}
         result_attendance = []
-
-        # make users - dates - first_ts
-        for user in attend_dict:
-            if user not in result:
-                result[user] = {}
-
-            result[user][selected_date] = None
-
-            if selected_date in attend_dict[user]:
-                result[user][selected_date] = attend_dict[user][selected_date][0]["ts"]
-
-            result_attendance.append({"user": user, "first_ts": result[user][selected_date]})
+        for user in self.users:
+            result_attendance.append({"user": user, "first_ts": first_commits[user].get(selected_date)})
 
         return result_attendance
 
+    # 오늘 미출석자들에게 알림. 알린 인원 수 반환
     def send_no_show_message(self):
         members = self.get_users_with_slackname()
-        today = datetime.today().date()
+        today = datetime.now(self.time_zone).date()
 
         message = "[미출석자 알람]\n"
+        no_shows = 0
         results = self.get_attendance(today)
         for result in results:
             if result["first_ts"] is None:
                 message += "@%s " % members[result["user"]]["slack"]
+                no_shows += 1
 
-        self.slack_client.chat_postMessage(
+        self.get_slack_tools().get_slack_client().chat_postMessage(
             channel='#gardening-for-100days',
             text=message,
             link_names=1
         )
+        return no_shows
 
@@ -0,0 +1,203 @@
+import configparser
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+COMMIT_URL_PATTERN = re.compile(r'https://github\.com/([\w.-]+)/([\w.-]+)/commit/([0-9a-f]{7,40})')
+
+
+def parse_commit_url(commit_url):
+    """https://github.com/user/repo/commit/sha -> (user, repo, sha)"""
+    match = COMMIT_URL_PATTERN.match(commit_url.strip())
+    if match is None:
+        raise ValueError("not a github commit url: %s" % commit_url)
+    return match.groups()
+
+
+def extract_commit_urls(text):
+    """텍스트에 포함된 github commit url 들을 순서대로 중복 없이 반환"""
+    if not text:
+        return []
+    urls = ["https://github.com/%s/%s/commit/%s" % groups for groups in COMMIT_URL_PATTERN.findall(text)]
+    return list(dict.fromkeys(urls))
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+class GithubTools:
+    """
+    GitHub commit 조회
+    requests.Session 커넥션 풀을 공유해서 여러 commit 을 동시에 조회하고,
+    sha 단위로 디스크에 캐시한 결과는 ETag 로 조건부 요청합니다. (304 는 rate limit 을 소모하지 않음)
+    """
+
+    def __init__(self, token=None, api_url=None, cache_dir=None, max_workers=None, max_rate_limit_wait=None):
+        config = configparser.ConfigParser()
+        BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+        path = os.path.join(BASE_DIR, 'config.ini')
+        config.read(path)
+        github_config = config['DEFAULT']
+
+        self.token = token if token is not None else github_config.get('GITHUB_TOKEN')
+        self.api_url = (api_url or github_config.get('GITHUB_API_URL', 'https://api.github.com')).rstrip('/')
+        self.cache_dir = cache_dir or github_config.get('GITHUB_CACHE_DIR', os.path.join(BASE_DIR, '.github_cache'))
+        self.max_workers = max_workers or int(github_config.get('GITHUB_MAX_WORKERS', 8))
+        # rate limit 이 풀릴 때 까지 기다리는 최대 시간. 초
+        self.max_rate_limit_wait = max_rate_limit_wait if max_rate_limit_wait is not None \
+            else int(github_config.get('GITHUB_MAX_RATE_LIMIT_WAIT', 60))
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Accept': 'application/vnd.github+json',
+            'User-Agent': 'garden6',
+        })
+        if self.token:
+            self.session.headers['Authorization'] = 'Bearer %s' % self.token
+
+        self.rate_limit_lock = threading.Lock()
+        self.rate_limit_remaining = None
+        self.rate_limit_reset = 0
+
+    def get_cache_path(self, sha):
+        return os.path.join(self.cache_dir, '%s.json' % sha)
+
+    def read_cache(self, sha):
+        try:
+            with open(self.get_cache_path(sha)) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def write_cache(self, sha, etag, data):
+        path = self.get_cache_path(sha)
+        tmp_path = '%s.%d.tmp' % (path, threading.get_ident())
+        with open(tmp_path, 'w') as file:
+            json.dump({"etag": etag, "data": data}, file)
+        os.replace(tmp_path, path)
+
+    def update_rate_limit(self, response):
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+        with self.rate_limit_lock:
+            self.rate_limit_remaining = int(remaining)
+            self.rate_limit_reset = int(reset)
+
+    def wait_for_rate_limit(self):
+        """남은 요청 수가 0 이면 reset 시각까지 기다림. 너무 오래 걸리면 RateLimitExceeded"""
+        with self.rate_limit_lock:
+            if self.rate_limit_remaining is None or self.rate_limit_remaining > 0:
+                return
+            wait = self.rate_limit_reset - time.time()
+
+        if wait <= 0:
+            return
+        if wait > self.max_rate_limit_wait:
+            raise RateLimitExceeded("github rate limit exceeded. reset at %s"
+                                    % datetime.fromtimestamp(self.rate_limit_reset))
+        time.sleep(wait)
+
+    def request_commit(self, user, repo, sha, cached):
+        headers = {}
+        if cached and cached.get("etag"):
+            headers['If-None-Match'] = cached["etag"]
+
+        url = '%s/repos/%s/%s/commits/%s' % (self.api_url, user, repo, sha)
+        for _ in range(2):
+            self.wait_for_rate_limit()
+            response = self.session.get(url, headers=headers, timeout=10)
+            self.update_rate_limit(response)
+
+            # 1차 rate limit 은 X-RateLimit-Remaining: 0, 2차 rate limit 은 Retry-After 로 알려줌
+            if response.status_code in (403, 429):
+                retry_after = response.headers.get('Retry-After')
+                if retry_after is not None and int(retry_after) <= self.max_rate_limit_wait:
+                    time.sleep(int(retry_after))
+                    continue
+                if response.headers.get('X-RateLimit-Remaining') == '0':
+                    continue
+            return response
+        return response
+
+    def get_commit(self, commit_url):
+        (user, repo, sha) = parse_commit_url(commit_url)
+
+        cached = self.read_cache(sha)
+        response = self.request_commit(user, repo, sha, cached)
+
+        if response.status_code == 304:
+            data = cached["data"]
+        else:
+            response.raise_for_status()
+            data = response.json()
+            self.write_cache(sha, response.headers.get('ETag'), data)
+
+        ts_datetime = datetime.strptime(data["commit"]["author"]["date"].replace("Z", "+0000"), "%Y-%m-%dT%H:%M:%S%z")
+        return {
+            "url": commit_url,
+            "user": user,
+            "repo": repo,
+            "ts": str(ts_datetime.timestamp()),
+            "ts_datetime": ts_datetime,
+            "sha": data.get("sha", sha),
+            "sha_short": data.get("sha", sha)[:8],
+            "message": data["commit"]["message"],
+        }
+
+    def get_commits(self, commit_urls):
+        """
+        여러 commit 을 동시에 조회
+        @return (commits, errors) commits 는 입력 순서대로, errors 는 [(url, exception)]
+        """
+        commit_urls = list(dict.fromkeys(commit_urls))
+
+        def fetch(commit_url):
+            try:
+                return commit_url, self.get_commit(commit_url), None
+            except Exception as err:
+                return commit_url, None, err
+
+        commits = []
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for (commit_url, commit, err) in executor.map(fetch, commit_urls):
+                if err is None:
+                    commits.append(commit)
+                else:
+                    errors.append((commit_url, err))
+        return commits, errors
+
+    @staticmethod
+    def to_slack_message(commit, inserted_by, user_id=None):
+        """수동 등록용 slack_messages 형태로 변환. GitHub bot 메시지와 같이 attachments[0] 에 author_name, text 를 넣음"""
+        text = '*manual insert %s by %s*\n<%s|`%s`> - %s' % (
+            commit["ts_datetime"].strftime("%Y-%m-%d"), inserted_by, commit["url"], commit["sha_short"], commit["message"])
+
+        (owner, repo, _) = parse_commit_url(commit["url"])
+        return {
+            'attachments': [{
+                'author_name': commit["user"],
+                'text': text,
+                'footer': '<https://github.com/%s/%s|%s/%s>' % (owner, repo, owner, repo)
+            }],
+            'ts': commit["ts"],
+            'ts_for_db': commit["ts_datetime"],
+            'type': 'message',
+            'user': user_id,
+        }
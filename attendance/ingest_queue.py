@@ -0,0 +1,145 @@
+import configparser
+import json
+import os
+import sqlite3
+import time
+
+
+class IngestQueue:
+    """
+    수집한 slack 메시지를 Postgres 에 넣기 전에 쌓아두는 로컬 큐
+    SQLite WAL 파일이라 프로세스가 죽어도 남아있고, 여러 프로세스가 같이 써도 됩니다.
+    claim 으로 꺼낸 메시지는 lease 시간 동안 다른 writer 가 가져가지 않고, 저장에 성공한 뒤 ack 해야 지워집니다.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            config = configparser.ConfigParser()
+            BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+            config.read(os.path.join(BASE_DIR, 'config.ini'))
+            path = config['DEFAULT'].get('INGEST_QUEUE_PATH', os.path.join(BASE_DIR, 'ingest_queue.sqlite3'))
+
+        self.path = path
+
+        conn = self.connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    ts TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    enqueued_at REAL NOT NULL,
+                    leased_until REAL
+                )
+            """)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(messages)")]
+            if "leased_until" not in columns:
+                conn.execute("ALTER TABLE messages ADD COLUMN leased_until REAL")
+            # 계속 저장에 실패하는 메시지. 큐 전체가 막히지 않도록 따로 빼둠
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dead_messages (
+                    id INTEGER PRIMARY KEY,
+                    ts TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    enqueued_at REAL NOT NULL,
+                    error TEXT,
+                    buried_at REAL NOT NULL
+                )
+            """)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        # WAL 에서는 NORMAL 이어도 커밋된 데이터는 프로세스가 죽어도 남음
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def put(self, messages):
+        """메시지들을 큐에 추가. 바로 반환"""
+        now = time.time()
+        rows = [(message["ts"], json.dumps(message, default=str), now) for message in messages]
+
+        conn = self.connect()
+        try:
+            with conn:
+                conn.executemany("INSERT INTO messages (ts, payload, enqueued_at) VALUES (?, ?, ?)", rows)
+        finally:
+            conn.close()
+
+    def claim(self, limit, lease=60):
+        """
+        오래된 순서로 최대 limit 개를 lease 초 동안 가져감. [(id, message)]
+        writer 가 여러개(웹 프로세스마다) 있어도 같은 메시지를 동시에 저장하지 않음
+        """
+        now = time.time()
+        conn = self.connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute("""
+                SELECT id, payload FROM messages
+                WHERE leased_until IS NULL OR leased_until < ?
+                ORDER BY id LIMIT ?
+            """, (now, limit)).fetchall()
+            conn.executemany("UPDATE messages SET leased_until = ? WHERE id = ?",
+                             [(now + lease, row_id) for (row_id, _) in rows])
+            conn.commit()
+        finally:
+            conn.close()
+        return [(row_id, json.loads(payload)) for (row_id, payload) in rows]
+
+    def release(self, ids):
+        """저장에 실패한 메시지들을 다시 가져갈 수 있게 함"""
+        if not ids:
+            return
+        conn = self.connect()
+        try:
+            with conn:
+                conn.executemany("UPDATE messages SET leased_until = NULL WHERE id = ?", [(row_id,) for row_id in ids])
+        finally:
+            conn.close()
+
+    def ack(self, ids):
+        """저장이 끝난 메시지들 삭제"""
+        if not ids:
+            return
+        conn = self.connect()
+        try:
+            with conn:
+                conn.executemany("DELETE FROM messages WHERE id = ?", [(row_id,) for row_id in ids])
+        finally:
+            conn.close()
+
+    def bury(self, ids, error):
+        """저장할 수 없는 메시지들을 dead_messages 로 옮김"""
+        if not ids:
+            return
+        conn = self.connect()
+        try:
+            with conn:
+                for row_id in ids:
+                    conn.execute("""
+                        INSERT INTO dead_messages (id, ts, payload, enqueued_at, error, buried_at)
+                        SELECT id, ts, payload, enqueued_at, ?, ? FROM messages WHERE id = ?
+                    """, (str(error), time.time(), row_id))
+                    conn.execute("DELETE FROM messages WHERE id = ?", (row_id,))
+        finally:
+            conn.close()
+
+    def depth(self):
+        """(남은 메시지 수, 가장 오래된 메시지가 기다린 시간(초))"""
+        conn = self.connect()
+        try:
+            (count, oldest) = conn.execute("SELECT COUNT(*), MIN(enqueued_at) FROM messages").fetchone()
+        finally:
+            conn.close()
+        return count, (time.time() - oldest if oldest is not None else 0)
+
+    def dead_depth(self):
+        conn = self.connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM dead_messages").fetchone()[0]
+        finally:
+            conn.close()
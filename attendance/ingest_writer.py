@@ -0,0 +1,179 @@
+import threading
+import time
+from collections import deque
+
+
+class IngestWriter:
+    """
+    IngestQueue 에 쌓인 메시지들을 batch 로 꺼내서 slack_messages 에 저장
+    max_batch_size 만큼 모이거나 가장 오래된 메시지가 max_batch_wait 초를 기다리면 저장합니다.
+    실패하면 backoff 후 다시 시도하고, max_attempts 번 실패한 batch 는 한건씩 나눠서 저장할 수 없는 메시지만 버립니다.
+    """
+
+    def __init__(self, queue=None, garden=None, max_batch_size=500, max_batch_wait=1.0,
+                 max_attempts=5, max_backoff=60):
+        if queue is None:
+            from attendance.ingest_queue import IngestQueue
+            queue = IngestQueue()
+
+        self.queue = queue
+        self.garden = garden
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait = max_batch_wait
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+
+        self.thread = None
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+        # 통계
+        self.flushed_batches = 0
+        self.flushed_messages = 0
+        self.failed_flushes = 0
+        self.dead_messages = 0
+        self.last_flush_at = None
+        self.flush_latencies = deque(maxlen=100)
+
+    def get_garden(self):
+        if self.garden is None:
+            from attendance.garden import Garden
+            self.garden = Garden()
+        return self.garden
+
+    def save(self, rows):
+        # Slack 재전송, polling 수집기와 겹친 메시지는 ts 기준으로 하나만
+        messages = list({message["ts"]: message for (_, message) in rows}.values())
+        self.get_garden().save_slack_messages(messages)
+
+    def drain_once(self):
+        """batch 하나 저장. 저장한 메시지 수 반환. 실패하면 ack 하지 않아서 다음에 다시 시도됨"""
+        with self.lock:
+            rows = self.queue.claim(self.max_batch_size)
+            if not rows:
+                return 0
+
+            started = time.monotonic()
+            try:
+                self.save(rows)
+            except Exception:
+                self.failed_flushes += 1
+                self.queue.release([row_id for (row_id, _) in rows])
+                raise
+
+            self.queue.ack([row_id for (row_id, _) in rows])
+
+            self.flush_latencies.append(time.monotonic() - started)
+            self.flushed_batches += 1
+            self.flushed_messages += len(rows)
+            self.last_flush_at = time.time()
+            return len(rows)
+
+    def bury_failing(self):
+        """
+        맨 앞 batch 를 한건씩 저장해 보고 실패하는 메시지는 dead_messages 로 옮김
+        전부 실패하면 DB 장애로 보고 버리지 않음
+        """
+        with self.lock:
+            failed = []
+            saved = 0
+            for row in self.queue.claim(self.max_batch_size):
+                try:
+                    self.save([row])
+                    self.queue.ack([row[0]])
+                    saved += 1
+                except Exception as err:
+                    failed.append((row[0], err))
+
+            if saved == 0:
+                self.queue.release([row_id for (row_id, _) in failed])
+                return
+
+            for (row_id, err) in failed:
+                print(err)
+                self.queue.bury([row_id], err)
+                self.dead_messages += 1
+
+    def drain(self):
+        """큐가 빌 때 까지 저장"""
+        total = 0
+        while True:
+            count = self.drain_once()
+            total += count
+            if count < self.max_batch_size:
+                return total
+
+    def is_batch_ready(self):
+        (depth, oldest_age) = self.queue.depth()
+        return depth >= self.max_batch_size or (depth > 0 and oldest_age >= self.max_batch_wait)
+
+    def run(self, poll_interval=0.2):
+        """stop() 할 때 까지 batch 조건이 되면 저장. 실패하면 backoff 후 재시도"""
+        attempts = 0
+        while not self.stopped.is_set():
+            try:
+                if not self.is_batch_ready():
+                    self.stopped.wait(poll_interval)
+                    continue
+
+                self.drain_once()
+                attempts = 0
+            except Exception as err:
+                print(err)
+                attempts += 1
+                if attempts % self.max_attempts == 0:
+                    try:
+                        self.bury_failing()
+                    except Exception as bury_err:
+                        print(bury_err)
+                self.stopped.wait(min(self.max_backoff, 2 ** attempts))
+
+    def start(self):
+        """백그라운드 스레드로 실행"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name="ingest-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def get_stats(self):
+        (depth, oldest_age) = self.queue.depth()
+        latencies = sorted(self.flush_latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 1)
+
+        return {
+            "queue_depth": depth,
+            "queue_oldest_age_seconds": round(oldest_age, 1),
+            "dead_messages": self.queue.dead_depth(),
+            "flushed_batches": self.flushed_batches,
+            "flushed_messages": self.flushed_messages,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_at": self.last_flush_at,
+            "last_flush_latency_ms": round(self.flush_latencies[-1] * 1000, 1) if self.flush_latencies else None,
+            "flush_latency_p50_ms": percentile(0.5),
+            "flush_latency_p99_ms": percentile(0.99),
+        }
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_ingest_writer():
+    """프로세스 단위로 공유하는 IngestWriter. 처음 호출할 때 백그라운드 스레드 시작"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = IngestWriter()
+                _writer.start()
+    return _writer
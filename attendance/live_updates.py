@@ -0,0 +1,149 @@
+"""
+실시간 출석 업데이트
+
+수집기(cron, collect view 등 어느 프로세스든)가 새 출석을 저장하면 Postgres NOTIFY 로 알리고,
+웹 프로세스마다 하나의 LISTEN 연결이 받아서 접속 중인 브라우저(SSE)들에게 나눠 줍니다.
+"""
+import asyncio
+import json
+import select
+import threading
+import time
+
+CHANNEL = "attendance_updates"
+
+# NOTIFY payload 는 8000 bytes 제한이 있어서 나눠서 보냄
+MAX_DELTAS_PER_NOTIFY = 50
+
+
+def make_deltas(messages, updated=False):
+    """
+    저장된 메시지들 -> [{user, date, ts}] 출석 변경분
+    updated 면 수정된 메시지. 출석은 그대로이고 커밋 메시지만 바뀌었으므로 "updated": true 를 붙임
+    """
+    deltas = []
+    for message in messages:
+        if message.get("attendance_day") is None or not message.get("attachments"):
+            continue
+        delta = {
+            "user": message["attachments"][0]["author_name"],
+            "date": message["attendance_day"].strftime("%Y-%m-%d"),
+            "ts": message["ts_for_db"],
+        }
+        if updated:
+            delta["updated"] = True
+        deltas.append(delta)
+    return deltas
+
+
+def notify_attendance(db_tools, deltas):
+    """출석 변경분을 NOTIFY 로 알림"""
+    if not deltas:
+        return
+    # django serializer 는 import 가 무거워서 보낼 것이 있을 때만 import (cli_collect.py 는 django 없이 실행됨)
+    from django.core.serializers.json import DjangoJSONEncoder
+
+    for i in range(0, len(deltas), MAX_DELTAS_PER_NOTIFY):
+        payload = json.dumps(deltas[i:i + MAX_DELTAS_PER_NOTIFY], cls=DjangoJSONEncoder)
+        db_tools.execute_query("SELECT pg_notify(%s, %s)", (CHANNEL, payload), fetch_all=False)
+
+
+class AttendanceBroadcaster:
+    """
+    프로세스 안의 pub/sub
+    구독자마다 asyncio.Queue 를 하나씩 주고, LISTEN 스레드에서 받은 변경분을 모든 큐에 넣어줌
+    메모리 인덱스 같이 큐가 필요 없는 구독자는 callback 으로 LISTEN 스레드에서 바로 호출
+    """
+
+    def __init__(self, db_tools=None, queue_size=100):
+        self.db_tools = db_tools
+        self.queue_size = queue_size
+        self.subscribers = {}
+        self.callbacks = []
+        self.lock = threading.Lock()
+        self.listener = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.subscribers[queue] = asyncio.get_running_loop()
+        self.start_listener()
+        return queue
+
+    def add_callback(self, callback):
+        with self.lock:
+            self.callbacks.append(callback)
+        self.start_listener()
+
+    def unsubscribe(self, queue):
+        with self.lock:
+            self.subscribers.pop(queue, None)
+
+    def publish(self, deltas):
+        with self.lock:
+            subscribers = list(self.subscribers.items())
+            callbacks = list(self.callbacks)
+
+        for callback in callbacks:
+            try:
+                callback(deltas)
+            except Exception as err:
+                print(err)
+
+        for (queue, loop) in subscribers:
+            loop.call_soon_threadsafe(self.put, queue, deltas)
+
+    @staticmethod
+    def put(queue, deltas):
+        # 느린 브라우저 때문에 메모리가 쌓이지 않도록 가득 차면 버림
+        if not queue.full():
+            queue.put_nowait(deltas)
+
+    def start_listener(self):
+        with self.lock:
+            if self.listener is not None and self.listener.is_alive():
+                return
+            self.listener = threading.Thread(target=self.listen, name="attendance-listener", daemon=True)
+            self.listener.start()
+
+    def get_db_tools(self):
+        if self.db_tools is None:
+            from attendance.db_tools import DBTools
+            self.db_tools = DBTools()
+        return self.db_tools
+
+    def listen(self):
+        """LISTEN 연결 유지. 연결이 끊기면 닫고 잠시 후 다시 연결"""
+        while True:
+            conn = None
+            try:
+                conn = self.get_db_tools().connect_db()
+                conn.autocommit = True
+                cursor = conn.cursor()
+                cursor.execute("LISTEN %s" % CHANNEL)
+
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self.handle_notify(conn.notifies.pop(0))
+            except Exception as err:
+                print(err)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception as err:
+                        print(err)
+            time.sleep(5)
+
+    def handle_notify(self, notify):
+        # payload 하나가 잘못되어도 연결은 그대로 둠
+        try:
+            self.publish(json.loads(notify.payload))
+        except Exception as err:
+            print(err)
+
+
+broadcaster = AttendanceBroadcaster()
@@ -1,91 +1,82 @@
+"""
+누락된 커밋 수동 등록
+
+e.g.)
+python attendance/manual_insert.py https://github.com/itsnamgyu/TIW/commit/f3d807901dc16d1c049dc14c02c1916234af8abc
+python attendance/manual_insert.py --file commit_urls.txt
+python attendance/manual_insert.py --from-messages 2021-01-18 2021-01-25
+"""
+import argparse
+import sys
 from datetime import datetime
-from garden import Garden
-import pprint
-import requests
-import json
-from urllib.parse import urlparse
-
-garden = Garden()
-db_tools = garden.db_tools
-
-def get_commit(commit_url):
-    parse_result = urlparse(commit_url)
-    # print(parse_result)
-    (_, user, repo, commit, sha) = parse_result.path.split("/")
-
-    api_url = 'https://api.github.com/repos/%s/%s/commits/%s' % (user, repo, sha)
-
-    r = requests.get(api_url)
-
-    # print(r.json())
-    ts_datetime = datetime.strptime(r.json()["commit"]["author"]["date"], "%Y-%m-%dT%H:%M:%S%z")
-    message = r.json()["commit"]["message"]
-    ts = str(ts_datetime.timestamp())
-    return {
-        "user": user,
-        "ts": ts,
-        "ts_datetime": ts_datetime,
-        "sha": sha,
-        "sha_short": sha[:8],
-        "message": message,
-        }
-
-# commit_url = 'https://github.com/gintire/TIL/commit/f7c915de5e029270744553ca2b0f88da823e44c5'
-#commit_url = 'https://github.com/gintire/TIL/commit/93a4f58de89830b9cca0f1d554c2fe3656531bc3'
-#commit_url = 'https://github.com/js7483/ddd-study/commit/94e153a2ffa1768c1843f414375616d73c68b93a'
-# commit_url = 'https://github.com/Wealgo/changmin/commit/d6ecda2127ee11d2741bb42258affaf2e803bcb0'
-commit_url = 'https://github.com/itsnamgyu/TIW/commit/f3d807901dc16d1c049dc14c02c1916234af8abc'
-
-commit = get_commit(commit_url)
-# print(commit)
-print(commit["user"])
-print(commit["sha"])
-print(commit["sha_short"])
-print(commit["ts"])
-print(commit["ts_datetime"])
-print(commit["ts_datetime"].strftime("%Y-%m-%d"))
-print(commit["message"])
-
-text = '*manual insert %s by june.kim*\n<%s|`%s`> - %s' % ("2020-04-11", commit_url, commit["sha_short"], commit["message"])
-
-message = {'attachments':
-    [{
-        'author_name': commit["user"],
-        'text': text
-    }],
-    'ts': commit["ts"],
-    'ts_for_db': commit["ts_datetime"],
-    'type': 'message',
-    'user': 'UU9RDT66M'
-}
-
-print(message)
-# exit(-1)
-
-
-try:
-    # PostgreSQL에 데이터 삽입
-    insert_query = """
-        INSERT INTO slack_messages (ts, ts_for_db, bot_id, type, text, "user", team, bot_profile, attachments)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (ts) DO NOTHING
-    """
-    
-    params = (
-        message['ts'],
-        message['ts_for_db'],
-        message.get('bot_id'),
-        message.get('type'),
-        message.get('text'),
-        message.get('user'),
-        message.get('team'),
-        None,  # bot_profile
-        json.dumps(message.get('attachments')) if message.get('attachments') else None
-    )
-    
-    result = db_tools.execute_query(insert_query, params, fetch_all=False)
-    print(f"Inserted {result} rows")
-    print(message)
-except Exception as e:
-    print(e)
 
+from attendance.garden import Garden
+from attendance.github_tools import GithubTools, extract_commit_urls
+from attendance.ingest_writer import IngestWriter
+
+
+def find_commit_urls_in_messages(garden, start, end):
+    """commit text 가 없는(attachments 에 text 가 빠진) 메시지들에서 commit url 추출"""
+    filters = {
+        'ts_for_db_gte': datetime.strptime(start, "%Y-%m-%d"),
+        'ts_for_db_lt': datetime.strptime(end, "%Y-%m-%d"),
+    }
+
+    commit_urls = []
+    for message in garden.db_tools.find_slack_messages(filters=filters, sort_by="ts"):
+        attachments = message["attachments"] if message["attachments"] else []
+        if any("text" in attachment for attachment in attachments):
+            continue
+
+        commit_urls += extract_commit_urls(message["text"])
+        for attachment in attachments:
+            commit_urls += extract_commit_urls(attachment.get("fallback"))
+            commit_urls += extract_commit_urls(attachment.get("pretext"))
+    return commit_urls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="github commit url 로 slack_messages 수동 등록")
+    parser.add_argument("commit_urls", nargs="*", help="github commit url")
+    parser.add_argument("--file", help="commit url 들이 들어있는 파일. - 이면 stdin")
+    parser.add_argument("--from-messages", nargs=2, metavar=("START", "END"),
+                        help="START ~ END(YYYY-MM-DD) 사이 commit text 가 없는 메시지들에서 commit url 추출")
+    parser.add_argument("--by", default="june.kim", help="등록자 이름")
+    parser.add_argument("--user-id", default="UU9RDT66M", help="등록자 slack user id")
+    parser.add_argument("--dry-run", action="store_true", help="조회만 하고 저장하지 않음")
+    args = parser.parse_args()
+
+    garden = Garden()
+
+    commit_urls = list(args.commit_urls)
+    if args.file:
+        file = sys.stdin if args.file == "-" else open(args.file)
+        with file:
+            commit_urls += extract_commit_urls(file.read())
+    if args.from_messages:
+        commit_urls += find_commit_urls_in_messages(garden, *args.from_messages)
+
+    if not commit_urls:
+        parser.error("commit url 이 없습니다")
+
+    github_tools = GithubTools()
+    commits, errors = github_tools.get_commits(commit_urls)
+
+    for (commit_url, err) in errors:
+        print("%s %s" % (commit_url, err))
+
+    messages = [GithubTools.to_slack_message(commit, args.by, args.user_id) for commit in commits]
+    for message in messages:
+        print(message)
+
+    if args.dry_run:
+        return
+
+    # 큐에 넣고 바로 저장. 저장에 실패해도 큐에 남아서 writer 가 다시 시도함
+    garden.get_ingest_queue().put(messages)
+    saved = IngestWriter(garden.get_ingest_queue(), garden).drain()
+    print(f"Saved {saved} messages")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+async view 에서 blocking 작업 실행
+
+psycopg2, slack SDK 는 blocking 이라서 async view 에서는 스레드로 넘겨서 실행합니다.
+작업 종류(lane) 마다 크기가 정해진 스레드 풀을 따로 둡니다.
+
+* db: Postgres 조회. 스레드 수 = POOL_MAX 라서 스레드가 연결을 기다리지 않고, 연결 수도 넘지 않음
+* slack: slack API 호출. 느린 수집이 있어도 db lane 의 대시보드 요청은 영향을 받지 않음
+
+asyncio.to_thread 처럼 contextvar 를 스레드로 넘기고, 프로파일 중인 요청이면 스레드에서도 cProfile 합니다. (attendance/profiling.py)
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from attendance import profiling
+
+SLACK_THREADS = 2
+
+# fork 된 worker 가 부모 프로세스의 스레드 풀을 쓰지 않도록 pid 별로 만듦
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_lane_size(lane):
+    if lane == "db":
+        from attendance.db_tools import DBTools
+        return DBTools().pool_max
+    if lane == "slack":
+        return SLACK_THREADS
+    raise ValueError("unknown lane: %s" % lane)
+
+
+def get_executor(lane):
+    key = (os.getpid(), lane)
+    with _executors_lock:
+        executor = _executors.get(key)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=get_lane_size(lane), thread_name_prefix="offload-%s" % lane)
+            _executors[key] = executor
+    return executor
+
+
+def submit(lane, func, *args, **kwargs):
+    """func 을 lane 의 스레드에서 실행. concurrent.futures.Future 반환"""
+    call = functools.partial(func, *args, **kwargs)
+    profile = profiling.get_current()
+    if profile is not None:
+        call = functools.partial(profile.run, call)
+    return get_executor(lane).submit(contextvars.copy_context().run, call)
+
+
+async def run_in_lane(lane, func, *args, **kwargs):
+    """func 을 lane 의 스레드에서 실행하고 결과를 기다림. 스레드가 모두 바쁘면 순서대로 기다림"""
+    return await asyncio.wrap_future(submit(lane, func, *args, **kwargs))
+
+
+async def run_db(func, *args, **kwargs):
+    return await run_in_lane("db", func, *args, **kwargs)
+
+
+async def run_slack(func, *args, **kwargs):
+    return await run_in_lane("slack", func, *args, **kwargs)
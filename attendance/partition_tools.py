@@ -0,0 +1,124 @@
+"""
+slack_messages 시즌 파티션 관리
+
+시즌마다 ts_for_db 범위 [START_DATE 0시, 마지막 날 다음날 새벽 2시) 파티션을 하나씩 만듭니다.
+파티션 이름은 slack_messages_s<START_DATE> 입니다. e.g.) slack_messages_s20210118
+"""
+from datetime import timedelta
+
+from psycopg2 import sql
+
+from attendance.attendance_day import to_ts_for_db_range
+
+DEFAULT_PARTITION = "slack_messages_default"
+
+
+def get_partition_name(start_date):
+    return "slack_messages_s%s" % start_date.strftime("%Y%m%d")
+
+
+def get_season_range(start_date, gardening_days):
+    return to_ts_for_db_range(start_date, start_date + timedelta(days=int(gardening_days) - 1))
+
+
+class PartitionTools:
+    def __init__(self, db_tools):
+        self.db_tools = db_tools
+
+    def connect(self):
+        conn = self.db_tools.connect_db()
+        with conn.cursor() as cursor:
+            cursor.execute(f"SET search_path TO {self.db_tools.pg_schema}")
+        return conn
+
+    def list_partitions(self):
+        """[{name, bound, approx_rows, bytes}]"""
+        return self.db_tools.execute_query(
+            """
+            SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound,
+                   c.reltuples::bigint AS approx_rows, pg_total_relation_size(c.oid) AS bytes
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            JOIN pg_namespace n ON n.oid = p.relnamespace
+            WHERE p.relname = 'slack_messages' AND n.nspname = %s
+            ORDER BY c.relname
+            """,
+            (self.db_tools.pg_schema,)
+        )
+
+    def exists(self, name):
+        return any(partition["name"] == name for partition in self.list_partitions())
+
+    def create_season_partition(self, start_date, gardening_days):
+        """
+        시즌 파티션 생성. DEFAULT 파티션에 이미 들어간 해당 시즌 메시지는 새 파티션으로 옮김
+        @return 옮긴 메시지 수. 이미 있으면 None
+        """
+        name = get_partition_name(start_date)
+        if self.exists(name):
+            return None
+        (start, end) = get_season_range(start_date, gardening_days)
+
+        conn = self.connect()
+        try:
+            with conn, conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT column_name FROM information_schema.columns
+                    WHERE table_schema = %s AND table_name = 'slack_messages' AND is_generated = 'NEVER'
+                    ORDER BY ordinal_position
+                    """,
+                    (self.db_tools.pg_schema,)
+                )
+                columns = sql.SQL(", ").join(sql.Identifier(row[0]) for row in cursor.fetchall())
+
+                # DEFAULT 파티션에 범위에 해당하는 row 가 있으면 파티션을 만들 수 없어서 잠시 떼어냄
+                cursor.execute(sql.SQL("ALTER TABLE slack_messages DETACH PARTITION {}").format(
+                    sql.Identifier(DEFAULT_PARTITION)))
+                cursor.execute(sql.SQL("CREATE TABLE {} PARTITION OF slack_messages FOR VALUES FROM (%s) TO (%s)").format(
+                    sql.Identifier(name)), (start, end))
+                cursor.execute(sql.SQL(
+                    "INSERT INTO slack_messages ({columns}) SELECT {columns} FROM {default} "
+                    "WHERE ts_for_db >= %s AND ts_for_db < %s").format(
+                    columns=columns, default=sql.Identifier(DEFAULT_PARTITION)), (start, end))
+                moved = cursor.rowcount
+                cursor.execute(sql.SQL("DELETE FROM {} WHERE ts_for_db >= %s AND ts_for_db < %s").format(
+                    sql.Identifier(DEFAULT_PARTITION)), (start, end))
+                cursor.execute(sql.SQL("ALTER TABLE slack_messages ATTACH PARTITION {} DEFAULT").format(
+                    sql.Identifier(DEFAULT_PARTITION)))
+        finally:
+            conn.close()
+        return moved
+
+    def detach_season_partition(self, start_date):
+        """
+        시즌 파티션을 slack_messages 에서 떼어냄. 조회/수집 대상에서 바로 빠지고 테이블은 그대로 남음 (보관, 백업용)
+        @return 떼어낸 테이블 이름
+        """
+        name = get_partition_name(start_date)
+        conn = self.connect()
+        try:
+            with conn, conn.cursor() as cursor:
+                cursor.execute(sql.SQL("ALTER TABLE slack_messages DETACH PARTITION {}").format(sql.Identifier(name)))
+        finally:
+            conn.close()
+        return name
+
+    def drop_season_partition(self, start_date, gardening_days, drop_rollups=True):
+        """시즌 파티션(drop_rollups 이면 해당 시즌 저장소별 집계도)을 지움. row 단위 DELETE 없이 테이블째 삭제"""
+        name = get_partition_name(start_date)
+        last_day = start_date + timedelta(days=int(gardening_days) - 1)
+
+        conn = self.connect()
+        try:
+            with conn, conn.cursor() as cursor:
+                if self.exists(name):
+                    cursor.execute(sql.SQL("ALTER TABLE slack_messages DETACH PARTITION {}").format(sql.Identifier(name)))
+                cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(name)))
+                if drop_rollups:
+                    cursor.execute("DELETE FROM repo_daily_commits WHERE attendance_day BETWEEN %s AND %s",
+                                   (start_date, last_day))
+        finally:
+            conn.close()
+        return name
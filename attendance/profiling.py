@@ -0,0 +1,158 @@
+"""
+요청 단위 프로파일
+
+staff 가 ?_profile=1 로 요청하면 tools.profiler.ProfilerMiddleware 가 RequestProfile 을 만들어서 contextvar 에 넣고,
+그 요청이 실행한 SQL, DBTools 호출 시간, slack markdown 변환 시간, cProfile 결과를 모읍니다.
+프로파일 중이 아닌 요청은 contextvar 를 한번 확인만 하고 그대로 실행합니다.
+
+async view 가 offload 로 넘긴 작업은 lane 스레드에서 따로 cProfile 하고 합칩니다. (offload.submit)
+"""
+import contextvars
+import functools
+import io
+import threading
+import time
+
+# 요청 하나에서 저장하는 SQL 수. 넘으면 개수만 셈
+MAX_SQL = 500
+MAX_QUERY_LENGTH = 2000
+
+_current = contextvars.ContextVar("request_profile", default=None)
+
+
+def get_current():
+    """지금 요청의 RequestProfile. 프로파일 중이 아니면 None"""
+    return _current.get()
+
+
+def activate(profile):
+    return _current.set(profile)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+class RequestProfile:
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.status = None
+
+        self.lock = threading.Lock()
+        self.sql = []
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.calls = {}  # 이름 -> {"count", "ms"}
+        self.stats = None
+
+    def add_sql(self, query, ms, rows):
+        if isinstance(query, bytes):
+            query = query.decode("utf-8", "replace")
+        query = " ".join(str(query).split())
+        with self.lock:
+            self.sql_count += 1
+            self.sql_ms += ms
+            if len(self.sql) < MAX_SQL:
+                self.sql.append({"query": query[:MAX_QUERY_LENGTH], "ms": round(ms, 2), "rows": rows,
+                                 "thread": threading.current_thread().name})
+
+    def add_call(self, name, ms):
+        with self.lock:
+            call = self.calls.setdefault(name, {"count": 0, "ms": 0.0})
+            call["count"] += 1
+            call["ms"] += ms
+
+    def run(self, func, *args, **kwargs):
+        """func 을 이 스레드에서 cProfile 하면서 실행하고 결과를 합침"""
+        import cProfile
+        import pstats
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 다른 profiler 가 이미 켜져 있음 (python 3.12+ 는 프로세스에 하나)
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            with self.lock:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profiler)
+                else:
+                    self.stats.add(profiler)
+
+    def finish(self, status):
+        self.elapsed = time.perf_counter() - self.started
+        self.status = status
+
+    def get_stats_text(self, sort="cumulative", limit=60):
+        if self.stats is None:
+            return ""
+        import pstats
+
+        stream = io.StringIO()
+        with self.lock:
+            stats = pstats.Stats(stream=stream)
+            stats.add(self.stats)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def to_dict(self):
+        calls = [{"name": name, "count": call["count"], "ms": round(call["ms"], 2)}
+                 for (name, call) in self.calls.items()]
+        return {
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at,
+            "ms": round(self.elapsed * 1000, 2) if self.elapsed is not None else None,
+            "status": self.status,
+            "sql_count": self.sql_count,
+            "sql_ms": round(self.sql_ms, 2),
+            "sql": self.sql,
+            "calls": sorted(calls, key=lambda call: call["ms"], reverse=True),
+            "stats": self.get_stats_text(),
+        }
+
+
+def profiled(name):
+    """프로파일 중인 요청이면 호출 시간을 name 으로 기록. generator 에는 쓰지 않음"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = _current.get()
+            if profile is None:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.add_call(name, (time.perf_counter() - started) * 1000)
+        return wrapper
+    return decorator
+
+
+class ProfilingCursor:
+    """cursor.execute 마다 SQL 과 시간을 기록. 나머지는 원래 cursor 그대로"""
+
+    def __init__(self, cursor, profile):
+        self.cursor = cursor
+        self.profile = profile
+
+    def execute(self, query, params=None):
+        started = time.perf_counter()
+        try:
+            return self.cursor.execute(query, params)
+        finally:
+            self.profile.add_sql(query, (time.perf_counter() - started) * 1000, self.cursor.rowcount)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
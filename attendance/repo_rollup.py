@@ -0,0 +1,108 @@
+"""
+저장소별 커밋 집계
+
+GitHub bot attachment 의 footer(<https://github.com/junho85/TIL|junho85/TIL>) 에서 저장소를 꺼내서
+(저장소, 출석일, 작성자) 별 커밋 수를 repo_daily_commits 에 누적합니다.
+수집할 때 새로 저장된 메시지만 더하므로 attachments 를 펼쳐서 전체를 다시 셀 필요가 없습니다.
+"""
+import re
+from collections import Counter
+
+from attendance.advisory_lock import get_lock_key
+from attendance.attendance_day import to_ts_for_db_range
+from attendance.db_tools import INGEST_LOCK
+from attendance.github_tools import extract_commit_urls
+
+FOOTER_PATTERN = re.compile(r"<https?://[^|>]+\|([^>]+)>")
+# footer 가 없는 예전 메시지는 fallback 의 [junho85/TIL] 에서 꺼냄
+FALLBACK_PATTERN = re.compile(r"^\[([\w.-]+/[\w.-]+)[\]:]")
+
+
+def get_repository(attachment):
+    match = FOOTER_PATTERN.search(attachment.get("footer") or "")
+    if match:
+        return match.group(1)
+    match = FALLBACK_PATTERN.search(attachment.get("fallback") or "")
+    if match:
+        return match.group(1)
+    return None
+
+
+def count_repo_commits(messages):
+    """메시지들 -> Counter{(저장소, 출석일, 작성자): 커밋 수}. 출석일이 없는 메시지는 제외"""
+    counts = Counter()
+    for message in messages:
+        if message.get("attendance_day") is None:
+            continue
+        for attachment in message.get("attachments") or []:
+            if "text" not in attachment:
+                continue
+            repository = get_repository(attachment)
+            author_name = attachment.get("author_name")
+            if repository is None or author_name is None:
+                continue
+            # push 하나에 커밋이 여러개일 수 있음. commit url 이 없으면 1개로 봄
+            commits = len(extract_commit_urls(attachment["text"])) or 1
+            counts[(repository, message["attendance_day"], author_name)] += commits
+    return counts
+
+
+def write_counts(cursor, counts):
+    """Counter{(저장소, 출석일, 작성자): 커밋 수} 를 repo_daily_commits 에 더함. row 수와 상관없이 한번에 보내도록 컬럼별 배열을 unnest"""
+    if not counts:
+        return
+    (repositories, attendance_days, author_names) = zip(*counts)
+    cursor.execute(
+        """
+        INSERT INTO repo_daily_commits (repository, attendance_day, author_name, commits)
+        SELECT * FROM unnest(%s::varchar[], %s::date[], %s::varchar[], %s::int[])
+        ON CONFLICT (repository, attendance_day, author_name)
+        DO UPDATE SET commits = repo_daily_commits.commits + EXCLUDED.commits
+        """,
+        (list(repositories), list(attendance_days), list(author_names), list(counts.values()))
+    )
+
+
+def add_repo_rollups(cursor, messages, removed_messages=()):
+    """
+    새로 저장된 메시지들의 커밋 수를 repo_daily_commits 에 더함
+    수정된 메시지는 고치기 전 메시지를 removed_messages 로 넘겨서 그 커밋 수를 뺌
+    메시지를 저장한 transaction 의 cursor 로 실행해서 저장과 집계가 같이 commit 되거나 같이 rollback 됨
+    """
+    counts = count_repo_commits(messages)
+    counts.subtract(count_repo_commits(removed_messages))
+    write_counts(cursor, {key: commits for (key, commits) in counts.items() if commits != 0})
+
+
+def rebuild_repo_rollups(db_tools, from_day, to_day):
+    """
+    from_day ~ to_day 출석일의 repo_daily_commits 를 slack_messages 로 다시 계산
+    보관한 시즌(cli_archive_season.py)은 메시지가 DB 에 없고 집계만 남아 있으므로 기간 밖은 건드리지 않음
+    @return (집계 row 수, 커밋 수)
+    """
+    from psycopg2.extras import RealDictCursor
+
+    counts = Counter()
+    with db_tools.pooled_cursor() as (conn, cursor):
+        # 메시지를 저장하면서 집계를 더하는 writer 들(DBTools.upsert_slack_messages)과 같은 lock
+        # 진행 중인 저장이 commit 될 때까지 기다렸다가 읽고, 다시 계산하는 동안 writer 는 기다림. commit 할 때 풀림
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (get_lock_key(INGEST_LOCK),))
+
+        # server-side cursor 로 조금씩 읽어서 집계만 메모리에 들고 있음
+        with conn.cursor(name="rebuild_repo_rollups", cursor_factory=RealDictCursor) as messages:
+            messages.itersize = 2000
+            messages.execute(
+                """
+                SELECT attendance_day, attachments FROM slack_messages
+                WHERE attendance_day BETWEEN %s AND %s AND ts_for_db >= %s AND ts_for_db < %s
+                """,
+                (from_day, to_day) + to_ts_for_db_range(from_day, to_day)
+            )
+            for message in messages:
+                counts.update(count_repo_commits([message]))
+
+        # 다시 계산하는 동안 API 가 빈 집계를 보지 않도록 한 트랜잭션에서 교체
+        cursor.execute("DELETE FROM repo_daily_commits WHERE attendance_day BETWEEN %s AND %s", (from_day, to_day))
+        write_counts(cursor, counts)
+
+    return len(counts), sum(counts.values())
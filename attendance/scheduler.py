@@ -0,0 +1,264 @@
+"""
+예약 작업
+
+외부 cron 대신 웹 프로세스(또는 cli_scheduler.py) 안에서 수집(collect), 미출석 알림(notify), 저장소별 집계 재계산(rollup)을 실행합니다.
+
+* 작업마다 이름과 같은 Postgres advisory lock 을 잡고 실행하므로 worker, 서버가 여러개여도 한 곳에서만 실행됩니다.
+  collect 는 cli_collect.py, /attendance/collect/ 와 같은 lock 입니다.
+* 실행 예정 시각(slot) 마다 job_runs 에 한 row 씩 남기고, 이미 실행된 slot 은 다른 프로세스가 다시 실행하지 않습니다.
+* 서버가 멈춰 있는 동안 놓친 실행들은 한번으로 합쳐서 실행하고 missed_runs 에 합친 수를 남깁니다.
+* worker 들이 동시에 lock 을 시도하지 않도록 slot 마다 0 ~ JITTER 초 늦게 시작합니다.
+
+config.ini
+[SCHEDULER]
+ENABLED = true
+COLLECT_INTERVAL = 3600
+"""
+import configparser
+import json
+import os
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+class Job:
+    """
+    interval 초 마다 실행. TIME_ZONE 기준 0시 + offset 초에 맞춤
+    e.g.) 매일 22시 Job("notify", func, 86400, 22 * 3600), 매시 5분 Job("collect", func, 3600, 300)
+    max_delay 가 있으면 예정 시각보다 max_delay 초 넘게 늦은 실행은 하지 않음 (밤 늦은 미출석 알림 등)
+    func 은 {"rows": 처리한 수, ...} 를 반환. 나머지 값은 job_runs.detail 에 저장
+    """
+
+    def __init__(self, name, func, interval, offset=0, max_delay=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.offset = offset
+        self.max_delay = max_delay
+
+    def get_slot(self, now):
+        """now 이전 가장 최근 실행 예정 시각. now 는 TIME_ZONE 기준 naive datetime"""
+        midnight = datetime(now.year, now.month, now.day)
+        elapsed = (now - midnight).total_seconds() - self.offset
+        return midnight + timedelta(seconds=self.offset + (elapsed // self.interval) * self.interval)
+
+    def count_missed(self, slot, last_slot):
+        """last_slot 과 slot 사이에 실행하지 못한 수"""
+        if last_slot is None:
+            return 0
+        return max(0, int((slot - last_slot).total_seconds() // self.interval) - 1)
+
+
+def parse_time(value):
+    """HH:MM -> 0시 부터 초"""
+    (hour, minute) = value.split(":")
+    return int(hour) * 3600 + int(minute) * 60
+
+
+def run_notify():
+    from attendance.garden import Garden
+    return {"rows": Garden().send_no_show_message()}
+
+
+def run_rollup():
+    # 현재 시즌만. 보관한 이전 시즌 집계는 메시지가 DB 에 없으므로 그대로 둠
+    from attendance.config_tools import ConfigTools
+    from attendance.db_tools import DBTools
+    from attendance.repo_rollup import rebuild_repo_rollups
+    config_tools = ConfigTools()
+    start_date = config_tools.get_start_date()
+    end_date = start_date + timedelta(days=int(config_tools.get_gardening_days()) - 1)
+    (rows, commits) = rebuild_repo_rollups(DBTools(), start_date, end_date)
+    return {"rows": rows, "commits": commits}
+
+
+def run_collect():
+    from attendance.collector import run_collect
+    return run_collect()
+
+
+def get_default_jobs(config):
+    section = config['SCHEDULER'] if config.has_section('SCHEDULER') else config['DEFAULT']
+    return [
+        Job("collect", run_collect, int(section.get('COLLECT_INTERVAL', 3600)), int(section.get('COLLECT_OFFSET', 300))),
+        Job("notify", run_notify, 86400, parse_time(section.get('NO_SHOW_TIME', '22:00')), max_delay=3600),
+        Job("rollup", run_rollup, 86400, parse_time(section.get('ROLLUP_TIME', '04:30'))),
+    ]
+
+
+class Scheduler:
+    def __init__(self, db_tools, jobs, time_zone, jitter=30, tick=10):
+        self.db_tools = db_tools
+        self.jobs = jobs
+        self.time_zone = time_zone
+        self.jitter = jitter
+        self.tick = tick
+        self.host = "%s:%d" % (socket.gethostname(), os.getpid())
+
+        # 프로세스 안에서 이미 처리한 slot, slot 별 시작 시각(jitter)
+        self.done_slots = {}
+        self.start_at = {}
+
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def now(self):
+        return datetime.now(self.time_zone).replace(tzinfo=None)
+
+    def run_pending(self, now=None):
+        """실행할 때가 된 작업들 실행"""
+        now = self.now() if now is None else now
+        for job in self.jobs:
+            slot = job.get_slot(now)
+            if self.done_slots.get(job.name) == slot:
+                continue
+            if self.start_at.get(job.name, (None,))[0] != slot:
+                self.start_at[job.name] = (slot, slot + timedelta(seconds=random.uniform(0, self.jitter)))
+            if now < self.start_at[job.name][1]:
+                continue
+            try:
+                self.run_job(job, slot, now)
+            except Exception as err:
+                print(err)
+
+    def run_job(self, job, slot, now=None):
+        """
+        job 의 slot 실행. 다른 프로세스가 실행 중이면 다음 tick 에 다시 확인
+        @return job_runs 에 남긴 status. 실행하지 않았으면 None
+        """
+        now = self.now() if now is None else now
+        with self.db_tools.advisory_lock(job.name) as acquired:
+            if not acquired:
+                return None
+
+            last_slot = self.find_last_slot(job.name)
+            if last_slot is not None and last_slot >= slot:
+                # 다른 프로세스가 이미 실행함
+                self.done_slots[job.name] = slot
+                return None
+
+            missed = job.count_missed(slot, last_slot)
+            if job.max_delay is not None and (now - slot).total_seconds() > job.max_delay:
+                self.record(job.name, slot, "skipped", missed_runs=missed, error="late by %ds" % (now - slot).total_seconds())
+                self.done_slots[job.name] = slot
+                return "skipped"
+
+            run_id = self.record(job.name, slot, "running", missed_runs=missed)
+            started = time.monotonic()
+            try:
+                result = job.func() or {}
+            except Exception as err:
+                print(err)
+                self.finish(run_id, "failed", started, error=str(err))
+                status = "failed"
+            else:
+                self.finish(run_id, "succeeded", started, result)
+                status = "succeeded"
+            self.done_slots[job.name] = slot
+            return status
+
+    def find_last_slot(self, job_name):
+        row = self.db_tools.execute_query(
+            "SELECT MAX(scheduled_at) AS scheduled_at FROM job_runs WHERE job = %s",
+            (job_name,), fetch_one=True
+        )
+        return row["scheduled_at"] if row else None
+
+    def record(self, job_name, slot, status, missed_runs=0, error=None):
+        with self.db_tools.pooled_cursor() as (conn, cursor):
+            cursor.execute(
+                """
+                INSERT INTO job_runs (job, scheduled_at, started_at, status, missed_runs, error, host)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
+                """,
+                (job_name, slot, self.now(), status, missed_runs, error, self.host)
+            )
+            return cursor.fetchone()["id"]
+
+    def finish(self, run_id, status, started, result=None, error=None):
+        result = dict(result or {})
+        rows = result.pop("rows", None)
+        self.db_tools.execute_query(
+            """
+            UPDATE job_runs SET finished_at = %s, duration_ms = %s, status = %s, rows = %s, detail = %s, error = %s
+            WHERE id = %s
+            """,
+            (self.now(), int((time.monotonic() - started) * 1000), status, rows,
+             json.dumps(result, default=str) if result else None, error, run_id),
+            fetch_all=False
+        )
+
+    def find_job_runs(self, limit=50):
+        return self.db_tools.execute_query(
+            """
+            SELECT job, scheduled_at, started_at, duration_ms, status, rows, missed_runs, detail, error, host
+            FROM job_runs ORDER BY id DESC LIMIT %s
+            """,
+            (limit,)
+        )
+
+    def run(self):
+        """stop() 할 때 까지 tick 초 마다 run_pending"""
+        while not self.stopped.is_set():
+            self.run_pending()
+            self.stopped.wait(self.tick)
+
+    def start(self):
+        """백그라운드 스레드로 실행"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name="scheduler", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+
+def load_config():
+    config = configparser.ConfigParser()
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    config.read(os.path.join(BASE_DIR, 'config.ini'))
+    return config
+
+
+def is_enabled(config=None):
+    config = load_config() if config is None else config
+    return config.has_section('SCHEDULER') and config['SCHEDULER'].getboolean('ENABLED', False)
+
+
+def create_scheduler(config=None):
+    from attendance.config_tools import ConfigTools
+    from attendance.db_tools import DBTools
+
+    config = load_config() if config is None else config
+    jitter = int(config['SCHEDULER'].get('JITTER', 30)) if config.has_section('SCHEDULER') else 30
+    return Scheduler(DBTools(), get_default_jobs(config), ConfigTools().get_time_zone(), jitter)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """프로세스 단위로 공유하는 Scheduler"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = create_scheduler()
+    return _scheduler
+
+
+def start_scheduler():
+    """[SCHEDULER] ENABLED 이면 백그라운드에서 시작. 시작했으면 True"""
+    if not is_enabled():
+        return False
+    get_scheduler().start()
+    return True
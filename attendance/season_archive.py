@@ -0,0 +1,259 @@
+"""
+끝난 시즌 보관
+
+시즌이 끝나면 메시지와 출석부를 zstd 압축 Arrow IPC 파일로 로컬 디스크에 저장하고 Postgres 에서는 지웁니다.
+압축한 파일은 memory map 으로 열어도 읽을 때 전체가 풀려서 프로세스 메모리에 올라옵니다.
+시즌마다 worker 프로세스 안에서 한번만 풀고 계속 씁니다. (get_season_archive, docs/08.schema.md)
+pyarrow 가 설치되어 있어야 합니다.
+
+<SEASON_ARCHIVE_DIR>/<시작일 YYYYMMDD>/
+    season.json      시즌 정보 (start_date, gardening_days, messages, attendances)
+    messages.arrow   메시지 (ts, ts_for_db, attendance_day, author_name, commit_text, ...)
+    attendance.arrow 유저별 날짜별 출석 (user, attendance_day, first_ts, commit_messages)
+"""
+import configparser
+import json
+import os
+import shutil
+import threading
+from datetime import datetime, timedelta
+
+from attendance.attendance_day import get_commits, to_ts_for_db_range
+from attendance.export_tools import ExportTools, get_parquet_schema
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+# 보관 파일 압축. 디스크에는 작게 두고 읽을 때 한번 풂
+COMPRESSION = "zstd"
+
+MESSAGES_QUERY = """
+    SELECT ts, ts_for_db, attendance_day, author_name, commit_text, bot_id, type, text, "user", team,
+           attachments::text AS attachments
+    FROM slack_messages
+    WHERE ts_for_db >= %s AND ts_for_db < %s
+    ORDER BY ts_for_db
+"""
+
+MESSAGE_COLUMNS = ["ts", "ts_for_db", "attendance_day", "author_name", "commit_text", "bot_id", "type", "text",
+                   "user", "team", "attachments"]
+
+
+def get_messages_schema():
+    return pyarrow.schema([
+        ("ts", pyarrow.string()),
+        ("ts_for_db", pyarrow.timestamp("us")),
+        ("attendance_day", pyarrow.date32()),
+        ("author_name", pyarrow.string()),
+        ("commit_text", pyarrow.string()),
+        ("bot_id", pyarrow.string()),
+        ("type", pyarrow.string()),
+        ("text", pyarrow.string()),
+        ("user", pyarrow.string()),
+        ("team", pyarrow.string()),
+        ("attachments", pyarrow.string()),  # JSON 문자열
+    ])
+
+
+def require_pyarrow():
+    if pyarrow is None:
+        raise RuntimeError("season archive requires pyarrow (pip install pyarrow)")
+
+
+def write_arrow(path, schema, rows, batch_size=10000):
+    """rows 를 batch_size 씩 record batch 로 씀. 쓴 row 수 반환"""
+    count = 0
+    batch = []
+    with pyarrow.OSFile(path, "wb") as sink, new_file_writer(sink, schema) as writer:
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                writer.write_batch(to_record_batch(schema, batch))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_batch(to_record_batch(schema, batch))
+            count += len(batch)
+    return count
+
+
+def new_file_writer(sink, schema):
+    return pyarrow.ipc.new_file(sink, schema, options=pyarrow.ipc.IpcWriteOptions(compression=COMPRESSION))
+
+
+def to_record_batch(schema, batch):
+    return pyarrow.RecordBatch.from_arrays(
+        [pyarrow.array([row[i] for row in batch], type=field.type) for (i, field) in enumerate(schema)],
+        schema=schema
+    )
+
+
+class ArchivedSeason:
+    """시즌 보관 파일. 처음 열 때 전체를 읽어서 들고 있음"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "season.json")) as file:
+            self.info = json.load(file)
+        self.start_date = datetime.strptime(self.info["start_date"], "%Y-%m-%d").date()
+        self.gardening_days = self.info["gardening_days"]
+        self.last_date = self.start_date + timedelta(days=self.gardening_days - 1)
+
+        self.messages = self.read_table("messages.arrow")
+        self.attendance = self.read_table("attendance.arrow")
+
+    def read_table(self, name):
+        # 압축한 파일은 여기서 전체가 풀려서 메모리에 올라옴. 압축하지 않은 파일은 memory map 을 그대로 가리킴
+        source = pyarrow.memory_map(os.path.join(self.directory, name), "r")
+        return pyarrow.ipc.open_file(source).read_all()
+
+    def contains(self, day):
+        return self.start_date <= day <= self.last_date
+
+    def get_users(self):
+        return sorted(set(self.attendance.column("user").to_pylist()))
+
+    def get_attendance(self, selected_date):
+        """특정일의 출석. Garden.get_attendance 와 같은 형태"""
+        table = self.attendance.filter(pyarrow.compute.equal(self.attendance["attendance_day"], selected_date))
+        first_commits = dict(zip(table.column("user").to_pylist(), table.column("first_ts").to_pylist()))
+        return [{"user": user, "first_ts": first_commits.get(user)} for user in self.get_users()]
+
+    def find_first_commits(self, user):
+        """{date: 첫 커밋 시각}"""
+        table = self.attendance.filter(pyarrow.compute.equal(self.attendance["user"], user))
+        return dict(zip(table.column("attendance_day").to_pylist(), table.column("first_ts").to_pylist()))
+
+    def find_attendance_by_user(self, user):
+        """Garden.find_attendance_by_user 와 같은 형태. {date: [{ts, message}]}"""
+        mask = pyarrow.compute.and_(pyarrow.compute.equal(self.messages["author_name"], user),
+                                    pyarrow.compute.is_valid(self.messages["attendance_day"]))
+        table = self.messages.filter(mask).select(["ts", "ts_for_db", "attendance_day", "attachments"])
+
+        result = {}
+        for row in sorted(table.to_pylist(), key=lambda r: float(r["ts"])):
+            commits = get_commits({"attachments": json.loads(row["attachments"]) if row["attachments"] else []})
+            result.setdefault(row["attendance_day"], []).append({"ts": row["ts_for_db"], "message": commits})
+        return result
+
+
+class SeasonArchive:
+    def __init__(self, directory=None):
+        if directory is None:
+            config = configparser.ConfigParser()
+            BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+            config.read(os.path.join(BASE_DIR, 'config.ini'))
+            directory = config['DEFAULT'].get('SEASON_ARCHIVE_DIR', os.path.join(BASE_DIR, 'season_archive'))
+
+        self.directory = directory
+        self.seasons = {}
+        self.lock = threading.Lock()
+
+    def get_season_dir(self, start_date):
+        return os.path.join(self.directory, start_date.strftime("%Y%m%d"))
+
+    def export_season(self, db_tools, start_date, gardening_days):
+        """
+        시즌 메시지와 출석부를 파일로 저장. 임시 디렉토리에 다 쓴 다음 이름을 바꿔서 중간에 실패해도 반쯤 쓴 보관 파일이 남지 않음
+        @return season.json 내용
+        """
+        require_pyarrow()
+        last_date = start_date + timedelta(days=gardening_days - 1)
+        season_dir = self.get_season_dir(start_date)
+        tmp_dir = season_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        rows = ([row[column] for column in MESSAGE_COLUMNS]
+                for row in db_tools.iter_query(MESSAGES_QUERY, to_ts_for_db_range(start_date, last_date)))
+        messages = write_arrow(os.path.join(tmp_dir, "messages.arrow"), get_messages_schema(), rows)
+
+        attendances = write_arrow(os.path.join(tmp_dir, "attendance.arrow"), get_parquet_schema("attendance"),
+                                  ExportTools(db_tools).iter_rows("attendance", start_date, last_date))
+
+        info = {
+            "start_date": start_date.strftime("%Y-%m-%d"),
+            "gardening_days": gardening_days,
+            "messages": messages,
+            "attendances": attendances,
+            "archived_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        with open(os.path.join(tmp_dir, "season.json"), "w") as file:
+            json.dump(info, file, indent=2)
+
+        shutil.rmtree(season_dir, ignore_errors=True)
+        os.rename(tmp_dir, season_dir)
+        with self.lock:
+            self.seasons.pop(start_date, None)
+        return info
+
+    def rewrite_season(self, start_date):
+        """
+        이미 보관한 시즌 파일을 COMPRESSION 으로 다시 씀 (잠깐 압축하지 않고 만들었던 파일)
+        DB 에서 지운 시즌이라 보관 파일에서 읽어서 씀
+        """
+        require_pyarrow()
+        season_dir = self.get_season_dir(start_date)
+        tmp_dir = season_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        for name in ("messages.arrow", "attendance.arrow"):
+            with pyarrow.memory_map(os.path.join(season_dir, name), "r") as source:
+                reader = pyarrow.ipc.open_file(source)
+                with pyarrow.OSFile(os.path.join(tmp_dir, name), "wb") as sink, \
+                        new_file_writer(sink, reader.schema) as writer:
+                    for i in range(reader.num_record_batches):
+                        writer.write_batch(reader.get_batch(i))
+        shutil.copy(os.path.join(season_dir, "season.json"), os.path.join(tmp_dir, "season.json"))
+
+        shutil.rmtree(season_dir)
+        os.rename(tmp_dir, season_dir)
+        with self.lock:
+            self.seasons.pop(start_date, None)
+
+    def list_seasons(self):
+        """보관된 시즌 시작일들"""
+        if not os.path.isdir(self.directory):
+            return []
+        start_dates = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.isdigit() and os.path.exists(os.path.join(self.directory, name, "season.json")):
+                start_dates.append(datetime.strptime(name, "%Y%m%d").date())
+        return start_dates
+
+    def open_season(self, start_date):
+        """ArchivedSeason. 없으면 None. 한번 연 시즌은 프로세스 안에서 재사용"""
+        with self.lock:
+            if start_date not in self.seasons:
+                if not os.path.exists(os.path.join(self.get_season_dir(start_date), "season.json")):
+                    return None
+                require_pyarrow()
+                self.seasons[start_date] = ArchivedSeason(self.get_season_dir(start_date))
+            return self.seasons[start_date]
+
+    def find_season(self, day):
+        """day 가 포함된 보관 시즌. 없으면 None"""
+        for start_date in reversed(self.list_seasons()):
+            if start_date <= day:
+                season = self.open_season(start_date)
+                return season if season.contains(day) else None
+        return None
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_season_archive():
+    """프로세스 단위로 공유하는 SeasonArchive. 한번 연 시즌은 요청마다 다시 열지 않음"""
+    global _archive
+    if _archive is None:
+        with _archive_lock:
+            if _archive is None:
+                _archive = SeasonArchive()
+    return _archive
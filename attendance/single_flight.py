@@ -0,0 +1,113 @@
+"""
+single-flight 요청 합치기
+
+같은 key 의 요청이 동시에 여러개 들어오면 먼저 온 요청(leader) 만 계산하고 나머지는 그 결과를 같이 받습니다.
+미출석 알림이 나간 직후 대시보드 요청이 몰릴 때 같은 출석부를 여러번 만들지 않기 위함입니다.
+결과를 저장해 두지는 않으므로 계산이 끝난 다음 들어온 요청은 다시 계산합니다.
+
+config.ini 의 SINGLE_FLIGHT_LOCK_DIR 를 설정하면 같은 서버의 다른 worker 프로세스와도 파일 lock 으로
+같은 key 의 계산을 한번에 하나씩만 합니다. (결과는 프로세스 마다 따로 계산)
+"""
+import asyncio
+import configparser
+import hashlib
+import os
+import threading
+
+from attendance import offload
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class SingleFlight:
+    def __init__(self, name, lock_dir=None):
+        self.name = name
+        self.lock_dir = lock_dir
+        self.calls = {}
+        self.lock = threading.Lock()
+
+        # 통계
+        self.leaders = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    async def run(self, key, lane, func, *args):
+        """key 가 같은 계산이 진행 중이면 그 결과를 기다리고, 없으면 lane 스레드에서 func(*args) 실행"""
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = offload.submit(lane, self.call, key, func, *args)
+                self.calls[key] = future
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if leader:
+            # 이미 끝났으면 바로 호출되므로 lock 밖에서 등록
+            future.add_done_callback(lambda done: self.finish(key, done))
+        # concurrent.futures.Future 라서 다른 event loop 에서 기다려도 됨
+        # 기다리던 요청 하나가 취소되어도(연결 끊김, timeout) 같이 기다리는 요청들의 계산은 취소되지 않도록 shield
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def call(self, key, func, *args):
+        if self.lock_dir is None or fcntl is None:
+            return func(*args)
+        with open(self.get_lock_path(key), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                return func(*args)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def finish(self, key, future):
+        with self.lock:
+            if self.calls.get(key) is future:
+                del self.calls[key]
+            if future.cancelled() or future.exception() is not None:
+                self.errors += 1
+
+    def get_lock_path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+        return os.path.join(self.lock_dir, "%s-%s.lock" % (self.name, digest))
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "in_flight": len(self.calls),
+            }
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def get_lock_dir():
+    config = configparser.ConfigParser()
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    config.read(os.path.join(BASE_DIR, 'config.ini'))
+    lock_dir = config['DEFAULT'].get('SINGLE_FLIGHT_LOCK_DIR')
+    if lock_dir:
+        os.makedirs(lock_dir, exist_ok=True)
+    return lock_dir or None
+
+
+def get_single_flight(name):
+    """endpoint 별로 프로세스에 하나"""
+    with _flights_lock:
+        flight = _flights.get(name)
+        if flight is None:
+            flight = SingleFlight(name, get_lock_dir())
+            _flights[name] = flight
+    return flight
+
+
+def get_stats():
+    with _flights_lock:
+        flights = list(_flights.values())
+    return {flight.name: flight.get_stats() for flight in flights}
@@ -0,0 +1,55 @@
+"""
+Slack Events API 수신
+
+GitHub bot 이 #commit 채널에 올리는 message 이벤트를 받아서 IngestQueue 에 넣습니다.
+Slack 은 3초 안에 응답하지 않으면 재전송하므로 여기서는 검증과 큐 저장만 합니다.
+https://api.slack.com/authentication/verifying-requests-from-slack
+"""
+import hashlib
+import hmac
+import time
+
+# 5분 보다 오래된 요청은 replay 로 보고 거부
+MAX_REQUEST_AGE = 60 * 5
+
+
+def verify_signature(signing_secret, timestamp, body, signature, now=None):
+    """X-Slack-Request-Timestamp, X-Slack-Signature 검증"""
+    if not signing_secret or not timestamp or not signature:
+        return False
+
+    try:
+        if abs((now or time.time()) - int(timestamp)) > MAX_REQUEST_AGE:
+            return False
+    except ValueError:
+        return False
+
+    base = b"v0:" + timestamp.encode() + b":" + body
+    expected = "v0=" + hmac.new(signing_secret.encode(), base, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def get_ingestible_message(payload, channel_id, bot_id=None):
+    """
+    event_callback 중 수집할 메시지를 반환. 아니면 None
+    채널의 새 메시지만 받음. (수정, 삭제 등 subtype 이 있는 이벤트는 polling 수집기가 맞춤)
+    bot_id 가 있으면 그 bot 의 메시지만 받음
+    """
+    if payload.get("type") != "event_callback":
+        return None
+
+    event = payload.get("event") or {}
+    if event.get("type") != "message" or event.get("channel") != channel_id:
+        return None
+    if event.get("subtype") not in (None, "bot_message"):
+        return None
+    if bot_id and event.get("bot_id") != bot_id:
+        return None
+    if not event.get("ts"):
+        return None
+
+    message = dict(event)
+    message.pop("channel", None)
+    message.pop("event_ts", None)
+    message.pop("channel_type", None)
+    return message
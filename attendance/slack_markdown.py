@@ -8,15 +8,25 @@ import markdown
 from markdown.extensions import Extension
 from markdown.preprocessors import Preprocessor
 
+from attendance.profiling import profiled
+
 
 class SlackMarkdownPreprocessor(Preprocessor):
     """Slack 특수 문법을 일반 마크다운으로 변환"""
-    
+
+    def __init__(self, md=None, user_names=None):
+        super().__init__(md)
+        self.user_names = user_names or {}
+
+    def replace_mention(self, match):
+        user_id = match.group(1)
+        return '@' + self.user_names.get(user_id, match.group(2) or user_id)
+
     def run(self, lines):
         text = '\n'.join(lines)
         
-        # Slack 사용자 멘션 처리: <@U12345> -> @user
-        text = re.sub(r'<@([UW][A-Z0-9]+)>', r'@\1', text)
+        # Slack 사용자 멘션 처리: <@U12345> 또는 <@U12345|name> -> @표시이름
+        text = re.sub(r'<@([UW][A-Z0-9]+)(?:\|([^>]+))?>', self.replace_mention, text)
         
         # Slack 채널 멘션 처리: <#C12345|channel> -> #channel
         text = re.sub(r'<#([C][A-Z0-9]+)\|([^>]+)>', r'#\2', text)
@@ -35,19 +45,29 @@ class SlackMarkdownPreprocessor(Preprocessor):
 
 class SlackMarkdownExtension(Extension):
     """Slack Markdown 확장"""
-    
+
+    def __init__(self, **kwargs):
+        self.config = {
+            'user_names': [{}, 'Slack user id -> 표시 이름 dict'],
+        }
+        super().__init__(**kwargs)
+
     def extendMarkdown(self, md):
         md.preprocessors.register(
-            SlackMarkdownPreprocessor(md),
+            SlackMarkdownPreprocessor(md, self.getConfig('user_names')),
             'slack_markdown',
             175
         )
 
 
-def slack_markdown_to_html(text):
-    """Slack 마크다운 텍스트를 HTML로 변환"""
+@profiled("slack_markdown_to_html")
+def slack_markdown_to_html(text, user_names=None):
+    """
+    Slack 마크다운 텍스트를 HTML로 변환
+    @param user_names 멘션 변환용 id -> 표시 이름 dict. SlackUserDirectory.get_display_names()
+    """
     if not text:
         return text
     
-    md = markdown.Markdown(extensions=[SlackMarkdownExtension()])
+    md = markdown.Markdown(extensions=[SlackMarkdownExtension(user_names=user_names or {})])
     return md.convert(text)
\ No newline at end of file
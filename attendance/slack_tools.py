@@ -1,4 +1,5 @@
 import configparser
+import threading
 from datetime import date, timedelta, datetime
 import slack
 import os
@@ -16,12 +17,23 @@ class SlackTools:
         self.slack_client = slack.WebClient(token=slack_api_token)
         self.channel_id = config['DEFAULT']['CHANNEL_ID']
 
+        # Slack Events API 요청 서명 검증용
+        self.signing_secret = config['DEFAULT'].get('SLACK_SIGNING_SECRET')
+        # GitHub bot 의 bot_id. 있으면 이 bot 의 메시지만 수집
+        self.github_bot_id = config['DEFAULT'].get('GITHUB_BOT_ID')
+
     def get_slack_client(self):
         return self.slack_client
 
     def get_channel_id(self):
         return self.channel_id
 
+    def get_signing_secret(self):
+        return self.signing_secret
+
+    def get_github_bot_id(self):
+        return self.github_bot_id
+
     def send_no_show_message(self, members):
         message = "[미출석자 알림]\n"
         for member in members:
@@ -33,11 +45,23 @@ class SlackTools:
             link_names=1
         )
 
-    def get_users(self):
-        return self.slack_client.users_list()
+    def get_users(self, limit=200):
+        """users.list 를 next_cursor 가 없을 때 까지 조회해서 전체 멤버 리스트를 반환"""
+        members = []
+        params = {"limit": limit}
+        while True:
+            response = self.slack_client.users_list(**params)
+            members.extend(response["members"])
+
+            next_cursor = response.get("response_metadata", {}).get("next_cursor")
+            if not next_cursor:
+                return members
+            params["cursor"] = next_cursor
 
     def get_user_names(self):
-        return [user["name"] for user in self.get_users()["members"]]
+        """slack username 리스트. 예전처럼 users.list 전체(탈퇴한 유저 포함). 프로세스에서 공유하는 SlackUserDirectory 캐시를 이용"""
+        from attendance.slack_user_directory import get_slack_user_directory
+        return get_slack_user_directory().get_all_names()
 
     def test_slack(self):
         # self.slack_client.chat_postMessage(
@@ -47,3 +71,17 @@ class SlackTools:
         # )
         response = self.slack_client.users_list()
         print(response)
+
+
+_slack_tools = None
+_slack_tools_lock = threading.Lock()
+
+
+def get_slack_tools():
+    """프로세스 단위로 공유하는 SlackTools. Slack Events 처럼 요청마다 config.ini 를 다시 읽지 않도록"""
+    global _slack_tools
+    if _slack_tools is None:
+        with _slack_tools_lock:
+            if _slack_tools is None:
+                _slack_tools = SlackTools()
+    return _slack_tools
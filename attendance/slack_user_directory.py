@@ -0,0 +1,202 @@
+import configparser
+import os
+import threading
+import time
+
+from attendance.db_tools import DBTools
+
+
+class SlackUserDirectory:
+    """
+    Slack 유저 디렉토리
+    users.list 결과를 slack_users 테이블에 저장해 두고 TTL 동안 재사용합니다.
+    id -> 유저, name -> id 인덱스를 메모리에 들고 있어서 멘션 변환 등에 API 호출이 필요 없습니다.
+    """
+
+    def __init__(self, slack_tools=None, db_tools=None, ttl=None, retry_delay=None):
+        config = configparser.ConfigParser()
+        BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+        path = os.path.join(BASE_DIR, 'config.ini')
+        config.read(path)
+
+        if ttl is None:
+            ttl = int(config['DEFAULT'].get('SLACK_USER_CACHE_TTL', 24 * 60 * 60))
+        if retry_delay is None:
+            retry_delay = int(config['DEFAULT'].get('SLACK_USER_RETRY_DELAY', 60))
+
+        self.ttl = ttl
+        self.retry_delay = retry_delay
+        self.slack_tools = slack_tools
+        self.db_tools = db_tools if db_tools else DBTools()
+
+        self.users_by_id = {}
+        self.ids_by_name = {}
+        self.loaded_at = None
+        self.retry_at = None  # 실패 후 이 시각 전 까지는 다시 시도하지 않고 있는 인덱스를 그대로 씀
+
+        self.lock = threading.Lock()
+
+    def get_slack_tools(self):
+        if self.slack_tools is None:
+            from attendance.slack_tools import SlackTools
+            self.slack_tools = SlackTools()
+        return self.slack_tools
+
+    def is_expired(self):
+        return self.loaded_at is None or time.time() - self.loaded_at >= self.ttl
+
+    def should_load(self):
+        return self.is_expired() and (self.retry_at is None or time.time() >= self.retry_at)
+
+    def ensure_loaded(self):
+        """
+        메모리 인덱스가 만료 되었으면 DB 에서 다시 읽고, DB 도 만료 되었으면 Slack 에서 새로 가져옴
+        DB, Slack 오류면 있던 인덱스(또는 DB 의 오래된 목록)를 그대로 쓰고 retry_delay 뒤에 다시 시도
+        """
+        if not self.should_load():
+            return
+
+        with self.lock:
+            if not self.should_load():
+                return
+
+            try:
+                rows, age = self.load_from_db()
+            except Exception as err:
+                print(err)
+                self.retry_at = time.time() + self.retry_delay
+                return
+
+            if age is not None and age < self.ttl:
+                self.build_index(rows, time.time())
+                self.retry_at = None
+                return
+
+            try:
+                refreshed = self.refresh()
+            except Exception as err:
+                print(err)
+                self.retry_at = time.time() + self.retry_delay
+                if rows:
+                    # 오래된 목록이라도 씀. loaded_at 은 그대로 두어서 retry_delay 뒤에 다시 시도
+                    self.build_index(rows, self.loaded_at)
+                return
+
+            self.build_index(merge_rows(rows, refreshed), time.time())
+            self.retry_at = None
+
+    def load_from_db(self):
+        """
+        slack_users 조회. (rows, 마지막 refresh 후 지난 시간(초))
+        refresh 때 users.list 에 있는 유저는 모두 fetched_at 이 갱신되므로 가장 최근 fetched_at 이 마지막 refresh 시각
+        (users.list 에서 빠진 유저는 fetched_at 이 갱신되지 않음)
+        """
+        rows = self.db_tools.execute_query(
+            """
+            SELECT id, name, display_name, real_name, is_bot, deleted,
+                   EXTRACT(EPOCH FROM (NOW() - fetched_at)) AS age
+            FROM slack_users
+            """
+        )
+        if not rows:
+            return [], None
+        return rows, min(float(row["age"]) for row in rows)
+
+    def refresh(self):
+        """users.list 를 끝까지 페이지 조회해서 slack_users 를 갱신"""
+        members = self.get_slack_tools().get_users()
+
+        rows = []
+        for member in members:
+            profile = member.get("profile") or {}
+            rows.append({
+                "id": member["id"],
+                "name": member["name"],
+                "display_name": profile.get("display_name") or None,
+                "real_name": member.get("real_name") or profile.get("real_name") or None,
+                "is_bot": bool(member.get("is_bot")),
+                "deleted": bool(member.get("deleted")),
+            })
+
+        if rows:
+            self.db_tools.execute_values(
+                """
+                INSERT INTO slack_users (id, name, display_name, real_name, is_bot, deleted)
+                VALUES %s
+                ON CONFLICT (id) DO UPDATE SET
+                    name = EXCLUDED.name,
+                    display_name = EXCLUDED.display_name,
+                    real_name = EXCLUDED.real_name,
+                    is_bot = EXCLUDED.is_bot,
+                    deleted = EXCLUDED.deleted,
+                    fetched_at = NOW()
+                """,
+                [(row["id"], row["name"], row["display_name"], row["real_name"], row["is_bot"], row["deleted"])
+                 for row in rows],
+                page_size=500
+            )
+
+        return rows
+
+    def build_index(self, rows, loaded_at):
+        users_by_id = {}
+        ids_by_name = {}
+        for row in rows:
+            users_by_id[row["id"]] = dict(row)
+            if not row["deleted"]:
+                ids_by_name[row["name"]] = row["id"]
+
+        self.users_by_id = users_by_id
+        self.ids_by_name = ids_by_name
+        self.loaded_at = loaded_at
+
+    def get_user(self, user_id):
+        self.ensure_loaded()
+        return self.users_by_id.get(user_id)
+
+    def get_id(self, name):
+        self.ensure_loaded()
+        return self.ids_by_name.get(name)
+
+    def get_names(self):
+        """탈퇴하지 않은 유저들의 slack username 리스트"""
+        self.ensure_loaded()
+        return list(self.ids_by_name.keys())
+
+    def get_all_names(self):
+        """탈퇴한 유저, bot 까지 모든 slack username 리스트. users.list 의 name 전체와 같음"""
+        self.ensure_loaded()
+        return [user["name"] for user in self.users_by_id.values()]
+
+    def get_display_name(self, user_id):
+        user = self.get_user(user_id)
+        if user is None:
+            return None
+        return user["display_name"] or user["real_name"] or user["name"]
+
+    def get_display_names(self):
+        """멘션 변환용 id -> 표시 이름 dict"""
+        self.ensure_loaded()
+        return {user_id: user["display_name"] or user["real_name"] or user["name"]
+                for (user_id, user) in self.users_by_id.items()}
+
+
+def merge_rows(db_rows, refreshed_rows):
+    """DB 에만 있는 유저(users.list 에서 빠진 유저)도 남기고 새로 가져온 값으로 덮어씀"""
+    rows = {row["id"]: row for row in db_rows}
+    rows.update((row["id"], row) for row in refreshed_rows)
+    return list(rows.values())
+
+
+_directory = None
+_directory_lock = threading.Lock()
+
+
+def get_slack_user_directory():
+    """프로세스 단위로 공유하는 SlackUserDirectory"""
+    global _directory
+    if _directory is None:
+        with _directory_lock:
+            if _directory is None:
+                _directory = SlackUserDirectory()
+    return _directory
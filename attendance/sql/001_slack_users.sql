@@ -0,0 +1,16 @@
+-- Slack 유저 디렉토리 캐시
+-- users.list 결과를 저장해두고 TTL 동안 재사용합니다.
+SET search_path TO garden6;
+
+CREATE TABLE IF NOT EXISTS slack_users (
+    id VARCHAR(20) PRIMARY KEY,          -- Slack user id e.g. UUKEY7PB6
+    name VARCHAR(100) NOT NULL,          -- Slack username e.g. junho85
+    display_name VARCHAR(200),
+    real_name VARCHAR(200),
+    is_bot BOOLEAN NOT NULL DEFAULT FALSE,
+    deleted BOOLEAN NOT NULL DEFAULT FALSE,
+    fetched_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_slack_users_name ON slack_users (name);
+CREATE INDEX IF NOT EXISTS idx_slack_users_fetched_at ON slack_users (fetched_at);
@@ -0,0 +1,15 @@
+-- 출석일(attendance_day) 컬럼
+-- 새벽 2시 규칙을 적용한 출석일을 수집할 때 한번 계산해서 저장합니다.
+-- 기존 데이터는 attendance/cli_backfill_attendance_day.py 로 채웁니다.
+SET search_path TO garden6;
+
+-- GitHub bot 메시지의 커밋 작성자. attachments->0->>'author_name' 조회를 인덱스로 처리
+ALTER TABLE slack_messages
+    ADD COLUMN IF NOT EXISTS author_name VARCHAR(100) GENERATED ALWAYS AS (attachments->0->>'author_name') STORED;
+
+-- 커밋이 있는 메시지만 값이 있음. 커밋이 없는 메시지는 NULL
+ALTER TABLE slack_messages
+    ADD COLUMN IF NOT EXISTS attendance_day DATE;
+
+CREATE INDEX IF NOT EXISTS idx_author_attendance_day ON slack_messages (author_name, attendance_day, ts);
+CREATE INDEX IF NOT EXISTS idx_attendance_day ON slack_messages (attendance_day);
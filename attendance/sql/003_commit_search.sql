@@ -0,0 +1,26 @@
+-- 커밋 메시지 검색
+-- commit_text 는 수집할 때 attachments[].text 를 줄바꿈으로 합쳐서 저장합니다.
+-- 단어 검색은 search_vector(tsvector), 한글 조사가 붙은 단어나 부분 문자열은 pg_trgm 인덱스로 찾습니다.
+SET search_path TO garden6;
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE slack_messages
+    ADD COLUMN IF NOT EXISTS commit_text TEXT;
+
+-- 한글은 형태소 분석기가 없으므로 'simple' 로 공백 단위 토큰
+ALTER TABLE slack_messages
+    ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+        GENERATED ALWAYS AS (to_tsvector('simple', COALESCE(commit_text, ''))) STORED;
+
+-- 기존 데이터
+UPDATE slack_messages
+SET commit_text = (
+    SELECT string_agg(attachment->>'text', E'\n')
+    FROM jsonb_array_elements(attachments) AS attachment
+    WHERE attachment ? 'text'
+)
+WHERE commit_text IS NULL AND jsonb_typeof(attachments) = 'array';
+
+CREATE INDEX IF NOT EXISTS idx_search_vector ON slack_messages USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_commit_text_trgm ON slack_messages USING GIN (commit_text gin_trgm_ops);
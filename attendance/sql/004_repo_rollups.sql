@@ -0,0 +1,15 @@
+-- 저장소별 커밋 집계
+-- 수집할 때 새로 저장된 메시지의 커밋 수를 더합니다. (attendance/repo_rollup.py)
+-- 기존 데이터는 attendance/cli_backfill_repo_rollups.py 로 채웁니다.
+SET search_path TO garden6;
+
+CREATE TABLE IF NOT EXISTS repo_daily_commits (
+    repository VARCHAR(200) NOT NULL,
+    attendance_day DATE NOT NULL,
+    author_name VARCHAR(100) NOT NULL,
+    commits INTEGER NOT NULL,
+    PRIMARY KEY (repository, attendance_day, author_name)
+);
+
+CREATE INDEX IF NOT EXISTS idx_repo_daily_commits_author ON repo_daily_commits (author_name, attendance_day);
+CREATE INDEX IF NOT EXISTS idx_repo_daily_commits_day ON repo_daily_commits (attendance_day);
@@ -0,0 +1,16 @@
+-- 반복되는 JSON 값 중복 제거
+-- GitHub bot 의 bot_profile 은 모든 메시지에 같은 값이 들어있어서 json_blobs 에 한번만 저장하고 hash 로 참조합니다.
+-- 기존 데이터는 attendance/cli_compact_json_blobs.py 로 옮깁니다.
+SET search_path TO garden6;
+
+CREATE TABLE IF NOT EXISTS json_blobs (
+    hash CHAR(64) PRIMARY KEY, -- 키 정렬한 JSON 의 sha256 (db_tools.json_blob_hash)
+    body JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+ALTER TABLE slack_messages
+    ADD COLUMN IF NOT EXISTS bot_profile_hash CHAR(64) REFERENCES json_blobs (hash);
+
+-- GIN 인덱스는 bot_profile 이 비면서 의미가 없어짐
+DROP INDEX IF EXISTS idx_slack_messages_bot_profile;
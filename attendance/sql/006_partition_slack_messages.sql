@@ -0,0 +1,64 @@
+-- slack_messages 를 ts_for_db 범위로 파티션
+-- 시즌마다 파티션을 하나씩 두고, 시즌을 지울 때는 DELETE 대신 파티션을 떼어내거나(DETACH) DROP 합니다.
+-- 파티션 키가 unique 제약에 포함되어야 해서 unique 는 (ts, ts_for_db) 입니다.
+-- ts_for_db 는 ts 로 계산하므로(TIME_ZONE 기준) ts 하나에 ts_for_db 는 하나뿐이라 의미는 같습니다.
+--
+-- 적용 후 attendance/cli_partitions.py create 로 현재 시즌 파티션을 만들면 DEFAULT 파티션에서 해당 시즌 메시지가 옮겨집니다.
+-- 기존 테이블은 slack_messages_unpartitioned 로 남겨두므로 확인 후 지웁니다.
+--   DROP TABLE slack_messages_unpartitioned;
+SET search_path TO garden6;
+
+BEGIN;
+
+ALTER TABLE slack_messages RENAME TO slack_messages_unpartitioned;
+
+CREATE TABLE slack_messages (
+    LIKE slack_messages_unpartitioned INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING STORAGE
+) PARTITION BY RANGE (ts_for_db);
+
+ALTER TABLE slack_messages ADD PRIMARY KEY (id, ts_for_db);
+ALTER TABLE slack_messages ADD UNIQUE (ts, ts_for_db);
+ALTER TABLE slack_messages ADD FOREIGN KEY (bot_profile_hash) REFERENCES json_blobs (hash);
+
+-- 시즌 파티션이 없는 메시지(이전 시즌들)
+CREATE TABLE slack_messages_default PARTITION OF slack_messages DEFAULT;
+
+INSERT INTO slack_messages (id, ts, ts_for_db, bot_id, type, text, "user", team, bot_profile, attachments, created_at,
+                            attendance_day, commit_text, bot_profile_hash)
+SELECT id, ts, ts_for_db, bot_id, type, text, "user", team, bot_profile, attachments, created_at,
+       attendance_day, commit_text, bot_profile_hash
+FROM slack_messages_unpartitioned;
+
+-- 인덱스는 부모에 만들면 파티션마다 생성됨. 이름은 기존 테이블 인덱스와 겹치지 않게 자동으로 정해짐
+CREATE INDEX ON slack_messages (ts_for_db);
+CREATE INDEX ON slack_messages (author_name, attendance_day, ts);
+CREATE INDEX ON slack_messages (attendance_day);
+CREATE INDEX ON slack_messages USING GIN (attachments);
+CREATE INDEX ON slack_messages USING GIN (search_vector);
+CREATE INDEX ON slack_messages USING GIN (commit_text gin_trgm_ops);
+
+ALTER TABLE slack_messages ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Read access for authenticated users" ON slack_messages
+    FOR SELECT
+    USING (auth.role() = 'authenticated');
+CREATE POLICY "Write access for service role only" ON slack_messages
+    FOR ALL
+    USING (auth.role() = 'service_role');
+
+CREATE OR REPLACE VIEW commit_messages AS
+SELECT
+    sm.id,
+    sm.ts,
+    sm.ts_for_db,
+    attachment->>'author_name' as github_username,
+    attachment->>'text' as commit_message,
+    attachment->>'fallback' as fallback,
+    attachment->>'footer' as repository,
+    sm.created_at
+FROM
+    slack_messages sm,
+    LATERAL jsonb_array_elements(sm.attachments) as attachment
+WHERE
+    sm.attachments IS NOT NULL;
+
+COMMIT;
@@ -0,0 +1,21 @@
+-- 예약 작업 실행 기록
+-- attendance/scheduler.py 가 작업(collect, notify, rollup)을 실행할 때마다 한 row 씩 남깁니다.
+-- scheduled_at 은 실행 예정 시각(TIME_ZONE 기준). 같은 시각 작업은 여러 프로세스 중 하나만 실행합니다.
+SET search_path TO garden6;
+
+CREATE TABLE IF NOT EXISTS job_runs (
+    id BIGSERIAL PRIMARY KEY,
+    job VARCHAR(50) NOT NULL,
+    scheduled_at TIMESTAMP NOT NULL,
+    started_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMP,
+    duration_ms INTEGER,
+    status VARCHAR(20) NOT NULL,         -- running, succeeded, failed, skipped
+    rows INTEGER,                        -- 처리한 row 수. 작업마다 의미가 다름 (docs/06.cron.md)
+    missed_runs INTEGER NOT NULL DEFAULT 0,  -- 합쳐진(건너뛴) 이전 실행 수
+    detail JSONB,
+    error TEXT,
+    host VARCHAR(200)
+);
+
+CREATE INDEX IF NOT EXISTS idx_job_runs_job_scheduled_at ON job_runs (job, scheduled_at DESC);
@@ -0,0 +1,6 @@
+-- 메시지 내용 hash
+-- 다시 수집했을 때 내용이 바뀐(수정된) 메시지만 고칩니다. (DBTools.upsert_slack_messages)
+-- 기존 데이터는 attendance/cli_backfill_content_hash.py 로 채웁니다. 채우지 않으면 다음 수집 때 한번 다시 씁니다.
+SET search_path TO garden6;
+
+ALTER TABLE slack_messages ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
@@ -0,0 +1,25 @@
+-- 저장 순번 ingest_seq
+-- 메시지를 새로 저장하거나 내용이 바뀌어서 고칠 때마다 sequence 에서 새 번호를 받습니다.
+-- 유저 API(/attendance/api/users/<user>/?since=) 의 next 토큰으로 씁니다. slack ts 와 달리 늦게 저장된 예전 메시지, 고친 메시지도 빠지지 않습니다.
+-- DBTools.upsert_slack_messages 는 advisory lock(ingest_seq) 을 잡고 저장하므로 번호 순서와 commit 순서가 같습니다.
+SET search_path TO garden6;
+
+BEGIN;
+
+CREATE SEQUENCE IF NOT EXISTS slack_messages_ingest_seq;
+
+ALTER TABLE slack_messages ADD COLUMN IF NOT EXISTS ingest_seq BIGINT;
+
+-- 기존 메시지는 ts 순서로
+UPDATE slack_messages AS m
+SET ingest_seq = v.ingest_seq
+FROM (SELECT ts, ts_for_db, nextval('slack_messages_ingest_seq') AS ingest_seq
+      FROM (SELECT ts, ts_for_db FROM slack_messages WHERE ingest_seq IS NULL ORDER BY ts) AS ordered) AS v
+WHERE m.ts = v.ts AND m.ts_for_db = v.ts_for_db;
+
+ALTER TABLE slack_messages ALTER COLUMN ingest_seq SET DEFAULT nextval('slack_messages_ingest_seq');
+ALTER TABLE slack_messages ALTER COLUMN ingest_seq SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_author_ingest_seq ON slack_messages (author_name, ingest_seq);
+
+COMMIT;
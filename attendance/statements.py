@@ -0,0 +1,112 @@
+"""
+자주 실행하는 쿼리 모양(prepared statement)
+
+Postgres 는 같은 SQL 이라도 요청마다 parse, plan 을 다시 합니다.
+자주 실행하는 쿼리는 이름과 파라미터 타입을 붙여서 여기 등록해 두면 DBTools.execute_prepared 가
+풀 연결마다 처음 한번만 PREPARE 하고, 그 다음부터는 EXECUTE 만 보냅니다.
+
+* 파라미터는 $1, $2 ... 순서대로 한번씩만 씁니다. 조건이 있다 없다 하는 쿼리는 모양이 바뀌지 않도록
+  범위의 양 끝 값을 넘깁니다. (e.g. since_day 가 없으면 date.min)
+* 여러 row 를 넣는 쿼리는 row 수 마다 모양이 달라지지 않도록 컬럼별 배열을 unnest 합니다.
+* config.ini [POSTGRES] PREPARED_STATEMENTS = false 면 같은 SQL 을 그냥 실행합니다.
+  (transaction 단위 connection pooler(pgbouncer, Supabase 6543 포트) 를 거칠 때. 연결이 바뀌면 PREPARE 한 것이 없음)
+"""
+import re
+
+PARAM_PATTERN = re.compile(r"\$(\d+)")
+
+
+class Statement:
+    def __init__(self, name, types, sql):
+        numbers = [int(number) for number in PARAM_PATTERN.findall(sql)]
+        if numbers != list(range(1, len(types) + 1)):
+            raise ValueError("%s: parameters must be $1..$%d in order" % (name, len(types)))
+
+        self.name = name
+        self.types = types
+        self.sql = " ".join(sql.split())
+        self.prepare_sql = "PREPARE %s (%s) AS %s" % (name, ", ".join(types), self.sql)
+        # 타입을 붙여서 넘김. ARRAY[NULL] 처럼 타입을 알 수 없는 값도 선언한 타입으로 바뀜
+        self.execute_sql = "EXECUTE %s (%s)" % (name, ", ".join("%%s::%s" % param_type for param_type in types))
+        self.plain_sql = PARAM_PATTERN.sub(lambda match: "%%s::%s" % types[int(match.group(1)) - 1], self.sql)
+
+
+STATEMENTS = {}
+
+
+def register(name, types, sql):
+    STATEMENTS[name] = Statement(name, types, sql)
+    return STATEMENTS[name]
+
+
+def get_statement(name):
+    try:
+        return STATEMENTS[name]
+    except KeyError:
+        raise ValueError("unknown statement: %s" % name)
+
+
+# 유저별 출석부. Garden.find_attendance_updates
+# (user, ts_for_db 시작, ts_for_db 끝, since_day, after_seq)
+register("author_history", ["varchar", "timestamp", "timestamp", "date", "bigint"], """
+    SELECT ts, ts_for_db, attendance_day, attachments, ingest_seq
+    FROM slack_messages
+    WHERE author_name = $1 AND attendance_day IS NOT NULL AND ts_for_db >= $2 AND ts_for_db < $3
+      AND attendance_day >= $4 AND ingest_seq > $5
+    ORDER BY ts
+""")
+
+# 유저별 날짜별 첫 커밋 시각. Garden.find_first_commits
+# (users, ts_for_db 시작, ts_for_db 끝, 출석일 시작, 출석일 끝)
+register("first_commits", ["varchar[]", "timestamp", "timestamp", "date", "date"], """
+    SELECT author_name, attendance_day, MIN(ts_for_db) AS first_ts
+    FROM slack_messages
+    WHERE author_name = ANY($1) AND attendance_day IS NOT NULL AND ts_for_db >= $2 AND ts_for_db < $3
+      AND attendance_day BETWEEN $4 AND $5
+    GROUP BY author_name, attendance_day
+    ORDER BY author_name, attendance_day
+""")
+
+# 이미 출석 처리된 (author_name, date). Garden.find_attended
+# (author_names, dates, ts_for_db 시작, ts_for_db 끝)
+register("attended", ["varchar[]", "date[]", "timestamp", "timestamp"], """
+    SELECT DISTINCT author_name, attendance_day
+    FROM slack_messages
+    WHERE author_name = ANY($1) AND attendance_day = ANY($2) AND ts_for_db >= $3 AND ts_for_db < $4
+""")
+
+# 이미 저장된 메시지들의 content_hash. DBTools.find_content_hashes
+# (ts 들, ts_for_db 최소, ts_for_db 최대)
+register("content_hashes", ["varchar[]", "timestamp", "timestamp"], """
+    SELECT ts, content_hash, attachments, attendance_day
+    FROM slack_messages
+    WHERE ts = ANY($1) AND ts_for_db >= $2 AND ts_for_db <= $3
+""")
+
+# slack 메시지 저장. DBTools.upsert_slack_messages
+# 컬럼별 배열. WHERE 는 다른 writer 가 먼저 같은 내용으로 고친 경우 다시 쓰지 않기 위함
+# 파티션 테이블은 RETURNING 에서 xmax 같은 시스템 컬럼을 못 읽음. created_at(DEFAULT NOW()) 이 이 transaction 시각이면 새로 INSERT 된 row
+# 고친 row 도 ingest_seq 를 새로 받아서 유저 API 의 next 토큰 이후로 보임 (sql/009_ingest_seq.sql)
+# attendance_day 는 처음 값을 유지. 고쳐서 커밋이 없어졌으면(새로 계산한 값이 NULL) 출석에서 빠지도록 NULL
+register("upsert_slack_messages",
+         ["varchar[]", "timestamp[]", "date[]", "varchar[]", "varchar[]", "text[]", "varchar[]", "varchar[]",
+          "text[]", "jsonb[]", "text[]", "varchar[]"], """
+    INSERT INTO slack_messages (ts, ts_for_db, attendance_day, bot_id, type, text, "user", team, bot_profile_hash,
+                                attachments, commit_text, content_hash)
+    SELECT * FROM unnest($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
+    ON CONFLICT (ts, ts_for_db) DO UPDATE SET
+        bot_id = EXCLUDED.bot_id,
+        type = EXCLUDED.type,
+        text = EXCLUDED.text,
+        "user" = EXCLUDED."user",
+        team = EXCLUDED.team,
+        bot_profile_hash = EXCLUDED.bot_profile_hash,
+        attachments = EXCLUDED.attachments,
+        commit_text = EXCLUDED.commit_text,
+        content_hash = EXCLUDED.content_hash,
+        attendance_day = CASE WHEN EXCLUDED.attendance_day IS NULL THEN NULL
+                              ELSE COALESCE(slack_messages.attendance_day, EXCLUDED.attendance_day) END,
+        ingest_seq = nextval('slack_messages_ingest_seq')
+    WHERE slack_messages.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+    RETURNING ts, (created_at = now()::timestamp) AS inserted
+""")
@@ -0,0 +1,117 @@
+import json
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+from attendance.github_tools import GithubTools, RateLimitExceeded, extract_commit_urls, parse_commit_url
+
+
+SHA = "f3d807901dc16d1c049dc14c02c1916234af8abc"
+COMMIT_URL = "https://github.com/itsnamgyu/TIW/commit/%s" % SHA
+
+
+class FakeGithubHandler(BaseHTTPRequestHandler):
+    requests = []
+    rate_limit_remaining = 5000
+
+    def do_GET(self):
+        FakeGithubHandler.requests.append((self.path, self.headers.get("If-None-Match")))
+
+        sha = self.path.rsplit("/", 1)[-1]
+        etag = '"etag-%s"' % sha
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_rate_limit_headers()
+            self.end_headers()
+            return
+
+        body = json.dumps({
+            "sha": sha,
+            "commit": {
+                "author": {"date": "2021-01-18T15:30:00Z"},
+                "message": "add %s" % sha[:8],
+            },
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_rate_limit_headers()
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_rate_limit_headers(self):
+        self.send_header("X-RateLimit-Remaining", str(FakeGithubHandler.rate_limit_remaining))
+        self.send_header("X-RateLimit-Reset", str(int(time.time()) + 1))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestGithubTools(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGithubHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.api_url = "http://127.0.0.1:%d" % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FakeGithubHandler.requests = []
+        FakeGithubHandler.rate_limit_remaining = 5000
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.github_tools = GithubTools(token="", api_url=self.api_url, cache_dir=self.cache_dir.name, max_workers=4)
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def test_parse_commit_url(self):
+        self.assertEqual(("itsnamgyu", "TIW", SHA), parse_commit_url(COMMIT_URL))
+        with self.assertRaises(ValueError):
+            parse_commit_url("https://github.com/itsnamgyu/TIW")
+
+    def test_extract_commit_urls(self):
+        text = "<%s|`f3d80790`> - fix\n<%s|`f3d80790`> - fix" % (COMMIT_URL, COMMIT_URL)
+        self.assertEqual([COMMIT_URL], extract_commit_urls(text))
+
+    def test_get_commit_uses_etag_cache(self):
+        commit = self.github_tools.get_commit(COMMIT_URL)
+        self.assertEqual("itsnamgyu", commit["user"])
+        self.assertEqual("f3d80790", commit["sha_short"])
+        self.assertEqual("add f3d80790", commit["message"])
+
+        cached_commit = self.github_tools.get_commit(COMMIT_URL)
+        self.assertEqual(commit, cached_commit)
+        self.assertEqual([None, '"etag-%s"' % SHA], [etag for (_, etag) in FakeGithubHandler.requests])
+
+    def test_get_commits_concurrently(self):
+        urls = ["https://github.com/junho85/garden6/commit/%040x" % i for i in range(1, 21)]
+        commits, errors = self.github_tools.get_commits(urls + urls[:5])
+
+        self.assertEqual([], errors)
+        self.assertEqual(urls, [commit["url"] for commit in commits])
+        self.assertEqual(20, len(FakeGithubHandler.requests))
+
+    def test_rate_limit_exhausted(self):
+        FakeGithubHandler.rate_limit_remaining = 0
+        self.github_tools.get_commit(COMMIT_URL)
+
+        self.github_tools.max_rate_limit_wait = 0
+        with self.assertRaises(RateLimitExceeded):
+            self.github_tools.get_commit("https://github.com/junho85/garden6/commit/%040x" % 1)
+
+    def test_to_slack_message(self):
+        commit = self.github_tools.get_commit(COMMIT_URL)
+        message = GithubTools.to_slack_message(commit, "june.kim")
+
+        self.assertEqual("itsnamgyu", message["attachments"][0]["author_name"])
+        self.assertIn("manual insert 2021-01-18 by june.kim", message["attachments"][0]["text"])
+        self.assertEqual(commit["ts"], message["ts"])
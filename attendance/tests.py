@@ -1,3 +1,1052 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from contextlib import contextmanager
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from django.test import RequestFactory, SimpleTestCase
+
+from attendance.attendance_day import assign_attendance_days, to_local_datetime, to_ts_for_db_range
+from attendance.attendance_index import AttendanceIndex
+from attendance.bson_reader import BSONError, decode, iter_bson_file
+from attendance import collector
+from attendance.config_snapshot import ConfigSnapshot, load_snapshot
+from attendance.db_tools import DBTools, escape_like, json_blob_hash, message_content_hash
+from attendance.export_tools import ExportTools
+from attendance.ingest_queue import IngestQueue
+from attendance.ingest_writer import IngestWriter
+from attendance.live_updates import AttendanceBroadcaster
+from attendance.partition_tools import get_partition_name, get_season_range
+from attendance import profiling
+from attendance.repo_rollup import add_repo_rollups, count_repo_commits, get_repository, rebuild_repo_rollups
+from attendance.scheduler import Job, Scheduler
+from attendance.single_flight import SingleFlight
+from attendance.statements import Statement, get_statement
+from attendance import offload, season_archive
+from attendance.slack_events import get_ingestible_message, verify_signature
+from attendance.slack_markdown import slack_markdown_to_html
+from attendance.slack_user_directory import SlackUserDirectory
+from attendance.garden import get_saved_messages
+from attendance.views import find_user_attendances, parse_day_window, parse_since
+
+
+class SlackMarkdownTest(SimpleTestCase):
+    def test_mention_with_user_names(self):
+        html = slack_markdown_to_html("review by <@UUKEY7PB6>", {"UUKEY7PB6": "june.kim"})
+        self.assertIn("@june.kim", html)
+
+    def test_mention_without_user_names(self):
+        self.assertIn("@UUKEY7PB6", slack_markdown_to_html("review by <@UUKEY7PB6>"))
+        self.assertIn("@junho85", slack_markdown_to_html("review by <@UUKEY7PB6|junho85>"))
+
+
+class SlackUserDirectoryTest(SimpleTestCase):
+    class FakeDBTools:
+        def __init__(self, rows):
+            self.rows = rows
+
+        def execute_query(self, query, params=None):
+            return self.rows
+
+        def execute_values(self, query, rows, page_size=100):
+            pass
+
+    class FakeSlackTools:
+        def __init__(self, members):
+            self.members = members
+            self.calls = 0
+
+        def get_users(self):
+            self.calls += 1
+            if isinstance(self.members, Exception):
+                raise self.members
+            return self.members
+
+    def row(self, user_id, name, age):
+        return {"id": user_id, "name": name, "display_name": None, "real_name": None,
+                "is_bot": False, "deleted": False, "age": age}
+
+    def test_age_is_time_since_last_refresh(self):
+        # users.list 에서 빠진 유저의 fetched_at 은 오래 되어도 다시 가져오지 않음
+        db_tools = self.FakeDBTools([self.row("U1", "june", 10), self.row("U2", "left", 10 ** 6)])
+        slack_tools = self.FakeSlackTools([])
+        directory = SlackUserDirectory(slack_tools, db_tools, ttl=3600, retry_delay=60)
+
+        self.assertEqual("U2", directory.get_id("left"))
+        self.assertEqual(0, slack_tools.calls)
+
+    def test_refresh_keeps_db_only_users(self):
+        db_tools = self.FakeDBTools([self.row("U1", "june", 7200), self.row("U2", "left", 7200)])
+        slack_tools = self.FakeSlackTools([{"id": "U1", "name": "junho85", "profile": {}}])
+        directory = SlackUserDirectory(slack_tools, db_tools, ttl=3600, retry_delay=60)
+
+        self.assertEqual("U1", directory.get_id("junho85"))
+        self.assertEqual("U2", directory.get_id("left"))
+
+    def test_failure_serves_stale_rows_and_backs_off(self):
+        db_tools = self.FakeDBTools([self.row("U1", "june", 7200)])
+        slack_tools = self.FakeSlackTools(Exception("ratelimited"))
+        directory = SlackUserDirectory(slack_tools, db_tools, ttl=3600, retry_delay=60)
+
+        with mock.patch("builtins.print"):
+            self.assertEqual("U1", directory.get_id("june"))
+            self.assertEqual(["june"], directory.get_names())
+        self.assertEqual(1, slack_tools.calls)
+
+        with mock.patch("attendance.slack_user_directory.time.time", return_value=directory.retry_at + 1), \
+                mock.patch("builtins.print"):
+            directory.get_names()
+        self.assertEqual(2, slack_tools.calls)
+
+    def test_user_names_use_shared_directory(self):
+        # 예전처럼 탈퇴한 유저도 포함하고, 부를 때마다 Slack 을 조회하지 않음
+        from attendance import slack_user_directory
+        from attendance.slack_tools import SlackTools
+
+        db_tools = self.FakeDBTools([])
+        slack_tools = self.FakeSlackTools([{"id": "U1", "name": "junho85", "profile": {}},
+                                           {"id": "U2", "name": "left", "deleted": True, "profile": {}}])
+        directory = SlackUserDirectory(slack_tools, db_tools, ttl=3600, retry_delay=60)
+        with mock.patch.object(slack_user_directory, "_directory", directory):
+            tools = SlackTools.__new__(SlackTools)
+            self.assertEqual(["junho85", "left"], sorted(tools.get_user_names()))
+            self.assertEqual(["junho85", "left"], sorted(tools.get_user_names()))
+        self.assertEqual(["junho85"], directory.get_names())
+        self.assertEqual(1, slack_tools.calls)
+
+
+class AttendanceDayTest(SimpleTestCase):
+    time_zone = ZoneInfo("Asia/Seoul")
+    start_date = date(2021, 1, 18)
+
+    def message(self, local_datetime, author_name="junho85", text="commit"):
+        attachment = {"author_name": author_name}
+        if text is not None:
+            attachment["text"] = text
+        ts = local_datetime.replace(tzinfo=self.time_zone).timestamp()
+        return {"ts": "%.6f" % ts, "attachments": [attachment]}
+
+    def test_local_day_does_not_depend_on_server_time_zone(self):
+        message = self.message(datetime(2021, 1, 19, 8, 30))
+        assign_attendance_days([message], self.time_zone, self.start_date)
+        self.assertEqual(date(2021, 1, 19), message["attendance_day"])
+        self.assertEqual(datetime(2021, 1, 19, 8, 30), to_local_datetime(message["ts"], self.time_zone))
+
+    def test_before_2am_counts_for_previous_day_once(self):
+        messages = [
+            self.message(datetime(2021, 1, 20, 1, 0)),
+            self.message(datetime(2021, 1, 20, 1, 30)),
+            self.message(datetime(2021, 1, 20, 1, 40), author_name="other"),
+        ]
+        assign_attendance_days(messages, self.time_zone, self.start_date, {("other", date(2021, 1, 19))})
+        self.assertEqual([date(2021, 1, 19), date(2021, 1, 20), date(2021, 1, 20)],
+                         [message["attendance_day"] for message in messages])
+
+    def test_before_start_date_and_without_commits(self):
+        messages = [
+            self.message(datetime(2021, 1, 18, 1, 0)),
+            self.message(datetime(2021, 1, 18, 9, 0), text=None),
+        ]
+        assign_attendance_days(messages, self.time_zone, self.start_date)
+        self.assertEqual([date(2021, 1, 18), None], [message["attendance_day"] for message in messages])
+
+
+    def test_ts_for_db_range(self):
+        self.assertEqual((datetime(2021, 1, 18), datetime(2021, 1, 20, 2, 0)),
+                         to_ts_for_db_range(date(2021, 1, 18), date(2021, 1, 19)))
+        self.assertEqual((datetime(2021, 1, 18), datetime(2021, 4, 28, 2, 0)), get_season_range(self.start_date, "100"))
+        self.assertEqual("slack_messages_s20210118", get_partition_name(self.start_date))
+
+
+class ParseSinceTest(SimpleTestCase):
+    def test_parse_since(self):
+        self.assertEqual((None, None), parse_since(None))
+        self.assertEqual((date(2021, 1, 19), None), parse_since("2021-01-19"))
+        self.assertEqual((None, 0), parse_since("0"))
+        self.assertEqual((None, 1234), parse_since("1234"))
+
+        for since in ("2021-01-19_1611036000.000100", "-1", "abc"):
+            with self.assertRaises(ValueError):
+                parse_since(since)
+
+
+class FindAttendanceUpdatesTest(SimpleTestCase):
+    def make_garden(self, rows):
+        from attendance.garden import Garden
+        garden = Garden.__new__(Garden)
+        garden.season_range = to_ts_for_db_range(date(2021, 1, 18), date(2021, 4, 27))
+        garden.db_tools = mock.Mock(execute_prepared=mock.Mock(return_value=rows),
+                                    execute_query=mock.Mock(return_value={"last_seq": 42}))
+        return garden
+
+    def test_date_since_without_results_moves_to_seq(self):
+        garden = self.make_garden([])
+        self.assertEqual(({}, 42), garden.find_attendance_updates("junho85", since_day=date(2021, 4, 1)))
+        self.assertEqual(({}, 7), garden.find_attendance_updates("junho85", after_seq=7))
+        self.assertEqual(({}, None), garden.find_attendance_updates("junho85"))
+
+    def test_last_seq_of_results(self):
+        row = {"ts_for_db": datetime(2021, 4, 2, 9, 0), "attendance_day": date(2021, 4, 2),
+               "attachments": [{"text": "fix"}], "ingest_seq": 50}
+        garden = self.make_garden([row])
+        (result, last_seq) = garden.find_attendance_updates("junho85", since_day=date(2021, 4, 1))
+        self.assertEqual(50, last_seq)
+        self.assertEqual([{"ts": datetime(2021, 4, 2, 9, 0), "message": ["fix"]}], result[date(2021, 4, 2)])
+
+
+class AttendanceBroadcasterTest(SimpleTestCase):
+    class Broadcaster(AttendanceBroadcaster):
+        def start_listener(self):
+            pass
+
+    def test_publish_fans_out_to_all_subscribers(self):
+        broadcaster = self.Broadcaster()
+        deltas = [{"user": "junho85", "date": "2021-01-19", "ts": "2021-01-19T08:30:00"}]
+
+        async def receive():
+            queues = [broadcaster.subscribe() for _ in range(3)]
+            threading.Thread(target=broadcaster.publish, args=(deltas,)).start()
+            received = [await asyncio.wait_for(queue.get(), timeout=1) for queue in queues]
+
+            broadcaster.unsubscribe(queues[0])
+            return received, len(broadcaster.subscribers)
+
+        (received, subscriber_count) = asyncio.run(receive())
+        self.assertEqual([deltas] * 3, received)
+        self.assertEqual(2, subscriber_count)
+
+    def test_listen_closes_connection_before_reconnecting(self):
+        class Stop(Exception):
+            pass
+
+        class FakeConnection:
+            closed = False
+
+            def cursor(self):
+                return mock.Mock(execute=mock.Mock(side_effect=Exception("server closed the connection")))
+
+            def close(self):
+                self.closed = True
+
+        conn = FakeConnection()
+        broadcaster = self.Broadcaster(db_tools=mock.Mock(connect_db=mock.Mock(return_value=conn)))
+        with mock.patch("attendance.live_updates.time.sleep", side_effect=Stop), mock.patch("builtins.print"):
+            with self.assertRaises(Stop):
+                broadcaster.listen()
+        self.assertTrue(conn.closed)
+
+    def test_bad_payload_is_skipped(self):
+        broadcaster = self.Broadcaster()
+        with mock.patch("builtins.print"):
+            broadcaster.handle_notify(mock.Mock(payload="not json"))
+
+    def test_events_stream_ends_after_client_leaves(self):
+        # 브라우저가 떠나도 ASGI handler 는 계속 send 하므로 EVENTS_MAX_SECONDS 가 지나면 generator 가 끝나야 함
+        from django.core.handlers.asgi import ASGIHandler
+        from attendance import views
+
+        broadcaster = self.Broadcaster()
+        sent = []
+        # 요청을 보내자마자 떠난 브라우저
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def receive():
+            return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        async def request():
+            scope = {"type": "http", "method": "GET", "path": "/attendance/events/", "query_string": b"",
+                     "headers": [], "client": ("127.0.0.1", 50000), "server": ("testserver", 80)}
+            handler = ASGIHandler()
+            await asyncio.wait_for(handler(scope, receive, send), timeout=5)
+
+        with mock.patch.object(views, "broadcaster", broadcaster), \
+                mock.patch.object(views, "EVENTS_MAX_SECONDS", 0.2), \
+                mock.patch.object(views, "EVENTS_KEEPALIVE_SECONDS", 0.05):
+            asyncio.run(request())
+
+        self.assertEqual({}, broadcaster.subscribers)
+        self.assertFalse(sent[-1].get("more_body", False))
+
+
+class SlackEventsTest(SimpleTestCase):
+    signing_secret = "8f742231b10e8888abcd99yyyzzz85a5"
+
+    def sign(self, timestamp, body):
+        base = b"v0:" + timestamp.encode() + b":" + body
+        return "v0=" + hmac.new(self.signing_secret.encode(), base, hashlib.sha256).hexdigest()
+
+    def test_verify_signature(self):
+        body = b'{"type": "event_callback"}'
+        timestamp = "1611036000"
+        signature = self.sign(timestamp, body)
+
+        self.assertTrue(verify_signature(self.signing_secret, timestamp, body, signature, now=1611036010))
+        self.assertFalse(verify_signature(self.signing_secret, timestamp, body + b" ", signature, now=1611036010))
+        self.assertFalse(verify_signature(self.signing_secret, timestamp, body, signature, now=1611037000))
+        self.assertFalse(verify_signature(None, timestamp, body, signature, now=1611036010))
+
+    def test_get_ingestible_message(self):
+        event = {"type": "message", "channel": "CUPKULDJS", "bot_id": "B01", "ts": "1611036000.000100",
+                 "event_ts": "1611036000.000100", "attachments": [{"author_name": "junho85", "text": "commit"}]}
+        payload = {"type": "event_callback", "event": event}
+
+        message = get_ingestible_message(payload, "CUPKULDJS", "B01")
+        self.assertEqual("1611036000.000100", message["ts"])
+        self.assertNotIn("channel", message)
+
+        self.assertIsNone(get_ingestible_message(payload, "C_OTHER", "B01"))
+        self.assertIsNone(get_ingestible_message(payload, "CUPKULDJS", "B_OTHER"))
+        self.assertIsNone(get_ingestible_message(
+            {"type": "event_callback", "event": dict(event, subtype="message_changed")}, "CUPKULDJS"))
+
+    def test_events_reuse_slack_tools_and_queue(self):
+        from attendance import slack_tools, views
+
+        class FakeSlackTools:
+            created = 0
+
+            def __init__(self):
+                FakeSlackTools.created += 1
+
+            def get_signing_secret(self):
+                return SlackEventsTest.signing_secret
+
+            def get_channel_id(self):
+                return "CUPKULDJS"
+
+            def get_github_bot_id(self):
+                return "B01"
+
+        event = {"type": "message", "channel": "CUPKULDJS", "bot_id": "B01", "ts": "1611036000.000100",
+                 "attachments": [{"author_name": "junho85", "text": "commit"}]}
+        body = json.dumps({"type": "event_callback", "event": event}).encode()
+        writer = mock.Mock()
+
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(slack_tools, "SlackTools", FakeSlackTools), \
+                mock.patch.object(slack_tools, "_slack_tools", None), \
+                mock.patch.object(views, "get_ingest_writer", return_value=writer):
+            writer.queue = IngestQueue(os.path.join(directory, "queue.sqlite3"))
+            for _ in range(3):
+                timestamp = str(int(time.time()))
+                request = RequestFactory().post("/attendance/slack/events/", body, content_type="application/json",
+                                                HTTP_X_SLACK_REQUEST_TIMESTAMP=timestamp,
+                                                HTTP_X_SLACK_SIGNATURE=self.sign(timestamp, body))
+                self.assertEqual(200, views.slack_events(request).status_code)
+
+            self.assertEqual(1, FakeSlackTools.created)
+            self.assertEqual(3, len(writer.queue.claim(10)))
+
+
+class IngestQueueTest(SimpleTestCase):
+    class FakeGarden:
+        def __init__(self):
+            self.saved = []
+
+        def save_slack_messages(self, messages):
+            self.saved.append([message["ts"] for message in messages])
+            return [message["ts"] for message in messages]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.queue = IngestQueue(os.path.join(self.tmp_dir.name, "queue.sqlite3"))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_writer_drains_in_batches(self):
+        messages = [{"ts": "%d.000100" % ts} for ts in range(1611036000, 1611036005)]
+        self.queue.put(messages[:2] + messages[:1] + messages[2:])
+        self.assertEqual(6, self.queue.depth()[0])
+
+        garden = self.FakeGarden()
+        writer = IngestWriter(self.queue, garden, max_batch_size=4)
+        self.assertEqual(6, writer.drain())
+
+        self.assertEqual(0, self.queue.depth()[0])
+        # 같은 batch 안의 중복 ts 는 한번만 저장
+        self.assertEqual([3, 2], [len(batch) for batch in garden.saved])
+        self.assertEqual(2, writer.get_stats()["flushed_batches"])
+
+    def test_claimed_messages_are_not_claimed_again(self):
+        self.queue.put([{"ts": "1611036000.000100"}, {"ts": "1611036001.000100"}])
+
+        self.assertEqual(2, len(self.queue.claim(10)))
+        self.assertEqual([], self.queue.claim(10))
+
+        self.queue.release([1])
+        self.assertEqual([1], [row_id for (row_id, _) in self.queue.claim(10)])
+
+    def test_failed_batch_stays_in_queue(self):
+        self.queue.put([{"ts": "1611036000.000100"}])
+
+        garden = self.FakeGarden()
+        garden.save_slack_messages = lambda messages: 1 / 0
+        writer = IngestWriter(self.queue, garden)
+        with self.assertRaises(ZeroDivisionError):
+            writer.drain_once()
+
+        self.assertEqual(1, self.queue.depth()[0])
+        self.assertEqual(1, writer.get_stats()["failed_flushes"])
+
+    def test_bury_failing_message(self):
+        self.queue.put([{"ts": "1611036000.000100"}, {"ts": "bad"}])
+
+        garden = self.FakeGarden()
+        save_slack_messages = garden.save_slack_messages
+
+        def save_or_fail(messages):
+            if any(message["ts"] == "bad" for message in messages):
+                raise ValueError("bad ts")
+            return save_slack_messages(messages)
+
+        garden.save_slack_messages = save_or_fail
+        IngestWriter(self.queue, garden).bury_failing()
+
+        self.assertEqual(0, self.queue.depth()[0])
+        self.assertEqual(1, self.queue.dead_depth())
+        self.assertEqual([["1611036000.000100"]], garden.saved)
+
+
+class AttendanceIndexTest(SimpleTestCase):
+    class FakeDBTools:
+        def execute_query(self, query, params=None):
+            return [
+                {"author_name": "junho85", "attendance_day": date(2021, 1, 18), "first_ts": datetime(2021, 1, 18, 9, 0)},
+                {"author_name": "junho85", "attendance_day": date(2021, 1, 20), "first_ts": datetime(2021, 1, 21, 1, 30)},
+                {"author_name": "other", "attendance_day": date(2021, 1, 20), "first_ts": datetime(2021, 1, 20, 22, 0)},
+            ]
+
+    def setUp(self):
+        self.index = AttendanceIndex(date(2021, 1, 18), 100)
+        self.index.load(self.FakeDBTools())
+
+    def test_load(self):
+        self.assertEqual({date(2021, 1, 18): datetime(2021, 1, 18, 9, 0),
+                          date(2021, 1, 20): datetime(2021, 1, 21, 1, 30)},
+                         self.index.get_first_commits("junho85"))
+        self.assertEqual(datetime(2021, 1, 20, 22, 0), self.index.get_first_commit("other", date(2021, 1, 20)))
+        self.assertIsNone(self.index.get_first_commit("other", date(2021, 1, 19)))
+        self.assertEqual({}, self.index.get_first_commits("nobody"))
+
+    def test_apply_deltas_in_place(self):
+        self.index.apply_deltas([
+            {"user": "junho85", "date": "2021-01-19", "ts": "2021-01-19T10:00:00"},
+            {"user": "junho85", "date": "2021-01-18", "ts": "2021-01-18T08:00:00.123"},
+            {"user": "new", "date": "2021-01-19", "ts": "2021-01-19T11:00:00"},
+        ])
+
+        self.assertEqual([0, 1, 2], list(self.index.users["junho85"].days))
+        self.assertEqual(datetime(2021, 1, 18, 8, 0), self.index.get_first_commit("junho85", date(2021, 1, 18)))
+        self.assertEqual(2, self.index.count("junho85", date(2021, 1, 19)))
+        self.assertEqual([1, 2, 2], self.index.daily_counts(["junho85", "other", "new"], 3))
+
+    def test_bitmap_queries(self):
+        users = ["junho85", "other", "nobody"]
+        self.assertEqual(["junho85"], self.index.find_users(users, date(2021, 1, 18), date(2021, 1, 18), "all"))
+        self.assertEqual(["junho85", "other"], self.index.find_users(users, date(2021, 1, 18), date(2021, 1, 20), "any"))
+        self.assertEqual(["other", "nobody"], self.index.find_users(users, date(2021, 1, 18), date(2021, 1, 19), "none"))
+        self.assertEqual([date(2021, 1, 20)],
+                         self.index.combine_days(["junho85", "other"], "and", date(2021, 1, 18), date(2021, 1, 20)))
+        self.assertEqual([date(2021, 1, 18), date(2021, 1, 20)],
+                         self.index.combine_days(["junho85", "other"], "or", date(2021, 1, 1), date(2021, 2, 1)))
+
+        self.index.add("nobody", date(2021, 1, 19), datetime(2021, 1, 19, 12, 0))
+        self.assertEqual(["nobody"], self.index.find_users(users, date(2021, 1, 19), date(2021, 1, 19), "all"))
+        self.assertEqual([1, 1, 2], self.index.daily_counts(users, 3))
+
+    def test_add_ignores_days_outside_season(self):
+        # load 는 시즌 밖을 읽지 않으므로 add 도 같은 범위만 반영해야 다시 읽어도 결과가 같음
+        self.assertFalse(self.index.add("junho85", date(2021, 1, 17), datetime(2021, 1, 17, 9, 0)))
+        self.assertFalse(self.index.add("junho85", date(2021, 4, 28), datetime(2021, 4, 28, 9, 0)))
+        self.assertFalse(self.index.add("new", date(2021, 5, 1), datetime(2021, 5, 1, 9, 0)))
+        self.assertTrue(self.index.add("junho85", date(2021, 4, 27), datetime(2021, 4, 27, 9, 0)))
+
+        self.assertEqual([0, 2, 99], list(self.index.users["junho85"].days))
+        self.assertNotIn("new", self.index.users)
+
+    def test_empty_window(self):
+        # 거꾸로 된 기간, 시즌 밖 기간에 매일 출석한 사람은 없음
+        users = ["junho85", "other", "nobody"]
+        self.assertEqual([], self.index.find_users(users, date(2021, 1, 20), date(2021, 1, 18), "all"))
+        self.assertEqual([], self.index.find_users(users, date(2022, 1, 1), date(2022, 1, 7), "all"))
+        self.assertEqual(users, self.index.find_users(users, date(2021, 1, 20), date(2021, 1, 18), "none"))
+        self.assertEqual([], self.index.find_users(users, date(2021, 1, 20), date(2021, 1, 18), "any"))
+
+    def test_reversed_window_is_rejected(self):
+        garden = mock.Mock(time_zone=ZoneInfo("Asia/Seoul"))
+        request = RequestFactory().get("/attendance/api/cohort", {"from": "2021-01-20", "to": "2021-01-18"})
+        with self.assertRaises(ValueError):
+            parse_day_window(request, garden)
+
+
+class ExportToolsTest(SimpleTestCase):
+    class FakeDBTools:
+        def iter_query(self, query, params=None, itersize=2000):
+            yield {"user": "junho85", "attendance_day": date(2021, 1, 18),
+                   "first_ts": datetime(2021, 1, 18, 9, 0), "commit_messages": 2}
+            yield {"user": "other, jr", "attendance_day": date(2021, 1, 19),
+                   "first_ts": datetime(2021, 1, 20, 1, 0), "commit_messages": 1}
+
+    def test_iter_csv(self):
+        lines = list(ExportTools(self.FakeDBTools()).iter_csv("attendance", date(2021, 1, 18), date(2021, 1, 19)))
+        self.assertEqual([
+            "user,attendance_day,first_ts,commit_messages\r\n",
+            "junho85,2021-01-18,2021-01-18 09:00:00,2\r\n",
+            '"other, jr",2021-01-19,2021-01-20 01:00:00,1\r\n',
+        ], lines)
+
+
+class DBToolsHelperTest(SimpleTestCase):
+    def test_escape_like(self):
+        self.assertEqual("100\\% done\\_ok\\\\", escape_like("100% done_ok\\"))
+
+    def test_json_blob_hash(self):
+        self.assertEqual(json_blob_hash({"id": "BNGD110UR", "icons": {"a": 1, "b": 2}}),
+                         json_blob_hash({"icons": {"b": 2, "a": 1}, "id": "BNGD110UR"}))
+        self.assertNotEqual(json_blob_hash({"id": "BNGD110UR"}), json_blob_hash({"id": "other"}))
+
+
+class UpsertSlackMessagesTest(SimpleTestCase):
+    class FakeDBTools(DBTools):
+        def __init__(self, stored):
+            self.stored = stored
+            self.written = []
+
+        def execute_prepared(self, name, params, fetch_one=False, fetch_all=True):
+            return [row for row in self.stored if row["ts"] in params[0]]
+
+        def execute_prepared_many(self, name, params_list, lock=None, after=None):
+            self.lock = lock
+            rows = [row for columns in params_list for row in zip(*columns)]
+            self.written.extend(rows)
+            result = [{"ts": row[0], "inserted": row[0] not in {r["ts"] for r in self.stored}} for row in rows]
+            if after is not None:
+                after("cursor", result)
+            return result
+
+    def test_only_changed_messages_are_written(self):
+        ts_for_db = datetime(2021, 1, 18, 9, 0)
+        same = {"ts": "1.1", "ts_for_db": ts_for_db, "text": "", "attachments": [{"text": "a"}]}
+        edited = {"ts": "1.2", "ts_for_db": ts_for_db, "text": "", "attachments": [{"text": "b (edited)"}]}
+        new = {"ts": "1.3", "ts_for_db": ts_for_db, "text": "", "attachments": [{"text": "c"}]}
+        stored = [
+            {"ts": "1.1", "content_hash": message_content_hash(same), "attendance_day": date(2021, 1, 18)},
+            {"ts": "1.2", "content_hash": message_content_hash(dict(edited, attachments=[{"text": "b"}])),
+             "attendance_day": date(2021, 1, 18)},
+        ]
+        db_tools = self.FakeDBTools(stored)
+
+        saved = []
+        result = db_tools.upsert_slack_messages([same, edited, new],
+                                                after=lambda cursor, result: saved.append((cursor, result)))
+        self.assertEqual([("cursor", result)], saved)
+        self.assertEqual(["1.2", "1.3"], [row[0] for row in db_tools.written])
+        self.assertEqual(["1.3"], result["inserted"])
+        self.assertEqual(["1.2"], list(result["updated"]))
+        self.assertEqual("ingest_seq", db_tools.lock)
+        self.assertEqual(message_content_hash({"ts": "1.4", "attachments": []}),
+                         message_content_hash({"ts": "1.5", "attachments": None}))
+
+
+class EditedMessageTest(SimpleTestCase):
+    def test_edit_that_removes_commits_leaves_attendance(self):
+        footer = "<https://github.com/junho85/TIL|junho85/TIL>"
+        before = {"ts": "1.2", "attendance_day": date(2021, 1, 18),
+                  "attachments": [{"author_name": "junho85", "text": "a", "footer": footer}]}
+        # 다시 계산한 출석일. 커밋이 없어서 None
+        edited = {"ts": "1.2", "attendance_day": None, "attachments": [{"author_name": "junho85", "footer": footer}]}
+        retimed = {"ts": "1.3", "attendance_day": date(2021, 1, 19),
+                   "attachments": [{"author_name": "junho85", "text": "b (edited)", "footer": footer}]}
+        saved = {"inserted": [], "updated": {"1.2": before, "1.3": dict(before, ts="1.3")}}
+
+        (inserted_messages, updated_messages) = get_saved_messages([edited, retimed], saved)
+        self.assertIsNone(edited["attendance_day"])
+        self.assertEqual(date(2021, 1, 18), retimed["attendance_day"])
+
+        cursor = mock.Mock()
+        add_repo_rollups(cursor, updated_messages, [saved["updated"][m["ts"]] for m in updated_messages])
+        self.assertEqual((["junho85/TIL"], [date(2021, 1, 18)], ["junho85"], [-1]), cursor.execute.call_args[0][1])
+
+    def test_commit_without_message_is_skipped(self):
+        result = {
+            date(2021, 1, 18): [{"ts": datetime(2021, 1, 18, 9, 0), "message": []}],
+            date(2021, 1, 19): [{"ts": datetime(2021, 1, 19, 9, 0), "message": []},
+                                {"ts": datetime(2021, 1, 19, 10, 0), "message": ["fix"]}],
+        }
+        garden = mock.Mock(find_attendance_updates=mock.Mock(return_value=(result, 7)))
+        with mock.patch("attendance.views.Garden", return_value=garden), \
+                mock.patch("attendance.views.get_slack_user_directory") as directory:
+            directory.return_value.get_display_names.return_value = {}
+            (attendances, last_seq) = find_user_attendances("junho85", None, None, None)
+
+        self.assertEqual([date(2021, 1, 19)], [attendance["date"] for attendance in attendances])
+        self.assertEqual(["<p>fix</p>"], [commit["message"][0] for commit in attendances[0]["commits"]])
+        self.assertEqual(7, last_seq)
+
+
+class PreparedStatementTest(SimpleTestCase):
+    class FakeConnection:
+        def __init__(self):
+            self.prepared = set()
+            self.commits = 0
+
+        def commit(self):
+            self.commits += 1
+
+    class FakeCursor:
+        description = [("ts",)]
+
+        def __init__(self):
+            self.executed = []
+
+        def execute(self, query, params=None):
+            self.executed.append(query)
+
+        def fetchall(self):
+            return [{"ts": "1.1"}]
+
+    class FakeDBTools(DBTools):
+        def __init__(self, conn, cursor, use_prepared=True):
+            self.conn = conn
+            self.cursor = cursor
+            self.use_prepared = use_prepared
+
+        @contextmanager
+        def pooled_cursor(self):
+            yield self.conn, self.cursor
+
+    def test_statement(self):
+        statement = Statement("by_user", ["varchar", "date[]"],
+                              "SELECT ts FROM slack_messages WHERE author_name = $1 AND attendance_day = ANY($2)")
+        self.assertEqual("PREPARE by_user (varchar, date[]) AS SELECT ts FROM slack_messages "
+                         "WHERE author_name = $1 AND attendance_day = ANY($2)", statement.prepare_sql)
+        self.assertEqual("EXECUTE by_user (%s::varchar, %s::date[])", statement.execute_sql)
+        self.assertEqual("SELECT ts FROM slack_messages WHERE author_name = %s::varchar AND attendance_day = ANY(%s::date[])",
+                         statement.plain_sql)
+        with self.assertRaises(ValueError):
+            Statement("bad", ["varchar"], "SELECT $2")
+        with self.assertRaises(ValueError):
+            get_statement("unknown")
+
+    def test_prepare_once_per_connection(self):
+        (conn, cursor) = (self.FakeConnection(), self.FakeCursor())
+        db_tools = self.FakeDBTools(conn, cursor)
+        for _ in range(3):
+            self.assertEqual([{"ts": "1.1"}], db_tools.execute_prepared("attended", (["junho85"], [], None, None)))
+
+        self.assertTrue(cursor.executed[0].startswith("PREPARE attended "))
+        self.assertEqual(["EXECUTE attended (%s::varchar[], %s::date[], %s::timestamp, %s::timestamp)"] * 3,
+                         cursor.executed[1:])
+        self.assertEqual(1, conn.commits)
+
+        db_tools = self.FakeDBTools(conn, self.FakeCursor(), use_prepared=False)
+        db_tools.execute_prepared("attended", (["junho85"], [], None, None))
+        self.assertTrue(db_tools.cursor.executed[0].startswith("SELECT DISTINCT author_name"))
+
+    def test_lock_after_prepare(self):
+        # PREPARE 의 commit 이 transaction advisory lock 을 풀지 않도록
+        (conn, cursor) = (self.FakeConnection(), self.FakeCursor())
+        db_tools = self.FakeDBTools(conn, cursor)
+        db_tools.execute_prepared_many("attended", [(["junho85"], [], None, None)] * 2, lock="ingest_seq")
+
+        self.assertTrue(cursor.executed[0].startswith("PREPARE attended "))
+        self.assertEqual("SELECT pg_advisory_xact_lock(%s)", cursor.executed[1])
+        self.assertEqual(["EXECUTE attended (%s::varchar[], %s::date[], %s::timestamp, %s::timestamp)"] * 2,
+                         cursor.executed[2:])
+
+    def test_find_slack_messages_whitelist(self):
+        db_tools = self.FakeDBTools(self.FakeConnection(), self.FakeCursor())
+        for kwargs in ({"sort_by": "ts; DROP TABLE slack_messages"}, {"limit": "10"}, {"limit": 0.5},
+                       {"limit": 100000}, {"filters": {"1=1 OR ts": "x"}}):
+            with self.assertRaises(ValueError):
+                db_tools.find_slack_messages(**kwargs)
+
+
+class RepoRollupTest(SimpleTestCase):
+    def test_get_repository(self):
+        self.assertEqual("junho85/TIL", get_repository({"footer": "<https://github.com/junho85/TIL|junho85/TIL>"}))
+        self.assertEqual("junho85/TIL", get_repository({"fallback": "[junho85/TIL] <https://github.com/junho85/TIL/compare/1...2|2 new commits>"}))
+        self.assertIsNone(get_repository({"text": "no repository"}))
+
+    def test_count_repo_commits(self):
+        text = ("<https://github.com/junho85/TIL/commit/027dfe626170f09e8c1deb5e75b4fc4e9565ffce|`027dfe62`> - a\n"
+                "<https://github.com/junho85/TIL/commit/a29a33f31b08767a228701a4737c131d75902ab9|`a29a33f3`> - b")
+        footer = "<https://github.com/junho85/TIL|junho85/TIL>"
+        messages = [
+            {"attendance_day": date(2021, 1, 18), "attachments": [{"author_name": "junho85", "text": text, "footer": footer}]},
+            {"attendance_day": date(2021, 1, 18), "attachments": [{"author_name": "junho85", "text": "wip", "footer": footer}]},
+            {"attendance_day": None, "attachments": [{"author_name": "junho85", "text": text, "footer": footer}]},
+        ]
+        self.assertEqual({("junho85/TIL", date(2021, 1, 18), "junho85"): 3}, dict(count_repo_commits(messages)))
+
+    def test_add_repo_rollups_on_the_saving_cursor(self):
+        footer = "<https://github.com/junho85/TIL|junho85/TIL>"
+        day = date(2021, 1, 18)
+        edited = {"attendance_day": day, "attachments": [{"author_name": "junho85", "text": "a", "footer": footer}]}
+        before = {"attendance_day": day, "attachments": [
+            {"author_name": "junho85", "text": "a", "footer": footer},
+            {"author_name": "junho85", "text": "b", "footer": "<https://github.com/junho85/garden6|junho85/garden6>"},
+        ]}
+        cursor = mock.Mock()
+
+        add_repo_rollups(cursor, [edited], [before])
+        (query, params) = cursor.execute.call_args[0]
+        self.assertEqual((["junho85/garden6"], [day], ["junho85"], [-1]), params)
+
+        cursor.reset_mock()
+        add_repo_rollups(cursor, [edited], [edited])
+        cursor.execute.assert_not_called()
+
+    def test_rebuild_only_the_season_under_the_ingest_lock(self):
+        day = date(2021, 1, 18)
+        message = {"attendance_day": day, "attachments": [
+            {"author_name": "junho85", "text": "a", "footer": "<https://github.com/junho85/TIL|junho85/TIL>"}]}
+        cursor = mock.Mock()
+        # server-side cursor
+        messages = mock.MagicMock()
+        messages.__enter__.return_value = messages
+        messages.__iter__.return_value = iter([message])
+        conn = mock.Mock(cursor=mock.Mock(return_value=messages))
+
+        class FakeDBTools:
+            @contextmanager
+            def pooled_cursor(self):
+                yield conn, cursor
+
+        self.assertEqual((1, 1), rebuild_repo_rollups(FakeDBTools(), day, date(2021, 4, 27)))
+        queries = [" ".join(call[0][0].split()) for call in cursor.execute.call_args_list]
+        # writer 들과 같은 lock 을 잡고 나서 읽고, 시즌 출석일만 지움
+        self.assertEqual("SELECT pg_advisory_xact_lock(%s)", queries[0])
+        self.assertEqual("DELETE FROM repo_daily_commits WHERE attendance_day BETWEEN %s AND %s", queries[1])
+        self.assertEqual((day, date(2021, 4, 27)), cursor.execute.call_args_list[1][0][1])
+        self.assertTrue(queries[2].startswith("INSERT INTO repo_daily_commits"))
+
+
+@unittest.skipIf(season_archive.pyarrow is None, "pyarrow is not installed")
+class SeasonArchiveTest(SimpleTestCase):
+    class FakeDBTools:
+        def iter_query(self, query, params=None, itersize=2000):
+            if "GROUP BY" in query:
+                yield {"user": "junho85", "attendance_day": date(2021, 1, 18),
+                       "first_ts": datetime(2021, 1, 18, 9, 0), "commit_messages": 1}
+                return
+            yield {"ts": "1610928000.000100", "ts_for_db": datetime(2021, 1, 18, 9, 0),
+                   "attendance_day": date(2021, 1, 18), "author_name": "junho85", "commit_text": "first",
+                   "bot_id": None, "type": "message", "text": "", "user": None, "team": None,
+                   "attachments": '[{"author_name": "junho85", "text": "first"}]'}
+
+    def test_export_and_read(self):
+        with tempfile.TemporaryDirectory() as directory:
+            archive = season_archive.SeasonArchive(directory)
+            info = archive.export_season(self.FakeDBTools(), date(2021, 1, 18), 100)
+            self.assertEqual(1, info["messages"])
+
+            season = archive.find_season(date(2021, 1, 18))
+            self.assertEqual([{"user": "junho85", "first_ts": datetime(2021, 1, 18, 9, 0)}],
+                             season.get_attendance(date(2021, 1, 18)))
+            self.assertEqual({date(2021, 1, 18): [{"ts": datetime(2021, 1, 18, 9, 0), "message": ["first"]}]},
+                             season.find_attendance_by_user("junho85"))
+            self.assertIsNone(archive.find_season(date(2021, 5, 1)))
+
+    class RepeatedDBTools(FakeDBTools):
+        def iter_query(self, query, params=None, itersize=2000):
+            rows = list(super().iter_query(query, params, itersize))
+            for i in range(1000):
+                yield from rows
+
+    def test_files_are_compressed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            archive = season_archive.SeasonArchive(directory)
+            archive.export_season(self.RepeatedDBTools(), date(2021, 1, 18), 100)
+
+            season = archive.open_season(date(2021, 1, 18))
+            path = os.path.join(archive.get_season_dir(date(2021, 1, 18)), "messages.arrow")
+            self.assertLess(os.path.getsize(path), season.messages.nbytes / 2)
+            # 한번 풀어서 연 시즌은 다시 읽지 않음
+            self.assertIs(season, archive.open_season(date(2021, 1, 18)))
+
+    def test_rewrite_uncompressed_season(self):
+        with tempfile.TemporaryDirectory() as directory:
+            archive = season_archive.SeasonArchive(directory)
+            with mock.patch.object(season_archive, "COMPRESSION", None):
+                archive.export_season(self.RepeatedDBTools(), date(2021, 1, 18), 100)
+            path = os.path.join(archive.get_season_dir(date(2021, 1, 18)), "messages.arrow")
+            uncompressed = os.path.getsize(path)
+
+            archive.rewrite_season(date(2021, 1, 18))
+            self.assertLess(os.path.getsize(path), uncompressed / 2)
+            season = archive.open_season(date(2021, 1, 18))
+            self.assertEqual(["first"], season.find_attendance_by_user("junho85")[date(2021, 1, 18)][0]["message"])
+
+    def test_shared_per_process(self):
+        self.assertIs(season_archive.get_season_archive(), season_archive.get_season_archive())
+
+
+class BSONReaderTest(SimpleTestCase):
+    # {"ts": "1.5", "n": 3, "ok": true, "a": ["x"]}
+    DOCUMENT = bytes.fromhex(
+        "2e000000"
+        "0274730004000000312e3500"
+        "106e0003000000"
+        "086f6b0001"
+        "0461000e00000002300002000000780000"
+        "00"
+    )
+
+    def test_decode(self):
+        self.assertEqual({"ts": "1.5", "n": 3, "ok": True, "a": ["x"]}, decode(self.DOCUMENT))
+
+    def test_iter_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "messages.bson")
+            with open(path, "wb") as file:
+                file.write(self.DOCUMENT * 2)
+            self.assertEqual(2, len(list(iter_bson_file(path))))
+
+    def test_unterminated(self):
+        with self.assertRaises(BSONError):
+            decode(self.DOCUMENT[:-1] + b"\x01")
+
+
+class ConfigSnapshotTest(SimpleTestCase):
+    def test_rebuild_when_config_changes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config_path = os.path.join(directory, "config.ini")
+            snapshot_path = os.path.join(directory, "snapshot.json")
+            with open(config_path, "w") as file:
+                file.write("[DEFAULT]\nCHANNEL_ID = C1\n\n[POSTGRES]\nSCHEMA = garden6\n")
+
+            snapshot = load_snapshot(directory, snapshot_path)
+            self.assertEqual("C1", snapshot.get("DEFAULT", "CHANNEL_ID"))
+            self.assertEqual("C1", snapshot.get("POSTGRES", "CHANNEL_ID"))
+            self.assertIsNone(snapshot.get_users())
+            self.assertTrue(os.path.exists(snapshot_path))
+
+            with open(config_path, "w") as file:
+                file.write("[DEFAULT]\nCHANNEL_ID = C2\n")
+            os.utime(config_path, ns=(0, 0))
+            self.assertEqual("C2", load_snapshot(directory, snapshot_path).get("DEFAULT", "CHANNEL_ID"))
+
+    def test_snapshot_is_private(self):
+        # token, 비밀번호가 들어 있으므로 umask 와 상관없이 소유자만 읽음
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "config.ini"), "w") as file:
+                file.write("[DEFAULT]\nSLACK_API_TOKEN = xoxb-secret\n")
+            snapshot_path = os.path.join(directory, "snapshot.json")
+
+            umask = os.umask(0o022)
+            try:
+                load_snapshot(directory, snapshot_path)
+                self.assertEqual(0o600, os.stat(snapshot_path).st_mode & 0o777)
+
+                # 예전에 0644 로 만든 snapshot 은 다시 씀
+                os.chmod(snapshot_path, 0o644)
+                load_snapshot(directory, snapshot_path)
+                self.assertEqual(0o600, os.stat(snapshot_path).st_mode & 0o777)
+            finally:
+                os.umask(umask)
+
+
+class CollectLockTest(SimpleTestCase):
+    def test_collect_without_lock_when_postgres_is_down(self):
+        # Postgres 장애 중에는 짧게만 기다리고 lock 없이 큐에 넣음
+        snapshot = ConfigSnapshot({"config": {"POSTGRES": {}}})
+        with mock.patch.object(collector, "connect_db", side_effect=OSError("timeout expired")) as connect_db, \
+                mock.patch("builtins.print"):
+            with collector.collect_lock(snapshot) as acquired:
+                self.assertTrue(acquired)
+        connect_db.assert_called_once_with(snapshot, connect_timeout=collector.LOCK_CONNECT_TIMEOUT)
+
+    def test_lock_connect_timeout_from_config(self):
+        snapshot = ConfigSnapshot({"config": {"POSTGRES": {"lock_connect_timeout": "5"}}})
+        with mock.patch.object(collector, "connect_db", side_effect=OSError("timeout expired")) as connect_db, \
+                mock.patch("builtins.print"):
+            with collector.collect_lock(snapshot):
+                pass
+        connect_db.assert_called_once_with(snapshot, connect_timeout=5)
+
+
+class OffloadTest(SimpleTestCase):
+    def test_lane_is_bounded(self):
+        lock = threading.Lock()
+        running = [0, 0]  # (실행 중, 최대)
+
+        def work():
+            with lock:
+                running[0] += 1
+                running[1] = max(running[1], running[0])
+            threading.Event().wait(0.02)
+            with lock:
+                running[0] -= 1
+            return threading.current_thread().name
+
+        async def run():
+            return await asyncio.gather(*[offload.run_slack(work) for _ in range(6)])
+
+        names = asyncio.run(run())
+        self.assertEqual(offload.SLACK_THREADS, running[1])
+        self.assertTrue(all(name.startswith("offload-slack") for name in names))
+
+
+class ProfilingTest(SimpleTestCase):
+    class FakeCursor:
+        rowcount = 2
+
+        def execute(self, query, params=None):
+            pass
+
+    def test_records_only_when_active(self):
+        @profiling.profiled("work")
+        def work():
+            return 1
+
+        self.assertEqual(1, work())
+
+        profile = profiling.RequestProfile("GET", "/attendance/api/gets")
+        token = profiling.activate(profile)
+        try:
+            work()
+            work()
+            profiling.ProfilingCursor(self.FakeCursor(), profile).execute("SELECT  *\n FROM slack_messages")
+        finally:
+            profiling.deactivate(token)
+        work()
+
+        self.assertEqual(2, profile.calls["work"]["count"])
+        self.assertEqual("SELECT * FROM slack_messages", profile.sql[0]["query"])
+        self.assertEqual(2, profile.sql[0]["rows"])
+
+    def test_offload_work_is_profiled(self):
+        def work():
+            return sum(range(1000))
+
+        async def run():
+            token = profiling.activate(profile)
+            try:
+                return await offload.run_db(profiling.profiled("sum")(work))
+            finally:
+                profiling.deactivate(token)
+
+        profile = profiling.RequestProfile("GET", "/attendance/api/gets")
+        with mock.patch.object(offload, "get_lane_size", return_value=1):
+            self.assertEqual(499500, asyncio.run(run()))
+        profile.finish(200)
+
+        data = profile.to_dict()
+        self.assertEqual(1, data["calls"][0]["count"])
+        self.assertIn("work", data["stats"])
+
+
+class SingleFlightTest(SimpleTestCase):
+    def test_concurrent_requests_share_one_call(self):
+        flight = SingleFlight("test")
+        calls = []
+        release = threading.Event()
+
+        def compute(value):
+            calls.append(value)
+            release.wait(5)
+            return {"value": value}
+
+        async def run():
+            tasks = [asyncio.ensure_future(flight.run("key", "slack", compute, 1)) for _ in range(5)]
+            await asyncio.sleep(0.05)
+            release.set()
+            return await asyncio.gather(*tasks)
+
+        results = asyncio.run(run())
+        self.assertEqual([1], calls)
+        self.assertEqual([{"value": 1}] * 5, results)
+        self.assertEqual({"leaders": 1, "coalesced": 4, "errors": 0, "in_flight": 0}, flight.get_stats())
+
+    def test_cancelled_waiter_does_not_cancel_others(self):
+        flight = SingleFlight("test")
+        release = threading.Event()
+        # lane 스레드를 모두 막아서 계산이 큐에서 기다리는 동안 취소
+        blockers = [offload.submit("slack", release.wait, 5) for _ in range(offload.SLACK_THREADS)]
+
+        async def run():
+            tasks = [asyncio.ensure_future(flight.run("key", "slack", lambda: "done")) for _ in range(3)]
+            await asyncio.sleep(0.05)
+            tasks[0].cancel()
+            await asyncio.sleep(0.05)
+            release.set()
+            return await asyncio.gather(*tasks, return_exceptions=True)
+
+        results = asyncio.run(run())
+        for blocker in blockers:
+            blocker.result(5)
+        self.assertIsInstance(results[0], asyncio.CancelledError)
+        self.assertEqual(["done", "done"], results[1:])
+        self.assertEqual({"leaders": 1, "coalesced": 2, "errors": 0, "in_flight": 0}, flight.get_stats())
+
+
+class SchedulerTest(SimpleTestCase):
+    class FakeDBTools:
+        def __init__(self):
+            self.runs = []
+            self.locked = False
+
+        @contextmanager
+        def advisory_lock(self, name):
+            yield not self.locked
+
+        def execute_query(self, query, params=None, fetch_one=False, fetch_all=True):
+            if query.strip().startswith("SELECT MAX"):
+                slots = [run["scheduled_at"] for run in self.runs if run["job"] == params[0]]
+                return {"scheduled_at": max(slots) if slots else None}
+            run = self.runs[params[-1] - 1]
+            (run["status"], run["rows"]) = (params[2], params[3])
+
+        @contextmanager
+        def pooled_cursor(self):
+            db_tools = self
+
+            class Cursor:
+                def execute(self, query, params):
+                    db_tools.runs.append({"job": params[0], "scheduled_at": params[1], "status": params[3],
+                                          "missed_runs": params[4]})
+
+                def fetchone(self):
+                    return {"id": len(db_tools.runs)}
+
+            yield None, Cursor()
+
+    def test_slot(self):
+        job = Job("notify", None, 86400, 22 * 3600)
+        self.assertEqual(datetime(2021, 1, 17, 22, 0), job.get_slot(datetime(2021, 1, 18, 9, 0)))
+        self.assertEqual(datetime(2021, 1, 18, 22, 0), job.get_slot(datetime(2021, 1, 18, 22, 0)))
+        self.assertEqual(datetime(2021, 1, 17, 23, 5), Job("collect", None, 3600, 300).get_slot(datetime(2021, 1, 18, 0, 2)))
+
+    def test_missed_runs_are_coalesced(self):
+        db_tools = self.FakeDBTools()
+        calls = []
+        job = Job("collect", lambda: calls.append(1) or {"rows": 3}, 3600)
+        scheduler = Scheduler(db_tools, [job], ZoneInfo("Asia/Seoul"), jitter=0)
+
+        scheduler.run_pending(datetime(2021, 1, 18, 9, 10))
+        scheduler.run_pending(datetime(2021, 1, 18, 9, 50))
+        self.assertEqual(1, len(calls))
+
+        # 12시에 다시 실행. 10, 11시 실행은 합쳐짐
+        scheduler.run_pending(datetime(2021, 1, 18, 12, 1))
+        self.assertEqual(2, len(calls))
+        self.assertEqual([0, 2], [run["missed_runs"] for run in db_tools.runs])
+        self.assertEqual(["succeeded", "succeeded"], [run["status"] for run in db_tools.runs])
+
+        # 다른 프로세스가 lock 을 잡고 있으면 실행하지 않음
+        db_tools.locked = True
+        scheduler.run_pending(datetime(2021, 1, 18, 13, 0))
+        self.assertEqual(2, len(calls))
@@ -6,9 +6,19 @@ urlpatterns = [
     path('', views.index, name='index'), # 출석부 첫화면
     path('api/users/', views.users, name='users'), # 정원사들 리스트
     path('api/gets', views.gets, name='get'), # 전체 출석부 조회. 리스트. 유저별.
+    path('api/stats', views.stats, name='stats'), # 출석 통계. 유저별 출석률, 날짜별 출석 인원
+    path('api/cohort', views.cohort, name='cohort'), # 기간 동안 매일/하루라도/한번도 출석한 정원사들
+    path('api/days', views.days, name='days'), # 여러 정원사가 모두/한명이라도 출석한 날짜들
+    path('api/repos', views.repos, name='repos'), # 커밋이 많은 저장소들
+    path('api/search', views.search, name='search'), # 커밋 메시지 검색
+    path('export/<name>.csv', views.export_csv, name='export_csv'), # 출석부 CSV 내보내기 (attendance, commits)
     path('collect/', views.collect, name='collect'), # slack_messages 수집
+    path('slack/events/', views.slack_events, name='slack_events'), # Slack Events API 수신
     path('get/<date>', views.get, name='get'), # 특정일의 출석부 조회. 날짜기준
+    path('events/', views.events, name='events'), # 실시간 출석 업데이트 (SSE)
+    path('api/metrics', views.metrics, name='metrics'), # 운영 지표
 
     path('users/<user>/', views.user, name='user'), # 유저별 출석부 데이터 페이지
     path('api/users/<user>/', views.user_api, name='user'), # 특정 유저의 출석 데이터
+    path('api/users/<user>/repos', views.user_repos, name='user_repos'), # 특정 유저의 저장소별 커밋 수
 ]
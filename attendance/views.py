@@ -1,10 +1,25 @@
+import asyncio
+import json
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from datetime import datetime, timedelta
 from .garden import Garden
 import pprint
 import markdown
 from .slack_markdown import slack_markdown_to_html
+from .slack_user_directory import get_slack_user_directory
+from .live_updates import broadcaster
+from .slack_tools import get_slack_tools
+from .slack_events import verify_signature, get_ingestible_message
+from .ingest_writer import get_ingest_writer
+from .attendance_index import get_attendance_index
+from .export_tools import ExportTools, EXPORTS
+from .db_tools import DBTools
+from . import offload, single_flight, warmup
 
 
 def index(request):
@@ -40,36 +55,169 @@ def user(request, user):
     return render(request, 'attendance/users.html', context)
 
 
-# 유저의 출석데이터
-def user_api(request, user):
+"""
+since 파라미터 파싱
+YYYY-MM-DD 이면 그 날짜 이후 전체, 숫자(이전 응답의 next 토큰, 처음에는 0) 이면 그 이후 새로 저장되거나 고친 커밋만
+@return (since_day, after_seq)
+"""
+def parse_since(since):
+    if not since:
+        return None, None
+
+    if since.isdigit():
+        return None, int(since)
+    return datetime.strptime(since, "%Y-%m-%d").date(), None
+
+
+"""
+유저의 출석데이터 조회. user_api 에서 db lane 스레드로 실행
+@return (attendances, 가장 큰 ingest_seq 또는 None)
+"""
+def find_user_attendances(user, since_day, after_seq, season_start):
     garden = Garden()
-    result = garden.find_attendance_by_user(user)
+    if season_start is not None:
+        # 이전 시즌. 보관 파일에서 읽고 바뀌지 않으므로 next 없음
+        (result, last_seq) = (garden.find_attendance_by_user(user, season_start), None)
+    else:
+        (result, last_seq) = garden.find_attendance_updates(user, since_day, after_seq)
+    user_names = get_slack_user_directory().get_display_names() if result else {}
 
-    output = []
+    attendances = []
     for (date, commits) in result.items():
+        # 고쳐서 커밋이 없어진 메시지는 뺌 (출석일이 지워지기 전에 저장된 row)
+        commits = [commit for commit in commits if commit["message"]]
+        if not commits:
+            continue
         for commit in commits:
-            commit["message"][0] = slack_markdown_to_html(commit["message"][0])
+            commit["message"][0] = slack_markdown_to_html(commit["message"][0], user_names)
             # commit["message"][0] = "<br>".join(commit["message"][0].split("\n"))
-        output.append({"date": date, "commits": commits})
+        attendances.append({"date": date, "commits": commits})
+    return attendances, last_seq
+
+
+# 유저의 출석데이터
+# since 가 없으면 예전 그대로 전체 리스트
+# since 가 있으면 {"attendances": 그 이후 새로 저장되거나 고친 커밋들, "next": 다음 since 로 쓸 토큰}
+# 고친 커밋은 같은 ts 로 다시 오므로 받는 쪽에서 ts 로 바꿔 끼움
+# season(시즌 시작일 YYYY-MM-DD) 이 있으면 이전 시즌
+async def user_api(request, user):
+    since = request.GET.get('since')
+    try:
+        (since_day, after_seq) = parse_since(since)
+    except ValueError:
+        return JsonResponse({"error": "invalid since"}, status=400)
+
+    season_start = None
+    if 'season' in request.GET:
+        try:
+            season_start = datetime.strptime(request.GET['season'], "%Y-%m-%d").date()
+        except ValueError:
+            return JsonResponse({"error": "invalid season"}, status=400)
+
+    # 같은 요청이 동시에 들어오면 한번만 조회 (single_flight)
+    (attendances, last_seq) = await single_flight.get_single_flight("user").run(
+        (user, since_day, after_seq, season_start), "db", find_user_attendances, user, since_day, after_seq, season_start)
+
+    if since is None:
+        return JsonResponse(attendances, safe=False)
+
+    # 현재 시즌은 결과가 없어도 순번(find_attendance_updates)을 줌. 이전 시즌은 바뀌지 않으므로 받은 since 그대로
+    next_since = str(last_seq) if last_seq is not None else since
+    return JsonResponse({"attendances": attendances, "next": next_since})
 
-    return JsonResponse(output, safe=False)
+
+# cli_collect.py, 예약 작업과 같은 lock 을 잡고 수집. 다른 곳에서 수집 중이면 None
+def collect_with_lock(garden, oldest, latest):
+    with garden.db_tools.advisory_lock("collect") as acquired:
+        if not acquired:
+            return None
+        return garden.collect_slack_messages(oldest, latest)
 
 
 # slack_messages 수집
-def collect(request):
-    oldest = datetime.strptime(request.GET.get('start'), "%Y-%m-%d").timestamp()
-    latest = datetime.strptime(request.GET.get('end'), "%Y-%m-%d").timestamp()
+async def collect(request):
+    garden = Garden()
+
+    oldest = datetime.strptime(request.GET.get('start'), "%Y-%m-%d").replace(tzinfo=garden.time_zone).timestamp()
+    latest = datetime.strptime(request.GET.get('end'), "%Y-%m-%d").replace(tzinfo=garden.time_zone).timestamp()
+
+    # 큐에 넣고 바로 응답. 저장은 백그라운드 writer 가 함
+    # slack API 는 느릴 수 있어서 slack lane 에서 기다림. 그동안 다른 요청은 그대로 처리됨
+    queued = await offload.run_slack(collect_with_lock, garden, oldest, latest)
+    if queued is None:
+        return JsonResponse({"error": "collect is already running"}, status=409)
+    get_ingest_writer()
+
+    return JsonResponse({"queued": queued})
+
+
+# Slack Events API 수신. 검증 후 큐에만 넣고 바로 응답 (3초 제한)
+# 큐는 웹 프로세스의 백그라운드 writer (또는 cli_ingest_writer.py) 가 slack_messages 에 저장
+@csrf_exempt
+@require_POST
+def slack_events(request):
+    slack_tools = get_slack_tools()
+
+    if not verify_signature(slack_tools.get_signing_secret(),
+                            request.headers.get('X-Slack-Request-Timestamp'),
+                            request.body,
+                            request.headers.get('X-Slack-Signature')):
+        return HttpResponse(status=403)
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return HttpResponse(status=400)
+
+    if payload.get("type") == "url_verification":
+        return JsonResponse({"challenge": payload.get("challenge")})
 
+    message = get_ingestible_message(payload, slack_tools.get_channel_id(), slack_tools.get_github_bot_id())
+    if message is not None:
+        # 웹 프로세스의 writer 와 같은 큐. 요청마다 SQLite 스키마를 확인하지 않음
+        get_ingest_writer().queue.put([message])
+
+    return HttpResponse(status=200)
+
+
+# liveness. 프로세스가 요청을 처리할 수 있으면 200
+def healthz(request):
+    return HttpResponse("ok")
+
+
+# readiness. 준비 작업(연결 풀, 출석 인덱스)이 끝났고 DB 에 연결되면 200
+def readyz(request):
+    if not warmup.ready.is_set():
+        # gunicorn hook 없이 실행한 경우(runserver 등) 여기서 시작
+        warmup.start_warm_up()
+        return HttpResponse("warming up", status=503)
+    try:
+        DBTools().execute_query("SELECT 1", fetch_one=True)
+    except Exception as err:
+        print(err)
+        return HttpResponse("database unavailable", status=503)
+    return HttpResponse("ok")
+
+
+# 운영 지표. 저장 대기 큐 길이, batch 저장 시간, 합쳐진 요청 수 등
+def metrics(request):
+    return JsonResponse({"ingest": get_ingest_writer().get_stats(), "single_flight": single_flight.get_stats()})
+
+
+def find_attendance(selected_date):
     garden = Garden()
-    garden.collect_slack_messages(oldest, latest)
+    # 이전 시즌은 보관 파일에서
+    if selected_date < garden.get_start_date():
+        return garden.get_attendance(selected_date)
 
-    return JsonResponse({})
+    index = get_attendance_index()
+    return [{"user": user, "first_ts": index.get_first_commit(user, selected_date)} for user in garden.get_users()]
 
 
 # 특정일의 출석 데이터 불러오기
-def get(request, date):
-    garden = Garden()
-    result = garden.get_attendance(datetime.strptime(date, "%Y%m%d").date())
+async def get(request, date):
+    selected_date = datetime.strptime(date, "%Y%m%d").date()
+    result = await single_flight.get_single_flight("get").run(selected_date, "db", find_attendance, selected_date)
     return JsonResponse(result, safe=False)
 
 
@@ -78,21 +226,213 @@ def daterange(start_date, end_date):
         yield start_date + timedelta(n)
 
 
-# 전체 출석부 조회
-def gets(request):
+def find_all_attendances():
     garden = Garden()
+    index = get_attendance_index()
 
     result = []
 
+    for user in garden.get_users():
+        # convert key type datetime.date to string
+        attendances = {}
+        for (key_date, first_ts) in index.get_first_commits(user).items():
+            attendances[key_date.strftime("%Y-%m-%d")] = first_ts
+
+        result.append({"user": user, "attendances": attendances})
+    return result
+
+
+# 전체 출석부 조회
+# 출석 인덱스가 만료되면 DB 에서 다시 읽으므로 db lane 에서 실행. 동시에 들어온 요청들은 한번만 계산
+async def gets(request):
+    result = await single_flight.get_single_flight("gets").run("gets", "db", find_all_attendances)
+    return JsonResponse(result, safe=False)
+
+
+def get_stats():
+    garden = Garden()
+    index = get_attendance_index()
+
+    today = datetime.now(garden.time_zone).date()
+    progressed_days = max(0, min(int(garden.get_gardening_days()), (today - garden.get_start_date()).days + 1))
+
     users = garden.get_users()
+    result_users = []
     for user in users:
-        attendances = garden.find_attendance_by_user(user)
+        count = index.count(user, today)
+        rate = count / progressed_days * 100 if progressed_days else 0
+        result_users.append({"user": user, "count": count, "rate": rate})
 
-        # convert key type datetime.date to string
-        for key_date in list(attendances.keys()).copy():
-            formatted_date = key_date.strftime("%Y-%m-%d")
-            attendances[formatted_date] = attendances.pop(key_date)[0]["ts"]
+    daily_count = {}
+    for (day_offset, count) in enumerate(index.daily_counts(users, progressed_days)):
+        daily_count[index.to_date(day_offset).strftime("%Y-%m-%d")] = count
 
-        result.append({"user": user, "attendances": attendances})
+    return {"progressed_days": progressed_days, "users": result_users, "daily_count": daily_count}
+
+
+# 출석 통계. 유저별 출석 일수/출석률, 날짜별 출석 인원
+async def stats(request):
+    return JsonResponse(await offload.run_db(get_stats))
+
+
+def parse_day_window(request, garden):
+    """from, to 파라미터(YYYY-MM-DD). 없으면 시작일 ~ 오늘. from 이 to 보다 나중이면 ValueError"""
+    today = datetime.now(garden.time_zone).date()
+    from_day = datetime.strptime(request.GET["from"], "%Y-%m-%d").date() if "from" in request.GET else garden.get_start_date()
+    to_day = datetime.strptime(request.GET["to"], "%Y-%m-%d").date() if "to" in request.GET else today
+    if from_day > to_day:
+        raise ValueError("from %s is after to %s" % (from_day, to_day))
+    return from_day, to_day
+
+
+# 기간 동안 매일 출석(all)/하루라도 출석(any)/한번도 출석 안한(none) 정원사들
+# e.g.) /attendance/api/cohort?from=2021-01-18&to=2021-01-24&mode=all
+def cohort(request):
+    garden = Garden()
+    index = get_attendance_index()
+
+    mode = request.GET.get("mode", "all")
+    if mode not in ("all", "any", "none"):
+        return JsonResponse({"error": "mode must be one of all, any, none"}, status=400)
+    try:
+        (from_day, to_day) = parse_day_window(request, garden)
+    except ValueError:
+        return JsonResponse({"error": "invalid date"}, status=400)
+
+    users = index.find_users(garden.get_users(), from_day, to_day, mode)
+    return JsonResponse({"from": from_day, "to": to_day, "mode": mode, "users": users, "count": len(users)})
+
+
+# 여러 정원사가 모두(and)/한명이라도(or) 출석한 날짜들
+# e.g.) /attendance/api/days?users=junho85,other&op=and
+def days(request):
+    garden = Garden()
+    index = get_attendance_index()
+
+    op = request.GET.get("op", "or")
+    if op not in ("and", "or"):
+        return JsonResponse({"error": "op must be and or or"}, status=400)
+    try:
+        (from_day, to_day) = parse_day_window(request, garden)
+    except ValueError:
+        return JsonResponse({"error": "invalid date"}, status=400)
+
+    users = [user for user in request.GET.get("users", "").split(",") if user] or garden.get_users()
+    result = index.combine_days(users, op, from_day, to_day)
+    return JsonResponse({"from": from_day, "to": to_day, "op": op, "users": users, "days": result, "count": len(result)})
+
+
+# 커밋이 많은 저장소들. repo_daily_commits 집계만 읽음
+# e.g.) /attendance/api/repos?from=2021-01-18&to=2021-01-24&limit=10
+def repos(request):
+    garden = Garden()
+    try:
+        (from_day, to_day) = parse_day_window(request, garden)
+        limit = min(100, max(1, int(request.GET.get("limit", 20))))
+    except ValueError:
+        return JsonResponse({"error": "invalid parameter"}, status=400)
+
+    result = garden.find_top_repositories(from_day, to_day, limit)
+    return JsonResponse({"from": from_day, "to": to_day, "repositories": result})
+
+
+# 특정 유저의 저장소별 커밋 수
+def user_repos(request, user):
+    garden = Garden()
+    try:
+        (from_day, to_day) = parse_day_window(request, garden)
+    except ValueError:
+        return JsonResponse({"error": "invalid date"}, status=400)
+
+    result = garden.find_repositories_by_user(user, from_day, to_day)
+    return JsonResponse({"user": user, "from": from_day, "to": to_day, "repositories": result})
+
+
+# 커밋 메시지 검색. 관련도순, 같으면 최신순
+# e.g.) /attendance/api/search?q=refactor&author=junho85&from=2021-01-18&to=2021-01-24&page=2
+def search(request):
+    garden = Garden()
+
+    keyword = request.GET.get("q", "").strip()
+    if not keyword:
+        return JsonResponse({"error": "q is required"}, status=400)
+    try:
+        # 기본은 현재 시즌
+        from_day = datetime.strptime(request.GET["from"], "%Y-%m-%d").date() if "from" in request.GET \
+            else garden.get_start_date()
+        to_day = datetime.strptime(request.GET["to"], "%Y-%m-%d").date() if "to" in request.GET \
+            else garden.get_start_date() + timedelta(days=int(garden.get_gardening_days()) - 1)
+        page = max(1, int(request.GET.get("page", 1)))
+        limit = min(100, max(1, int(request.GET.get("limit", 20))))
+    except ValueError:
+        return JsonResponse({"error": "invalid parameter"}, status=400)
+
+    # 다음 페이지가 있는지 알기 위해 하나 더 조회
+    rows = garden.db_tools.search_commits(keyword, request.GET.get("author"), from_day, to_day,
+                                          limit + 1, (page - 1) * limit)
+    results = [{
+        "ts": row["ts"],
+        "ts_for_db": row["ts_for_db"],
+        "attendance_day": row["attendance_day"],
+        "user": row["author_name"],
+        "commits": row["commit_text"],
+        "rank": row["rank"],
+    } for row in rows[:limit]]
+
+    return JsonResponse({"results": results, "page": page, "next": page + 1 if len(rows) > limit else None})
+
+
+# 출석부 CSV 내보내기. DB 에서 읽는 대로 한 줄씩 보냄
+# e.g.) /attendance/export/attendance.csv?from=2021-01-18&to=2021-04-27
+def export_csv(request, name):
+    if name not in EXPORTS:
+        return HttpResponse(status=404)
+
+    garden = Garden()
+    try:
+        (from_day, to_day) = parse_day_window(request, garden)
+    except ValueError:
+        return JsonResponse({"error": "invalid date"}, status=400)
+
+    export_tools = ExportTools(garden.db_tools)
+    response = StreamingHttpResponse(export_tools.iter_csv(name, from_day, to_day), content_type="text/csv")
+    response["Content-Disposition"] = 'attachment; filename="%s_%s_%s.csv"' % (name, from_day, to_day)
+    return response
+
+
+# 실시간 출석 업데이트 연결 하나를 유지하는 최대 시간. 초
+# Django 4.2 ASGI handler 는 스트리밍 중에 http.disconnect 를 보지 않고, uvicorn 은 끊긴 연결에 send 해도 에러가 없어서
+# 브라우저가 떠나도 generator 가 끝나지 않음. 이 시간이 지나면 끝내고 브라우저는 retry 로 다시 연결함
+EVENTS_MAX_SECONDS = 300
+EVENTS_KEEPALIVE_SECONDS = 15
+
+
+# 실시간 출석 업데이트 (server-sent events). ASGI 로 실행해야 함
+async def events(request):
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse("server-sent events requires ASGI (garden6.asgi)", status=501)
+
+    async def stream():
+        queue = broadcaster.subscribe()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + EVENTS_MAX_SECONDS
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return
+                try:
+                    deltas = await asyncio.wait_for(queue.get(), timeout=min(EVENTS_KEEPALIVE_SECONDS, remaining))
+                except asyncio.TimeoutError:
+                    # 프록시가 연결을 끊지 않도록 주기적으로 보냄
+                    yield ": keepalive\n\n"
+                    continue
+                yield "data: %s\n\n" % json.dumps(deltas, cls=DjangoJSONEncoder)
+        finally:
+            broadcaster.unsubscribe(queue)
 
-    return JsonResponse(result, safe=False)
\ No newline at end of file
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,50 @@
+"""
+웹 worker 준비
+
+worker 가 요청을 받기 전에 DB 연결 풀, 출석 인덱스, slack 유저 디렉토리를 미리 만들어 둡니다.
+준비가 끝나면 readiness(/readyz) 가 200 을 응답합니다.
+"""
+import threading
+import time
+
+ready = threading.Event()
+_warm_up_lock = threading.Lock()
+_warm_up_thread = None
+
+
+def warm_up():
+    """준비 작업 실행. 성공하면 True"""
+    from attendance.attendance_index import get_attendance_index
+    from attendance.db_tools import DBTools
+    from attendance.slack_user_directory import get_slack_user_directory
+
+    try:
+        DBTools().warm_pool()
+        get_attendance_index()
+    except Exception as err:
+        print(err)
+        return False
+
+    # slack 유저 이름은 없어도 응답은 할 수 있음
+    try:
+        get_slack_user_directory().ensure_loaded()
+    except Exception as err:
+        print(err)
+
+    ready.set()
+    return True
+
+
+def retry_warm_up(interval=5):
+    while not warm_up():
+        time.sleep(interval)
+
+
+def start_warm_up():
+    """백그라운드에서 준비될 때 까지 재시도"""
+    global _warm_up_thread
+    with _warm_up_lock:
+        if ready.is_set() or (_warm_up_thread is not None and _warm_up_thread.is_alive()):
+            return
+        _warm_up_thread = threading.Thread(target=retry_warm_up, name="warm-up", daemon=True)
+        _warm_up_thread.start()
@@ -0,0 +1,111 @@
+"""
+cron 수집기 import 시간 측정
+
+python -X importtime 으로 entry point 들을 각각 새 프로세스에서 import 해 보고
+전체 import 시간, 최대 메모리(RSS), 오래 걸리는 모듈들을 benchmarks/importtime.md 로 씁니다.
+
+e.g.)
+PYTHONPATH=. python benchmarks/importtime.py
+PYTHONPATH=. python benchmarks/importtime.py --runs 10 --output -
+"""
+import argparse
+import os
+import platform
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (이름, 실행할 때 import 되는 모듈들). 함수 안에서 import 하는 모듈도 포함
+ENTRY_POINTS = [
+    ("cli_collect.py --no-drain", "attendance.collector, attendance.config_snapshot, attendance.ingest_queue, "
+                                  "urllib.request, psycopg2"),
+    ("cli_collect.py (drain)", "attendance.collector, attendance.config_snapshot, attendance.ingest_queue, "
+                               "urllib.request, psycopg2, attendance.ingest_writer, attendance.garden"),
+    ("이전 cli_collect.py (Garden + slack SDK)", "attendance.garden, attendance.slack_tools, attendance.ingest_writer"),
+]
+
+CODE = "import resource, %s; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+
+
+def parse_importtime(stderr):
+    """[(self us, cumulative us, 모듈 이름, 깊이)]"""
+    result = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        (self_us, cumulative_us, name) = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        result.append((int(self_us), int(cumulative_us), name.strip(), depth))
+    return result
+
+
+def measure(modules, runs):
+    """가장 빠른 실행 기준 (전체 us, 최대 RSS KB, 모듈 목록). interpreter 시작할 때 import 되는 모듈도 들어있음"""
+    env = dict(os.environ, PYTHONPATH=BASE_DIR, DJANGO_SETTINGS_MODULE="garden6.settings")
+    best = None
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, "-X", "importtime", "-c", CODE % modules],
+                                   cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True)
+        imports = parse_importtime(completed.stderr)
+        total = sum(self_us for (self_us, _, _, _) in imports)
+        if best is None or total < best[0]:
+            best = (total, int(completed.stdout.strip().splitlines()[-1]), imports)
+    return best
+
+
+def subtract_startup(result, startup):
+    """interpreter 시작할 때 import 되는 모듈(site 등)을 뺌"""
+    (_, rss, imports) = result
+    startup_modules = {name for (_, _, name, _) in startup[2]}
+    imports = [i for i in imports if i[2] not in startup_modules]
+    return sum(self_us for (self_us, _, _, _) in imports), rss, imports
+
+
+def to_markdown(results, startup, runs, top):
+    lines = [
+        "# import time",
+        "",
+        "`python benchmarks/importtime.py --runs %d` 결과. %d번 실행 중 가장 빠른 실행 기준입니다." % (runs, runs),
+        "",
+        "* Python %s, %s" % (platform.python_version(), platform.platform()),
+        "* 전체: `-X importtime` self 시간 합. interpreter 시작할 때 import 되는 모듈(%.1f ms)은 뺐음" % (startup[0] / 1000),
+        "* RSS: import 후 최대 RSS (빈 interpreter %.1f MB)" % (startup[1] / 1024),
+        "",
+        "| entry point | 전체 (ms) | 모듈 수 | RSS (MB) |",
+        "|---|---|---|---|",
+    ]
+    for (name, modules, (total, rss, imports)) in results:
+        lines.append("| %s | %.1f | %d | %.1f |" % (name, total / 1000, len(imports), rss / 1024))
+
+    for (name, modules, (total, rss, imports)) in results:
+        lines += ["", "## %s" % name, "`import %s`" % modules, "", "오래 걸리는 top-level import (cumulative)", "",
+                  "| 모듈 | cumulative (ms) |", "|---|---|"]
+        top_level = sorted((i for i in imports if i[3] == 0), key=lambda i: -i[1])[:top]
+        for (_, cumulative_us, module, _) in top_level:
+            lines.append("| %s | %.1f |" % (module, cumulative_us / 1000))
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="cron 수집기 import 시간 측정")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", default=os.path.join(BASE_DIR, "benchmarks", "importtime.md"),
+                        help="- 이면 stdout")
+    args = parser.parse_args()
+
+    startup = measure("sys", args.runs)
+    results = [(name, modules, subtract_startup(measure(modules, args.runs), startup))
+               for (name, modules) in ENTRY_POINTS]
+    report = to_markdown(results, startup, args.runs, args.top)
+    if args.output == "-":
+        print(report, end="")
+    else:
+        with open(args.output, "w") as file:
+            file.write(report)
+        print("wrote %s" % args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""
+출석부 HTTP 부하 테스트 (docs/05.serving.md)
+
+seed: 로컬 Postgres 에 테이블을 만들고 이전 시즌 덤프(2021-01-18 시즌, 1563건)를 저장 경로(Garden.save_slack_messages)로 넣음
+run: gunicorn 을 띄우고 /readyz 가 200 이 되면 정해진 비율(mix)로 요청을 보냄.
+     endpoint 별 처리량, 응답 시간 p50/p90/p99, 에러율을 출력하고 기준(thresholds)을 넘으면 exit code 1
+
+config.ini 의 [POSTGRES] 가 로컬 DB 를 가리켜야 합니다. (SSLMODE = disable, START_DATE = 2021-01-18)
+users.yaml 에는 덤프의 정원사들이 있어야 유저별 요청이 의미가 있습니다. seed 가 덤프의 정원사들을 출력합니다.
+
+e.g.)
+PYTHONPATH=. python benchmarks/load_test.py seed --create-schema
+PYTHONPATH=. python benchmarks/load_test.py run --workers 2 --concurrency 50 --duration 30
+PYTHONPATH=. python benchmarks/load_test.py run --mix gets=50,user=50 --save benchmarks/load_baseline.json
+PYTHONPATH=. python benchmarks/load_test.py run --baseline benchmarks/load_baseline.json
+"""
+import argparse
+import glob
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "garden6.settings")
+
+THRESHOLDS_PATH = os.path.join(BASE_DIR, "benchmarks", "load_thresholds.json")
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+# 요청 종류별 비율. run --mix 로 고르거나 gets=60,user=40 처럼 직접 지정
+MIXES = {
+    # 미출석 알림 직후. 대시보드와 자기 출석부
+    "dashboard": {"gets": 50, "stats": 10, "user": 25, "user_page": 5, "day": 10},
+    # 평소. 날짜별 조회가 섞이고 가끔 수집
+    "mixed": {"gets": 30, "stats": 10, "user": 25, "user_page": 10, "day": 24, "collect": 1},
+}
+
+# 에러로 세지 않는 응답. 수집 중이면 collect 는 409
+EXPECTED_STATUS = {"collect": (200, 409)}
+
+
+def seed(args):
+    """로컬 DB 에 스키마를 만들고 덤프 저장"""
+    from attendance.db_tools import DBTools
+    from attendance.garden import Garden
+    from replay_ingest import DUMP_PATH, load_messages
+
+    db_tools = DBTools()
+    if db_tools.pg_host not in LOCAL_HOSTS and not args.allow_remote:
+        print("POSTGRES HOST is %s. seed writes to the database; use --allow-remote if this is not production" % db_tools.pg_host)
+        sys.exit(1)
+
+    if args.create_schema:
+        # supabase_schema.sql, attendance/sql/*.sql 순서대로 (08.schema). 파일들이 garden6 스키마를 씀
+        conn = db_tools.connect_db()
+        conn.autocommit = True
+        try:
+            paths = [os.path.join(BASE_DIR, "archive", "migration", "supabase_schema.sql")]
+            paths += sorted(glob.glob(os.path.join(BASE_DIR, "attendance", "sql", "*.sql")))
+            for path in paths:
+                print("apply %s" % os.path.relpath(path, BASE_DIR))
+                with open(path) as file, conn.cursor() as cursor:
+                    cursor.execute(file.read())
+        finally:
+            conn.close()
+
+    messages = load_messages(args.dump or DUMP_PATH)
+    garden = Garden()
+    inserted = 0
+    for offset in range(0, len(messages), args.batch_size):
+        inserted += len(garden.save_slack_messages(messages[offset:offset + args.batch_size]))
+
+    authors = sorted({message["attachments"][0].get("author_name") for message in messages
+                      if message.get("attachments") and message["attachments"][0].get("author_name")})
+    print("%d messages, %d inserted" % (len(messages), inserted))
+    print("days: %s ~ %s" % (datetime.fromtimestamp(float(messages[0]["ts"]), garden.time_zone).date(),
+                             datetime.fromtimestamp(float(messages[-1]["ts"]), garden.time_zone).date()))
+    print("authors: %s" % ", ".join(authors))
+
+
+def start_server(port, workers, log_path):
+    """gunicorn 실행. 운영과 같은 설정에서 주소, worker 수만 바꿈"""
+    env = dict(os.environ, GUNICORN_BIND="127.0.0.1:%d" % port, WEB_CONCURRENCY=str(workers))
+    log = open(log_path, "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "garden6/gunicorn.conf.py", "--access-logfile", "/dev/null",
+         "garden6.asgi:application"],
+        cwd=BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    log.close()
+    return process
+
+
+def wait_ready(host, port, timeout):
+    """/readyz 가 200 이 될 때 까지. 출석 인덱스를 읽는 동안은 503"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=5)
+            conn.request("GET", "/readyz")
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def get_json(host, port, path):
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    try:
+        conn.request("GET", path)
+        response = conn.getresponse()
+        return json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def build_targets(host, port):
+    """요청 종류별 경로 목록. 유저는 /api/users/, 날짜는 /api/stats 의 진행일에서"""
+    users = get_json(host, port, "/attendance/api/users/")
+    days = sorted(get_json(host, port, "/attendance/api/stats")["daily_count"]) or [datetime.now().strftime("%Y-%m-%d")]
+    today = datetime.strptime(days[-1], "%Y-%m-%d")
+    collect_query = urllib.parse.urlencode({"start": (today - timedelta(days=1)).strftime("%Y-%m-%d"),
+                                            "end": today.strftime("%Y-%m-%d")})
+    return {
+        "gets": ["/attendance/api/gets"],
+        "stats": ["/attendance/api/stats"],
+        "user": ["/attendance/api/users/%s/" % urllib.parse.quote(user) for user in users],
+        "user_page": ["/attendance/users/%s/" % urllib.parse.quote(user) for user in users],
+        "day": ["/attendance/get/%s" % day for day in days],
+        "collect": ["/attendance/collect/?" + collect_query],
+    }
+
+
+def parse_mix(value):
+    """이름(MIXES) 또는 gets=60,user=40"""
+    if value in MIXES:
+        return dict(MIXES[value])
+    mix = {}
+    for item in value.split(","):
+        (kind, weight) = item.split("=")
+        mix[kind.strip()] = float(weight)
+    return mix
+
+
+class LoadRunner:
+    """
+    concurrency 개의 스레드가 각자 keep-alive 연결 하나로 응답을 받으면 바로 다음 요청을 보냄 (closed loop)
+    warmup 초 동안의 결과는 버림
+    """
+
+    def __init__(self, host, port, targets, mix, concurrency, duration, warmup=5, timeout=30, seed=None):
+        self.host = host
+        self.port = port
+        self.targets = {kind: paths for (kind, paths) in targets.items() if paths and mix.get(kind)}
+        self.kinds = list(self.targets)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.concurrency = concurrency
+        self.duration = duration
+        self.warmup = warmup
+        self.timeout = timeout
+        self.seed = seed
+
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, kind, latency, status, error):
+        with self.lock:
+            self.latencies[kind].append(latency)
+            self.statuses[kind][status] += 1
+            if error:
+                self.errors[kind] += 1
+
+    def request(self, conn, path):
+        conn.request("GET", path)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+
+    def run_client(self, number, measure_from, stop_at):
+        rng = random.Random(None if self.seed is None else self.seed + number)
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            while time.monotonic() < stop_at:
+                kind = rng.choices(self.kinds, self.weights)[0]
+                path = rng.choice(self.targets[kind])
+                started = time.monotonic()
+                try:
+                    status = self.request(conn, path)
+                    error = status not in EXPECTED_STATUS.get(kind, (200,))
+                except (OSError, http.client.HTTPException):
+                    # 연결이 끊기면 다시 연결. worker 재시작(max_requests) 에도 끊김
+                    conn.close()
+                    conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                    (status, error) = ("error", True)
+                if started >= measure_from:
+                    self.record(kind, time.monotonic() - started, status, error)
+        finally:
+            conn.close()
+
+    def run(self):
+        started = time.monotonic()
+        measure_from = started + self.warmup
+        stop_at = measure_from + self.duration
+        threads = [threading.Thread(target=self.run_client, args=(number, measure_from, stop_at), daemon=True)
+                   for number in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.get_report()
+
+    def get_report(self):
+        def percentile(values, p):
+            return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 1)
+
+        endpoints = {}
+        for (kind, latencies) in self.latencies.items():
+            latencies = sorted(latencies)
+            endpoints[kind] = {
+                "requests": len(latencies),
+                "rps": round(len(latencies) / self.duration, 1),
+                "error_rate": round(self.errors[kind] / len(latencies), 4),
+                "p50_ms": percentile(latencies, 0.5),
+                "p90_ms": percentile(latencies, 0.9),
+                "p99_ms": percentile(latencies, 0.99),
+                "max_ms": round(latencies[-1] * 1000, 1),
+                "statuses": {str(status): count for (status, count) in self.statuses[kind].items()},
+            }
+        requests = sum(endpoint["requests"] for endpoint in endpoints.values())
+        errors = sum(self.errors.values())
+        return {
+            "concurrency": self.concurrency,
+            "duration": self.duration,
+            "requests": requests,
+            "rps": round(requests / self.duration, 1),
+            "error_rate": round(errors / requests, 4) if requests else None,
+            "endpoints": endpoints,
+        }
+
+
+def check_thresholds(report, thresholds):
+    """
+    기준을 넘은 항목들
+    {"min_rps": 전체 처리량, "max_error_rate": 에러율, "p99_ms": {종류: 최대 p99}}
+    """
+    failures = []
+    if report["rps"] < thresholds.get("min_rps", 0):
+        failures.append("rps %s < %s" % (report["rps"], thresholds["min_rps"]))
+    max_error_rate = thresholds.get("max_error_rate")
+    for (kind, endpoint) in report["endpoints"].items():
+        if max_error_rate is not None and endpoint["error_rate"] > max_error_rate:
+            failures.append("%s error_rate %s > %s" % (kind, endpoint["error_rate"], max_error_rate))
+        max_p99 = thresholds.get("p99_ms", {}).get(kind)
+        if max_p99 is not None and endpoint["p99_ms"] > max_p99:
+            failures.append("%s p99 %sms > %sms" % (kind, endpoint["p99_ms"], max_p99))
+    return failures
+
+
+def check_baseline(report, baseline, tolerance):
+    """이전 결과(--save) 보다 처리량이 tolerance 넘게 줄었거나 p99 가 tolerance 넘게 늘어난 항목들"""
+    failures = []
+    if report["rps"] < baseline["rps"] * (1 - tolerance):
+        failures.append("rps %s < baseline %s" % (report["rps"], baseline["rps"]))
+    for (kind, endpoint) in report["endpoints"].items():
+        before = baseline["endpoints"].get(kind)
+        if before is not None and endpoint["p99_ms"] > before["p99_ms"] * (1 + tolerance):
+            failures.append("%s p99 %sms > baseline %sms" % (kind, endpoint["p99_ms"], before["p99_ms"]))
+    return failures
+
+
+def print_report(report):
+    print("%d requests in %ds = %s rps, error rate %s (concurrency %d)" % (
+        report["requests"], report["duration"], report["rps"], report["error_rate"], report["concurrency"]))
+    print("%-10s %8s %8s %8s %8s %8s %8s %8s" % ("endpoint", "requests", "rps", "errors", "p50", "p90", "p99", "max"))
+    for (kind, endpoint) in sorted(report["endpoints"].items()):
+        print("%-10s %8d %8s %8s %8s %8s %8s %8s" % (
+            kind, endpoint["requests"], endpoint["rps"], endpoint["error_rate"],
+            endpoint["p50_ms"], endpoint["p90_ms"], endpoint["p99_ms"], endpoint["max_ms"]))
+
+
+def run(args):
+    server = None
+    if args.url:
+        parsed = urllib.parse.urlparse(args.url)
+        (host, port) = (parsed.hostname, parsed.port or 80)
+    else:
+        (host, port) = ("127.0.0.1", args.port)
+        log_path = os.path.join(tempfile.gettempdir(), "garden6_load_test_server.log")
+        server = start_server(port, args.workers, log_path)
+
+    try:
+        if not wait_ready(host, port, args.ready_timeout):
+            print("server is not ready after %ds%s" % (args.ready_timeout, "" if args.url else ", see " + log_path))
+            sys.exit(2)
+
+        mix = parse_mix(args.mix)
+        targets = build_targets(host, port)
+        unknown = set(mix) - set(targets)
+        if unknown:
+            print("unknown request kinds: %s (%s)" % (", ".join(sorted(unknown)), ", ".join(targets)))
+            sys.exit(2)
+
+        runner = LoadRunner(host, port, targets, mix, args.concurrency, args.duration, args.warmup, seed=args.seed)
+        report = runner.run()
+        report["mix"] = mix
+        report["workers"] = None if args.url else args.workers
+        # 요청을 받은 worker 하나의 지표 (합쳐진 요청 수 등)
+        report["metrics"] = get_json(host, port, "/attendance/api/metrics")
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(report, file, indent=2)
+
+    failures = []
+    if args.thresholds:
+        with open(args.thresholds) as file:
+            failures += check_thresholds(report, json.load(file))
+    if args.baseline:
+        with open(args.baseline) as file:
+            failures += check_baseline(report, json.load(file), args.tolerance)
+    for failure in failures:
+        print("FAIL %s" % failure)
+    if failures:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="출석부 HTTP 부하 테스트")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = subparsers.add_parser("seed", help="로컬 DB 에 덤프 저장")
+    seed_parser.add_argument("--create-schema", action="store_true", help="테이블 생성 SQL 부터 실행. 빈 DB 일 때")
+    seed_parser.add_argument("--dump", help="mongodump slack_messages.bson. 기본은 2021-01-18 시즌 덤프")
+    seed_parser.add_argument("--batch-size", type=int, default=500)
+    seed_parser.add_argument("--allow-remote", action="store_true", help="HOST 가 localhost 가 아니어도 실행")
+
+    run_parser = subparsers.add_parser("run", help="서버를 띄우고 부하")
+    run_parser.add_argument("--url", help="이미 떠 있는 서버. 없으면 gunicorn 을 띄움")
+    run_parser.add_argument("--port", type=int, default=8765)
+    run_parser.add_argument("--workers", type=int, default=2, help="WEB_CONCURRENCY")
+    run_parser.add_argument("--ready-timeout", type=int, default=60)
+    run_parser.add_argument("--mix", default="dashboard", help="%s 또는 gets=60,user=40" % ", ".join(MIXES))
+    run_parser.add_argument("--concurrency", type=int, default=20, help="동시 요청 수")
+    run_parser.add_argument("--duration", type=int, default=30, help="측정 시간(초)")
+    run_parser.add_argument("--warmup", type=int, default=5, help="측정 전에 버리는 시간(초)")
+    run_parser.add_argument("--seed", type=int, help="요청 순서 random seed")
+    run_parser.add_argument("--thresholds", default=THRESHOLDS_PATH, help="기준 파일. 빈 값이면 확인하지 않음")
+    run_parser.add_argument("--baseline", help="이전 --save 결과와 비교")
+    run_parser.add_argument("--tolerance", type=float, default=0.2, help="baseline 대비 허용 비율")
+    run_parser.add_argument("--save", help="결과를 json 으로 저장")
+    run_parser.add_argument("--json", action="store_true")
+
+    args = parser.parse_args()
+    if args.command == "seed":
+        seed(args)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+prepared statement 효과 측정 (attendance/statements.py)
+
+자주 실행하는 조회 쿼리들을 같은 파라미터로 그냥 실행(plain)했을 때와 PREPARE 후 EXECUTE(prepared) 했을 때를 비교합니다.
+쿼리, 모드마다 두 단계로 나눠서 잽니다. 결과는 benchmarks/prepared_statements.md 로 씁니다.
+
+1. 응답 시간: 그대로 runs 번 실행하고 클라이언트에서 잰 시간의 p50, p99
+2. EXPLAIN (ANALYZE): 다시 PREPARE 한 뒤 runs 번. Planning Time, Execution Time 평균
+
+EXPLAIN ANALYZE 도 prepared statement 를 실행하는 것이라 Postgres 의 실행 횟수(custom -> generic plan 전환)에 들어가므로
+응답 시간을 재는 실행 사이에 섞지 않고, 단계마다 새로 PREPARE 해서 같은 횟수부터 시작합니다.
+
+config.ini 의 [POSTGRES] 로 연결합니다. benchmarks/load_test.py seed 로 덤프를 넣은 로컬 DB 에서 돌립니다.
+upsert_slack_messages 는 쓰기라서 여기서는 빼고 benchmarks/replay_ingest.py --db postgres 로 봅니다.
+
+e.g.)
+PYTHONPATH=. python benchmarks/prepared_statements.py --runs 200
+PYTHONPATH=. python benchmarks/prepared_statements.py --runs 50 --output -
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from attendance.attendance_day import to_ts_for_db_range  # noqa: E402
+from attendance.config_tools import ConfigTools  # noqa: E402
+from attendance.db_tools import DBTools  # noqa: E402
+from attendance.statements import get_statement  # noqa: E402
+
+
+def get_sample_params(db_tools):
+    """statement 이름 -> 파라미터. 시즌에서 하루 커밋이 가장 많은 (유저, 날짜) 로"""
+    config_tools = ConfigTools()
+    start_date = config_tools.get_start_date()
+    # Garden.season_range 와 같은 범위
+    season_range = to_ts_for_db_range(start_date, start_date + timedelta(days=int(config_tools.get_gardening_days()) - 1))
+
+    row = db_tools.execute_query(
+        """
+        SELECT author_name, attendance_day, COUNT(*) AS commits
+        FROM slack_messages
+        WHERE attendance_day IS NOT NULL AND ts_for_db >= %s AND ts_for_db < %s
+        GROUP BY author_name, attendance_day
+        ORDER BY commits DESC
+        LIMIT 1
+        """,
+        season_range, fetch_one=True
+    )
+    if row is None:
+        raise SystemExit("no messages in the season. run benchmarks/load_test.py seed first")
+
+    messages = db_tools.execute_query(
+        "SELECT ts, ts_for_db FROM slack_messages WHERE ts_for_db >= %s AND ts_for_db < %s ORDER BY ts LIMIT 100",
+        season_range
+    )
+    day = row["attendance_day"]
+    return {
+        "author_history": (row["author_name"], *season_range, date.min, 0),
+        "first_commits": (list(config_tools.users), *season_range, day, day),
+        "attended": ([row["author_name"]], [day], *to_ts_for_db_range(day, day)),
+        "content_hashes": ([message["ts"] for message in messages],
+                           min(message["ts_for_db"] for message in messages),
+                           max(message["ts_for_db"] for message in messages)),
+    }
+
+
+def explain(cursor, sql, params):
+    cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+    plan = cursor.fetchone()["QUERY PLAN"]
+    plan = plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+    return plan["Planning Time"], plan["Execution Time"]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+@contextmanager
+def statement_cursor(db_tools, statement, prepared):
+    """prepared 면 새로 PREPARE 한 cursor. 나갈 때 DEALLOCATE"""
+    with db_tools.pooled_cursor() as (conn, cursor):
+        if prepared:
+            cursor.execute("DEALLOCATE ALL")
+            cursor.execute(statement.prepare_sql)
+        try:
+            yield cursor
+        finally:
+            if prepared:
+                cursor.execute("DEALLOCATE ALL")
+            # DEALLOCATE 했으므로 풀 연결의 PREPARE 기록도 지움
+            conn.prepared.clear()
+
+
+def measure(db_tools, name, params, runs, prepared):
+    """{planning_ms 평균, execution_ms 평균, 응답 p50_ms, p99_ms}"""
+    statement = get_statement(name)
+    sql = statement.execute_sql if prepared else statement.plain_sql
+
+    # 1. 응답 시간. EXPLAIN 없이 실행만
+    latencies = []
+    with statement_cursor(db_tools, statement, prepared) as cursor:
+        for _ in range(runs):
+            started = time.perf_counter()
+            cursor.execute(sql, params)
+            cursor.fetchall()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    # 2. EXPLAIN (ANALYZE). 1 과 같은 실행 횟수부터 시작하도록 다시 PREPARE
+    planning = []
+    execution = []
+    with statement_cursor(db_tools, statement, prepared) as cursor:
+        for _ in range(runs):
+            (planning_ms, execution_ms) = explain(cursor, sql, params)
+            planning.append(planning_ms)
+            execution.append(execution_ms)
+
+    return {
+        "planning_ms": round(statistics.mean(planning), 3),
+        "execution_ms": round(statistics.mean(execution), 3),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+    }
+
+
+def to_markdown(results, runs, server_version, message_count):
+    lines = [
+        "# prepared statement",
+        "",
+        "`python benchmarks/prepared_statements.py --runs %d` 결과. 쿼리, 모드마다 %d번씩 실행했습니다." % (runs, runs),
+        "",
+        "* Python %s, %s" % (platform.python_version(), platform.platform()),
+        "* PostgreSQL %s, 같은 호스트 (TCP 127.0.0.1). `benchmarks/load_test.py seed` 로 넣은 메시지 %d건" % (
+            server_version, message_count),
+        "* p50, p99: EXPLAIN 없이 실행만 했을 때 클라이언트에서 잰 응답 시간 (fetch 포함)",
+        "* planning, execution: 따로 다시 PREPARE 하고 `EXPLAIN (ANALYZE)` 로 실행했을 때의 평균",
+        "",
+        "| statement | mode | p50 (ms) | p99 (ms) | planning (ms) | execution (ms) |",
+        "|---|---|---|---|---|---|",
+    ]
+    for result in results:
+        lines.append("| %(statement)s | %(mode)s | %(p50_ms).3f | %(p99_ms).3f | %(planning_ms).3f | %(execution_ms).3f |"
+                     % result)
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="prepared statement 효과 측정")
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--output", default=os.path.join(BASE_DIR, "benchmarks", "prepared_statements.md"),
+                        help="- 이면 stdout")
+    parser.add_argument("--json", action="store_true", help="markdown 대신 JSON 을 stdout 으로")
+    args = parser.parse_args()
+
+    db_tools = DBTools()
+    samples = get_sample_params(db_tools)
+
+    results = []
+    for (name, params) in samples.items():
+        for prepared in (False, True):
+            result = measure(db_tools, name, params, args.runs, prepared)
+            results.append(dict(result, statement=name, mode="prepared" if prepared else "plain"))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    server_version = db_tools.execute_query("SELECT current_setting('server_version') AS version",
+                                            fetch_one=True)["version"]
+    message_count = db_tools.execute_query("SELECT COUNT(*) AS count FROM slack_messages", fetch_one=True)["count"]
+    report = to_markdown(results, args.runs, server_version, message_count)
+    if args.output == "-":
+        print(report, end="")
+    else:
+        with open(args.output, "w") as file:
+            file.write(report)
+        print("wrote %s" % args.output)
+
+
+if __name__ == "__main__":
+    main()
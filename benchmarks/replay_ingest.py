@@ -0,0 +1,294 @@
+"""
+수집 경로 처리량 측정 (replay)
+
+archive/migration/20250803_mongodb_dump/slack_messages.bson 의 메시지들을 가짜 slack client 로 흘려서
+실제 수집 코드(Garden.collect_slack_messages -> IngestQueue -> IngestWriter -> Garden.save_slack_messages -> DBTools)를
+그대로 실행하고 초당 메시지 수, batch 저장 시간 p50/p99, DB round trip 수를 출력합니다.
+
+* --db postgres: config.ini 의 [POSTGRES] 로 연결. 운영 DB 대신 --schema 로 로컬 Postgres 의 빈 스키마를 씁니다.
+* --db stand-in: Postgres 없이 메모리에서 흉내. SQL 은 실행하지 않고 round trip 마다 --latency-ms 만큼 기다립니다.
+  Python 쪽 처리 시간과 round trip 수를 볼 때 씁니다.
+
+config.ini, users.yaml 이 있어야 합니다. (START_DATE, TIME_ZONE 으로 출석일 계산)
+
+e.g.)
+PYTHONPATH=. python benchmarks/replay_ingest.py --db stand-in --latency-ms 5
+PYTHONPATH=. python benchmarks/replay_ingest.py --db postgres --schema garden6_bench --rate 200 --passes 2
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "garden6.settings")
+
+from attendance.bson_reader import iter_bson_file  # noqa: E402
+from attendance.db_tools import DBTools  # noqa: E402
+from attendance.garden import Garden  # noqa: E402
+from attendance.ingest_queue import IngestQueue  # noqa: E402
+from attendance.ingest_writer import IngestWriter  # noqa: E402
+
+DUMP_PATH = os.path.join(BASE_DIR, "archive", "migration", "20250803_mongodb_dump", "slack_messages.bson")
+
+
+def load_messages(path):
+    """덤프의 slack 메시지들. ts 순서. mongo 에서 붙인 _id, ts_for_db 는 빼고 slack 응답 그대로"""
+    messages = []
+    for document in iter_bson_file(path):
+        document.pop("_id", None)
+        document.pop("ts_for_db", None)
+        messages.append(document)
+    messages.sort(key=lambda message: float(message["ts"]))
+    return messages
+
+
+class FakeSlackClient:
+    """conversations_history 만 흉내. oldest <= ts <= latest 인 메시지를 최신순으로"""
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.calls = 0
+
+    def conversations_history(self, channel, latest, oldest, count=100):
+        self.calls += 1
+        (oldest, latest) = (float(oldest), float(latest))
+        window = [dict(message) for message in self.messages if oldest <= float(message["ts"]) <= latest]
+        return {"ok": True, "messages": list(reversed(window))}
+
+
+class FakeSlackTools:
+    def __init__(self, client):
+        self.client = client
+
+    def get_slack_client(self):
+        return self.client
+
+    def get_channel_id(self):
+        return "C_REPLAY"
+
+
+class CountingCursor:
+    """cursor.execute 마다 round trip 하나"""
+
+    def __init__(self, cursor, counter):
+        self.cursor = cursor
+        self.counter = counter
+
+    def execute(self, query, params=None):
+        self.counter.round_trips += 1
+        return self.cursor.execute(query, params)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+class CountingDBTools(DBTools):
+    """실제 Postgres. execute, commit 을 round trip 으로 셈"""
+
+    def __init__(self, schema=None):
+        super().__init__()
+        if schema:
+            self.pg_schema = schema
+        self.round_trips = 0
+
+    @contextmanager
+    def pooled_cursor(self):
+        with super().pooled_cursor() as (conn, cursor):
+            yield conn, CountingCursor(cursor, self)
+        self.round_trips += 1  # commit
+
+
+class StandInCursor:
+    """저장 transaction 안에서 실행하는 쿼리(repo_daily_commits). execute 마다 round trip 하나"""
+
+    def __init__(self, db_tools):
+        self.db_tools = db_tools
+
+    def execute(self, query, params=None):
+        self.db_tools.round_trip()
+
+
+class StandInDBTools(DBTools):
+    """
+    Postgres 없이 수집 경로에서 쓰는 쿼리만 메모리에서 흉내
+    SQL 을 해석하지 않고 prepared statement 이름(attendance/statements.py)으로 구분합니다. 수집 경로 쿼리가 바뀌면 같이 고쳐야 함
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.round_trips = 0
+        self.rows = {}  # ts -> {content_hash, attachments, attendance_day, author_name}
+        self.json_blobs = {}
+
+    def round_trip(self, count=1):
+        self.round_trips += count
+        if self.latency:
+            time.sleep(self.latency * count)
+
+    def execute_query(self, query, params=None, fetch_one=False, fetch_all=True):
+        # pg_notify
+        self.round_trip()
+        return None if fetch_one or not fetch_all else []
+
+    def execute_values(self, query, rows, template=None, page_size=100, fetch=False):
+        # json_blobs. page 마다 하나 + commit
+        rows = list(rows)
+        self.round_trip(max(1, -(-len(rows) // page_size)) + 1)
+        return []
+
+    def execute_prepared(self, name, params, fetch_one=False, fetch_all=True):
+        self.round_trip()
+        if name == "content_hashes":
+            return [dict(self.rows[ts], ts=ts) for ts in params[0] if ts in self.rows]
+        if name == "attended":
+            (author_names, days) = (set(params[0]), set(params[1]))
+            return [{"author_name": row["author_name"], "attendance_day": row["attendance_day"]}
+                    for row in self.rows.values()
+                    if row["author_name"] in author_names and row["attendance_day"] in days]
+        raise ValueError("stand-in does not support %s" % name)
+
+    def execute_prepared_many(self, name, params_list, lock=None, after=None):
+        # upsert_slack_messages. page 마다 하나 + commit
+        self.round_trip(len(params_list) + 1)
+        result = []
+        for columns in params_list:
+            for row in zip(*columns):
+                (ts, attendance_day, attachments, content_hash) = (row[0], row[2], row[9], row[11])
+                existing = self.rows.get(ts)
+                if existing is not None and existing["content_hash"] == content_hash:
+                    continue
+                attachments = json.loads(attachments) if attachments else None
+                # 출석일은 처음 값 그대로. 고쳐서 커밋이 없어졌으면 None (statements.py upsert_slack_messages)
+                if existing is not None and existing["attendance_day"] is not None and attendance_day is not None:
+                    attendance_day = existing["attendance_day"]
+                self.rows[ts] = {
+                    "content_hash": content_hash,
+                    "attachments": attachments,
+                    "attendance_day": attendance_day,
+                    "author_name": attachments[0].get("author_name") if attachments else None,
+                }
+                result.append({"ts": ts, "inserted": existing is None})
+        if after is not None:
+            after(StandInCursor(self), result)
+        return result
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def replay(garden, writer, messages, window, rate):
+    """
+    window 개씩 slack 에서 가져와서 큐에 넣고 저장. rate(초당 메시지 수) 가 있으면 그 속도로 흘려 보냄
+    @return (batch 저장 시간들, 수집 시간들, 경과 시간)
+    """
+    batch_latencies = []
+    collect_latencies = []
+    started = time.monotonic()
+
+    for offset in range(0, len(messages), window):
+        chunk = messages[offset:offset + window]
+        if rate:
+            wait = started + offset / rate - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+        collect_started = time.monotonic()
+        garden.collect_slack_messages(float(chunk[0]["ts"]), float(chunk[-1]["ts"]))
+        collect_latencies.append(time.monotonic() - collect_started)
+
+        while True:
+            batch_started = time.monotonic()
+            if writer.drain_once() == 0:
+                break
+            batch_latencies.append(time.monotonic() - batch_started)
+
+    return batch_latencies, collect_latencies, time.monotonic() - started
+
+
+def to_ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="수집 경로 처리량 측정")
+    parser.add_argument("--dump", default=DUMP_PATH)
+    parser.add_argument("--db", choices=["stand-in", "postgres"], default="stand-in")
+    parser.add_argument("--schema", help="--db postgres 일 때 쓸 스키마. 기본은 config.ini 의 SCHEMA")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="--db stand-in 의 round trip 지연")
+    parser.add_argument("--rate", type=float, default=0.0, help="초당 메시지 수. 0 이면 최대 속도")
+    parser.add_argument("--window", type=int, default=100, help="conversations.history 한번에 가져오는 메시지 수")
+    parser.add_argument("--batch-size", type=int, default=500, help="IngestWriter max_batch_size")
+    parser.add_argument("--limit", type=int, default=0, help="앞에서 부터 이만큼만. 0 이면 전체")
+    parser.add_argument("--passes", type=int, default=1, help="같은 메시지를 여러번 흘림. 2번째 부터는 바뀐 메시지가 없음")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    messages = load_messages(args.dump)
+    if args.limit:
+        messages = messages[:args.limit]
+
+    if args.db == "postgres":
+        db_tools = CountingDBTools(args.schema)
+    else:
+        db_tools = StandInDBTools(args.latency_ms / 1000)
+
+    slack_client = FakeSlackClient(messages)
+    garden = Garden()
+    garden.db_tools = db_tools
+    garden.slack_tools = FakeSlackTools(slack_client)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        # 운영 큐 파일과 섞이지 않도록 임시 큐
+        garden.ingest_queue = IngestQueue(os.path.join(directory, "replay_queue.sqlite3"))
+        writer = IngestWriter(garden.ingest_queue, garden, max_batch_size=args.batch_size)
+
+        for number in range(1, args.passes + 1):
+            round_trips = db_tools.round_trips
+            (batch_latencies, collect_latencies, elapsed) = replay(garden, writer, messages, args.window, args.rate)
+            round_trips = db_tools.round_trips - round_trips
+            results.append({
+                "pass": number,
+                "messages": len(messages),
+                "elapsed_seconds": round(elapsed, 3),
+                "messages_per_second": round(len(messages) / elapsed, 1) if elapsed else None,
+                "batches": len(batch_latencies),
+                "batch_p50_ms": to_ms(percentile(batch_latencies, 0.5)),
+                "batch_p99_ms": to_ms(percentile(batch_latencies, 0.99)),
+                "collect_p50_ms": to_ms(percentile(collect_latencies, 0.5)),
+                "db_round_trips": round_trips,
+                "round_trips_per_batch": round(round_trips / len(batch_latencies), 1) if batch_latencies else None,
+            })
+
+    report = {
+        "db": args.db,
+        "latency_ms": args.latency_ms if args.db == "stand-in" else None,
+        "rate": args.rate or None,
+        "window": args.window,
+        "batch_size": args.batch_size,
+        "slack_calls": slack_client.calls,
+        "passes": results,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print("db=%s latency_ms=%s rate=%s window=%d batch_size=%d slack_calls=%d" % (
+        report["db"], report["latency_ms"], report["rate"], args.window, args.batch_size, slack_client.calls))
+    for result in results:
+        print("pass %(pass)d: %(messages)d messages in %(elapsed_seconds)ss = %(messages_per_second)s msg/s, "
+              "%(batches)d batches p50 %(batch_p50_ms)s ms p99 %(batch_p99_ms)s ms, "
+              "%(db_round_trips)d round trips (%(round_trips_per_batch)s/batch)" % result)
+
+
+if __name__ == "__main__":
+    main()
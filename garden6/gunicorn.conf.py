@@ -0,0 +1,51 @@
+"""
+gunicorn 설정 (docs/05.serving.md)
+
+gunicorn -c garden6/gunicorn.conf.py garden6.asgi:application
+
+SSE(/attendance/events/) 때문에 ASGI(uvicorn worker) 로 실행합니다.
+master 에서 Django 앱, config.ini, users.yaml 을 읽어 두고(preload) worker 들이 fork 해서 물려받습니다.
+DB 연결, 출석 인덱스는 fork 후 worker 마다 만들고, 준비가 끝난 다음 요청을 받습니다.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+# SSE 연결이 있어서 graceful 종료는 keepalive 주기(15초) 보다 길게
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = 30
+keepalive = 5
+
+# 메모리가 조금씩 늘어나는 것을 대비해서 worker 를 돌아가며 재시작
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 5000))
+max_requests_jitter = 500
+
+accesslog = "-"
+errorlog = "-"
+
+
+def when_ready(server):
+    # preload 된 master 에서 설정 파일을 읽어 둠. 실패하면 worker 에서 다시 읽음
+    from attendance.config_tools import ConfigTools
+    try:
+        ConfigTools()
+    except Exception as err:
+        print(err)
+
+
+def post_worker_init(worker):
+    # 요청을 받기 전에 연결 풀, 출석 인덱스 준비. DB 가 안되면 백그라운드에서 재시도하고 /readyz 는 503
+    from attendance import warmup
+    if not warmup.warm_up():
+        warmup.start_warm_up()
+
+    # [SCHEDULER] ENABLED 이면 예약 작업 시작. worker 마다 돌지만 advisory lock 으로 한 곳에서만 실행됨
+    from attendance import scheduler
+    try:
+        scheduler.start_scheduler()
+    except Exception as err:
+        print(err)
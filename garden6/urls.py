@@ -1,11 +1,14 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.views.generic import RedirectView
+from attendance import views as attendance_views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('attendance/', include('attendance.urls')),
     path('common/', include('common.urls')),
     path('tools/', include('tools.urls')),
+    path('healthz', attendance_views.healthz, name='healthz'), # liveness
+    path('readyz', attendance_views.readyz, name='readyz'), # readiness
     path('', RedirectView.as_view(url="/attendance/")),
 ]
@@ -0,0 +1,168 @@
+"""
+staff 전용 요청 프로파일
+
+로그인한 staff 가 아무 페이지에 ?_profile=1 을 붙여서 요청하면 그 요청 하나만 프로파일하고
+결과를 PROFILE_DIR 에 저장합니다. /tools/profiles/ 에서 봅니다.
+응답의 X-Profile-Url 헤더에 결과 주소가 있습니다.
+
+config.ini
+[DEFAULT]
+PROFILE_DIR = /var/lib/garden6/profiles
+PROFILE_KEEP = 100
+"""
+import configparser
+import json
+import os
+import re
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from attendance import profiling
+
+PROFILE_PARAM = "_profile"
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]{14}-[0-9a-f]{8}$")
+
+
+class ProfileStore:
+    """프로파일 결과 json 파일들. 최근 keep 개만 남김"""
+
+    def __init__(self, directory, keep=100):
+        self.directory = directory
+        self.keep = keep
+
+    def get_path(self, profile_id):
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            raise ValueError("invalid profile id: %s" % profile_id)
+        return os.path.join(self.directory, profile_id + ".json")
+
+    def save(self, data):
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = "%s-%s" % (time.strftime("%Y%m%d%H%M%S", time.localtime(data["started_at"])), uuid.uuid4().hex[:8])
+        path = self.get_path(profile_id)
+        with open(path + ".tmp", "w") as file:
+            json.dump(dict(data, id=profile_id), file)
+        os.replace(path + ".tmp", path)
+        self.prune()
+        return profile_id
+
+    def get_ids(self):
+        """최근 것 부터"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = [name[:-len(".json")] for name in os.listdir(self.directory) if name.endswith(".json")]
+        return sorted((name for name in names if PROFILE_ID_PATTERN.match(name)), reverse=True)
+
+    def prune(self):
+        for profile_id in self.get_ids()[self.keep:]:
+            try:
+                os.remove(self.get_path(profile_id))
+            except FileNotFoundError:
+                pass
+
+    def load(self, profile_id):
+        """없으면 None. id 형식이 아니면 ValueError"""
+        path = self.get_path(profile_id)
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except (ValueError, FileNotFoundError):
+            return None
+
+    def find_profiles(self):
+        """목록용. SQL, cProfile 결과는 뺌"""
+        profiles = []
+        for profile_id in self.get_ids():
+            data = self.load(profile_id)
+            if data is not None:
+                profiles.append({key: data.get(key) for key in
+                                 ("id", "method", "path", "started_at", "ms", "status", "sql_count", "sql_ms", "user")})
+        return profiles
+
+
+def get_profile_store():
+    config = configparser.ConfigParser()
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    config.read(os.path.join(BASE_DIR, 'attendance', 'config.ini'))
+    directory = config['DEFAULT'].get('PROFILE_DIR', os.path.join(BASE_DIR, 'tools', 'profiles'))
+    return ProfileStore(directory, int(config['DEFAULT'].get('PROFILE_KEEP', 100)))
+
+
+def is_staff(request):
+    user = getattr(request, "user", None)
+    return user is not None and user.is_authenticated and user.is_staff
+
+
+class ProfilerMiddleware:
+    """
+    ?_profile=1 인 staff 요청만 프로파일. AuthenticationMiddleware 다음에 둠
+    sync view 는 view 를 실행하는 스레드에서 cProfile 하고,
+    async view 는 offload 로 넘긴 작업만 cProfile 함 (event loop 에서는 다른 요청도 같이 돌고 있어서)
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.store = None
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def get_store(self):
+        if self.store is None:
+            self.store = get_profile_store()
+        return self.store
+
+    def is_requested(self, request):
+        return request.GET.get(PROFILE_PARAM) == "1"
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.is_requested(request) or not is_staff(request):
+            return self.get_response(request)
+
+        profile = self.start(request)
+        token = profiling.activate(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            profiling.deactivate(token)
+        return self.finish(request, profile, response)
+
+    async def __acall__(self, request):
+        # request.user 는 session 을 DB 에서 읽으므로 스레드에서 확인
+        if not self.is_requested(request) or not await sync_to_async(is_staff)(request):
+            return await self.get_response(request)
+
+        profile = self.start(request)
+        token = profiling.activate(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiling.deactivate(token)
+        return await sync_to_async(self.finish)(request, profile, response)
+
+    def start(self, request):
+        profile = profiling.RequestProfile(request.method, request.get_full_path())
+        request.profile = profile
+        return profile
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(request, "profile", None)
+        if profile is None or iscoroutinefunction(view_func):
+            return None
+        return profile.run(view_func, request, *view_args, **view_kwargs)
+
+    def finish(self, request, profile, response):
+        profile.finish(response.status_code)
+        data = profile.to_dict()
+        data["user"] = request.user.get_username()
+        try:
+            profile_id = self.get_store().save(data)
+        except OSError as err:
+            print(err)
+            return response
+        response["X-Profile-Url"] = "/tools/profiles/%s/" % profile_id
+        return response
@@ -1,3 +1,69 @@
-from django.test import TestCase
+import json
+import tempfile
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from attendance import profiling
+from tools.profiler import ProfileStore, ProfilerMiddleware
+
+
+class StaffUser:
+    is_authenticated = True
+    is_staff = True
+
+    def get_username(self):
+        return "junho85"
+
+
+class ProfilerMiddlewareTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ProfileStore(self.directory.name, keep=2)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_middleware(self):
+        def view(request):
+            @profiling.profiled("DBTools.execute_query")
+            def query():
+                return 1
+            query()
+            return HttpResponse("ok")
+
+        middleware = ProfilerMiddleware(lambda request: middleware.process_view(request, view, (), {}) or view(request))
+        middleware.store = self.store
+        return middleware
+
+    def request(self, path, user):
+        request = RequestFactory().get(path)
+        request.user = user
+        return self.get_middleware()(request)
+
+    def test_profile_staff_request(self):
+        response = self.request("/attendance/api/gets?_profile=1", StaffUser())
+
+        (profile_id,) = self.store.get_ids()
+        self.assertEqual("/tools/profiles/%s/" % profile_id, response["X-Profile-Url"])
+        data = self.store.load(profile_id)
+        self.assertEqual("junho85", data["user"])
+        self.assertEqual(200, data["status"])
+        self.assertEqual([{"name": "DBTools.execute_query", "count": 1, "ms": data["calls"][0]["ms"]}], data["calls"])
+        self.assertIn("query", data["stats"])
+        json.dumps(self.store.find_profiles())
+
+    def test_skip_others(self):
+        response = self.request("/attendance/api/gets?_profile=1", AnonymousUser())
+        self.assertNotIn("X-Profile-Url", response)
+        response = self.request("/attendance/api/gets", StaffUser())
+        self.assertNotIn("X-Profile-Url", response)
+        self.assertEqual([], self.store.get_ids())
+
+    def test_keep_recent(self):
+        for _ in range(3):
+            self.request("/attendance/api/gets?_profile=1", StaffUser())
+        self.assertEqual(2, len(self.store.get_ids()))
+        with self.assertRaises(ValueError):
+            self.store.load("../../config")
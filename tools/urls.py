@@ -5,4 +5,6 @@ app_name = 'tools'
 
 urlpatterns = [
     path('', views.index, name='index'), # 관리툴 첫화면
-]
\ No newline at end of file
+    path('profiles/', views.profiles, name='profiles'), # 요청 프로파일 목록
+    path('profiles/<profile_id>/', views.profile, name='profile'), # 요청 프로파일 결과
+]
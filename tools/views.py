@@ -1,5 +1,8 @@
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.http import Http404
 from django.shortcuts import render
-from django.contrib.auth.decorators import login_required
+
+from .profiler import get_profile_store
 
 
 @login_required
@@ -7,3 +10,24 @@ def index(request):
     context = {
     }
     return render(request, 'tools/index.html', context)
+
+
+# 요청 프로파일 목록. ?_profile=1 로 요청한 결과들 (tools/profiler.py)
+@user_passes_test(lambda user: user.is_staff)
+def profiles(request):
+    context = {
+        "profiles": get_profile_store().find_profiles(),
+    }
+    return render(request, 'tools/profiles.html', context)
+
+
+# 요청 프로파일 하나. SQL, DBTools 호출 시간, cProfile 결과
+@user_passes_test(lambda user: user.is_staff)
+def profile(request, profile_id):
+    try:
+        data = get_profile_store().load(profile_id)
+    except ValueError:
+        data = None
+    if data is None:
+        raise Http404("profile not found")
+    return render(request, 'tools/profile.html', {"profile": data})